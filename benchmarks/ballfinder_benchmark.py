@@ -0,0 +1,331 @@
+# USAGE
+# Time each stage of the BallFinder pipeline on the recorded court images
+# (no cameras or windows needed):
+#    python benchmarks/ballfinder_benchmark.py
+#    python benchmarks/ballfinder_benchmark.py --inputs videos/
+#
+# Only runs which complete count towards the stage timings, so every stage
+# is measured on the same workload.
+#
+# Save a baseline and later compare against it; the comparison exits with
+# status 1 if any stage got slower than the tolerance allows:
+#    python benchmarks/ballfinder_benchmark.py --save benchmarks/baseline.json
+#    python benchmarks/ballfinder_benchmark.py --compare benchmarks/baseline.json
+
+# import the necessary packages
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+# run from the repository root so the games package (and its assets) can
+# be found
+sys.path.append(os.path.abspath(os.getcwd()))
+from games.bocce.cv.ballfinder import BallFinder
+from games.bocce.cv.detectors import DETECTORS, get_detector
+from games.bocce.cv.refinement import GrabCutRefiner
+
+# the pipeline stages in the order they run; "detect" is the detector
+# backend as a whole and the stages after it are the HSV detector's (and
+# the refiner's) parts of it
+STAGES = ["slice", "detect", "mask", "morph", "refine", "contours", "filter",
+    "extract", "histogram", "cluster", "assign"]
+
+# (stage, attribute) of the BallFinder, detector and refiner methods which
+# are timed while the real BallFinder.pipeline runs
+FINDER_STAGES = [("slice", "slice_court"), ("extract", "extract_balls"),
+    ("histogram", "describe_balls"), ("cluster", "cluster_histograms"),
+    ("assign", "assign_balls")]
+DETECTOR_STAGES = [("detect", "detect"), ("mask", "mask_court"),
+    ("morph", "morph"), ("contours", "find_and_sort_ball_contours"),
+    ("filter", "filter_contours")]
+REFINER_STAGES = [("refine", "refine")]
+
+# the recorded court images; the other assets are single ball crops which
+# the pipeline can't score
+DEFAULT_INPUTS = ["exploratory_code/assets/court.png"]
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+VIDEO_EXTENSIONS = (".avi", ".mp4", ".mov", ".mkv")
+
+# stages faster than this (in ms) are too noisy to flag as regressions
+NOISE_FLOOR_MS = 0.05
+
+
+def load_inputs(paths, maxVideoFrames=30):
+    # yield (name, frame) for every image and for evenly spaced frames of
+    # every video under the given files and directories
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, dirs, names) in os.walk(path):
+                files.extend(os.path.join(root, n) for n in sorted(names))
+        else:
+            files.append(path)
+
+    for f in files:
+        ext = os.path.splitext(f)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            frame = cv2.imread(f)
+            if frame is not None:
+                yield (f, frame)
+
+        elif ext in VIDEO_EXTENSIONS:
+            cap = cv2.VideoCapture(f)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            step = max(total // maxVideoFrames, 1)
+            for i in range(0, max(total, 1), step)[:maxVideoFrames]:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+                (grabbed, frame) = cap.read()
+                if not grabbed:
+                    break
+                yield ("{}#{}".format(f, i), frame)
+            cap.release()
+
+
+class StageTimer():
+    def __init__(self, trace=False):
+        # stage -> list of durations (seconds) and peak allocations (bytes)
+        # per completed run
+        self.times = {stage: [] for stage in STAGES}
+        self.peaks = {stage: [] for stage in STAGES}
+        self.trace = trace
+
+        # the run in progress; a stage may be called more than once per run
+        self.runTimes = {}
+        self.runPeaks = {}
+
+    def wrap(self, obj, stages):
+        # time the given methods of obj by shadowing them on the instance;
+        # returns the (obj, attr) pairs to unwrap
+        wrapped = []
+        for (name, attr) in stages:
+            if hasattr(obj, attr):
+                setattr(obj, attr, self.timed(name, getattr(obj, attr)))
+                wrapped.append((obj, attr))
+        return wrapped
+
+    def timed(self, name, method):
+        def run(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return run
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace:
+            start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t = time.perf_counter()
+        yield
+        self.runTimes[name] = self.runTimes.get(name, 0) + \
+            time.perf_counter() - t
+        if self.trace:
+            peak = tracemalloc.get_traced_memory()[1] - start
+            self.runPeaks[name] = max(self.runPeaks.get(name, 0), peak)
+
+    def start_run(self):
+        self.runTimes = {}
+        self.runPeaks = {}
+
+    def end_run(self, completed=True):
+        # runs which failed part way through are dropped
+        if completed:
+            for (name, duration) in self.runTimes.items():
+                self.times[name].append(duration)
+            for (name, peak) in self.runPeaks.items():
+                self.peaks[name].append(peak)
+        self.start_run()
+
+
+def run_pipeline(finder, frame, throwsHome, throwsAway, timer):
+    # run the real BallFinder.pipeline with its stages timed; the detector
+    # and refiner may be shared between runs, so unwrap them afterwards
+    wrapped = timer.wrap(finder, FINDER_STAGES)
+    wrapped += timer.wrap(finder.detector, DETECTOR_STAGES)
+    if getattr(finder.detector, "refiner", None) is not None:
+        wrapped += timer.wrap(finder.detector.refiner, REFINER_STAGES)
+    try:
+        finder.pipeline(frame, throwsHome, throwsAway)
+    finally:
+        for (obj, attr) in wrapped:
+            delattr(obj, attr)
+
+
+def benchmark(inputs, repeats, throwsHome, throwsAway, trace=False,
+    detector=None, refiner=None):
+    timer = StageTimer(trace)
+    failures = {}
+    for (name, frame) in inputs:
+        for i in range(repeats):
+            finder = BallFinder(debug=False, detector=detector,
+                refiner=refiner)
+            timer.start_run()
+            try:
+                # the pipeline prints a lot; keep it out of the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_pipeline(finder, frame, throwsHome, throwsAway, timer)
+            except Exception as e:
+                # i.e. too few balls in the image to cluster
+                timer.end_run(completed=False)
+                failures[name] = str(e).strip().splitlines()[0]
+                break
+            timer.end_run()
+    return (timer, failures)
+
+
+def summarize(timer):
+    summary = {}
+    for stage in STAGES:
+        times = np.array(timer.times[stage]) * 1000
+        if len(times) == 0:
+            continue
+        summary[stage] = {
+            "calls": len(times),
+            "mean_ms": float(times.mean()),
+            "median_ms": float(np.median(times)),
+            "p95_ms": float(np.percentile(times, 95)),
+            "per_sec": float(1000 / times.mean()) if times.mean() > 0 else None,
+        }
+        if timer.peaks[stage]:
+            summary[stage]["peak_kb"] = float(np.max(timer.peaks[stage]) / 1024)
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    # returns the stages whose median time grew by more than the tolerance
+    regressions = []
+    for (stage, stats) in summary.items():
+        if stage not in baseline:
+            continue
+        before = baseline[stage]["median_ms"]
+        after = stats["median_ms"]
+        if after > before * (1 + tolerance) and after - before > NOISE_FLOOR_MS:
+            regressions.append((stage, before, after))
+    return regressions
+
+
+def print_summary(summary, baseline=None):
+    print("{:<10} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+        "stage", "calls", "median ms", "p95 ms", "per sec", "peak KB",
+        "baseline"))
+    for stage in STAGES:
+        if stage not in summary:
+            continue
+        s = summary[stage]
+        before = "" if baseline is None or stage not in baseline \
+            else "{:.3f}".format(baseline[stage]["median_ms"])
+        print("{:<10} {:>6} {:>10.3f} {:>10.3f} {:>10.1f} {:>10} {:>10}".format(
+            stage, s["calls"], s["median_ms"], s["p95_ms"], s["per_sec"] or 0,
+            "{:.1f}".format(s["peak_kb"]) if "peak_kb" in s else "", before))
+
+
+if __name__ == "__main__":
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--inputs", nargs="+", default=DEFAULT_INPUTS,
+        help="images, videos or directories of them to run the pipeline on")
+    ap.add_argument("-r", "--repeats", type=int, default=5,
+        help="number of timed runs per input")
+    ap.add_argument("--throws-home", type=int, default=2,
+        help="number of home team throws on the court")
+    ap.add_argument("--throws-away", type=int, default=2,
+        help="number of away team throws on the court")
+    ap.add_argument("-d", "--detector", choices=sorted(DETECTORS),
+        default="hsv", help="ball detector backend")
+    ap.add_argument("--refine", action="store_true",
+        help="refine the ball masks with GrabCut")
+    ap.add_argument("--video-frames", type=int, default=30,
+        help="maximum number of frames to sample from each video")
+    ap.add_argument("--save", help="path to save the results as a JSON baseline")
+    ap.add_argument("--compare", help="path to a JSON baseline to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25,
+        help="allowed slowdown of a stage's median time relative to the baseline")
+    args = vars(ap.parse_args())
+
+    inputs = list(load_inputs(args["inputs"], args["video_frames"]))
+    if len(inputs) == 0:
+        print("[ERROR] no images or videos found in {}".format(args["inputs"]))
+        sys.exit(2)
+    print("[INFO] benchmarking {} inputs x {} runs".format(len(inputs),
+        args["repeats"]))
+
+    # the default HSV detector is created by each BallFinder; others load
+    # their model once
+    detector = None if args["detector"] == "hsv" \
+        else get_detector(args["detector"])
+    refiner = GrabCutRefiner() if args["refine"] else None
+    options = dict(detector=detector, refiner=refiner)
+
+    # warm up (imports, OpenCV and sklearn initialization) before timing
+    benchmark(inputs, 1, args["throws_home"], args["throws_away"], **options)
+
+    # time the stages, then measure their allocations in a separate pass
+    # so that tracing doesn't skew the timings
+    (timer, failures) = benchmark(inputs, args["repeats"],
+        args["throws_home"], args["throws_away"], **options)
+    tracemalloc.start()
+    (traced, _) = benchmark(inputs, 1, args["throws_home"], args["throws_away"],
+        trace=True, **options)
+    tracemalloc.stop()
+    timer.peaks = traced.peaks
+    summary = summarize(timer)
+
+    for (name, error) in failures.items():
+        print("[WARN] pipeline failed on {}: {}".format(name, error))
+    if failures:
+        print("[WARN] the pipeline only completed on {} of {} inputs".format(
+            len(inputs) - len(failures), len(inputs)))
+
+    # the stage timings only cover the inputs the pipeline completed on
+    completed = [name for (name, frame) in inputs if name not in failures]
+    if len(completed) == 0:
+        print("[ERROR] the pipeline didn't complete on any input")
+        sys.exit(2)
+
+    baseline = None
+    if args["compare"] is not None:
+        with open(args["compare"]) as f:
+            saved = json.load(f)
+        baseline = saved["stages"]
+        if saved["inputs"] != completed:
+            print("[WARN] the baseline was measured on different inputs")
+        if saved.get("detector", "hsv") != args["detector"] \
+            or saved.get("refine", False) != args["refine"]:
+            print("[WARN] the baseline was measured with a different detector")
+    print_summary(summary, baseline)
+
+    if args["save"] is not None:
+        dirname = os.path.dirname(args["save"])
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(args["save"], "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "opencv": cv2.__version__,
+                "inputs": completed,
+                "repeats": args["repeats"],
+                "detector": args["detector"],
+                "refine": args["refine"],
+                "stages": summary,
+            }, f, indent=2)
+        print("[INFO] saved baseline to {}".format(args["save"]))
+
+    if baseline is not None:
+        regressions = compare(summary, baseline, args["tolerance"])
+        for (stage, before, after) in regressions:
+            print("[FAIL] {} got slower: {:.3f}ms -> {:.3f}ms".format(stage,
+                before, after))
+        if regressions:
+            sys.exit(1)
+        print("[INFO] no regressions (tolerance {:.0%})".format(
+            args["tolerance"]))
@@ -0,0 +1,306 @@
+# USAGE
+# Simulate N Pi clients sending frames over localhost to an ImageHub set up
+# like ImageZMQCamera's (REQ/REP, one reply per frame) and report the hub's
+# throughput, latency and drops:
+#    python benchmarks/imagezmq_load.py --clients 4 --rate 18
+#    python benchmarks/imagezmq_load.py --clients 1 2 4 8 --rate 0 --jpeg
+#
+# --hubs shared sends every client to one ImageHub (one receiving thread);
+# --hubs per-camera gives each client its own hub and thread, like one
+# ImageZMQCamera per Pi. --hubs consolidated receives every client with one
+# ImageHubReceiver and reads them through HubCameras; --mode picks its socket
+# pattern:
+#    python benchmarks/imagezmq_load.py --hubs consolidated --mode pull --jpeg
+#
+# Latency runs from just before a client encodes and sends a frame until the
+# hub (or, consolidated, the camera) has it; drops are frames a client had to
+# skip because its previous send hadn't been acknowledged in time (or,
+# consolidated, that arrived after a newer frame). "cpu" is the CPU time the
+# hub process used per second, so it can pass 100% on a multi-core machine.
+
+# import the necessary packages
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+import cv2
+import imagezmq
+import imutils
+import numpy as np
+import zmq
+
+# run from the repository root so the games package can be found
+sys.path.append(os.path.abspath(os.getcwd()))
+from games.camera.camera import HUB_MODES, HubCamera, parse_metadata
+
+# first port used by the hubs
+BASE_PORT = 5600
+
+
+def make_frames(width, height, count=8, seed=42):
+    # noisy, blurred frames compress about like a real court does; a few
+    # different ones keep the JPEG encoder honest
+    rng = np.random.RandomState(seed)
+    frames = []
+    for i in range(count):
+        frame = rng.randint(0, 255, (height // 8, width // 8, 3)).astype("uint8")
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_CUBIC)
+        frames.append(frame)
+    return frames
+
+
+def client(name, port, width, height, rate, jpeg, quality, stop, mode="reqrep"):
+    # runs in its own process like a Pi would; the message carries the
+    # same metadata header as obie_imagezmq/client.py so the hub can
+    # measure latency and count the frames we had to skip
+    if mode == "pull":
+        # PUSH doesn't wait for replies; frames past the high-water mark
+        # are dropped here rather than queued
+        context = imagezmq.SerializingContext()
+        sender = context.socket(zmq.PUSH)
+        sender.setsockopt(zmq.SNDHWM, 2)
+        sender.setsockopt(zmq.LINGER, 0)
+        sender.connect("tcp://localhost:{}".format(port))
+    elif mode == "sub":
+        sender = imagezmq.ImageSender(connect_to="tcp://*:{}".format(port),
+            REQ_REP=False)
+    else:
+        sender = imagezmq.ImageSender(
+            connect_to="tcp://localhost:{}".format(port))
+    frames = make_frames(width, height)
+    interval = 1.0 / rate if rate > 0 else 0
+    start = time.time()
+    seq = 0
+    while not stop.is_set():
+        if interval > 0:
+            # a camera doesn't wait for us; skip the slots we've fallen
+            # behind on and wait for the next one
+            due = start + seq * interval
+            now = time.time()
+            if now < due:
+                time.sleep(due - now)
+            else:
+                seq = max(seq, int((now - start) / interval))
+
+        frame = frames[seq % len(frames)]
+        now = time.time()
+        msg = "{}|seq={}|cap={:.6f}|sent={:.6f}".format(name, seq, now, now)
+        if jpeg:
+            (ok, buf) = cv2.imencode(".jpg", frame,
+                [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        try:
+            if mode == "pull" and jpeg:
+                sender.send_jpg(msg, buf, flags=zmq.NOBLOCK)
+            elif mode == "pull":
+                sender.send_array(frame, msg, flags=zmq.NOBLOCK)
+            elif jpeg:
+                sender.send_jpg(msg, buf)
+            else:
+                sender.send_image(msg, frame)
+        except zmq.Again:
+            pass
+        seq += 1
+    sender.close()
+
+
+class HubStats():
+    def __init__(self):
+        # per client: received frames, bytes, latencies and sequence numbers
+        self.frames = {}
+        self.bytes = {}
+        self.latencies = {}
+        self.firstSeq = {}
+        self.lastSeq = {}
+        self.lock = threading.Lock()
+
+    def add(self, msg, size, received):
+        # the clients share our clock, so no offset is needed
+        metadata = parse_metadata(msg)
+        (name, seq, sent) = (metadata["name"], metadata["seq"], metadata["cap"])
+        with self.lock:
+            self.frames[name] = self.frames.get(name, 0) + 1
+            self.bytes[name] = self.bytes.get(name, 0) + size
+            self.latencies.setdefault(name, []).append(received - sent)
+            self.firstSeq.setdefault(name, seq)
+            self.lastSeq[name] = seq
+
+
+def serve(hub, jpeg, stats, running, measuring):
+    # receive, decode and acknowledge frames like ImageZMQCamera._get_frame
+    while running.is_set():
+        if not hub.zmq_socket.poll(100):
+            continue
+        if jpeg:
+            (msg, buf) = hub.recv_jpg()
+            frame = cv2.imdecode(np.frombuffer(buf, dtype="uint8"), -1)
+            size = len(buf)
+        else:
+            (msg, frame) = hub.recv_image()
+            size = frame.nbytes
+        hub.send_reply(b"OK")
+        frame = imutils.resize(frame, width=600)
+        if measuring.is_set():
+            stats.add(msg, size, time.time())
+    hub.close()
+
+
+def consume(cam, stats, running, measuring):
+    # read one consolidated hub camera as the GUI would; the camera decodes
+    # and resizes every frame it takes
+    cam.timeout = 0.1
+    while running.is_set():
+        try:
+            cam.get_frame()
+        except TimeoutError:
+            continue
+        if measuring.is_set():
+            stats.add(cam.last_message, cam.last_size, time.time())
+
+
+def run(numClients, args):
+    ctx = mp.get_context("spawn")
+    stop = ctx.Event()
+    running = threading.Event()
+    measuring = threading.Event()
+    running.set()
+    stats = HubStats()
+
+    # PUB/SUB clients each bind their own port; otherwise the hubs bind
+    mode = args["mode"] if args["hubs"] == "consolidated" else "reqrep"
+    if args["hubs"] == "per-camera" or mode == "sub":
+        ports = [BASE_PORT + i for i in range(numClients)]
+    else:
+        ports = [BASE_PORT]
+
+    # set up the receiving side before the clients connect
+    threads = []
+    cams = []
+    if args["hubs"] == "consolidated":
+        # one receiver for every client, read through a HubCamera each
+        for i in range(numClients):
+            address = "localhost:{}".format(ports[i]) if mode == "sub" \
+                else str(ports[0])
+            cam = HubCamera("pi{}".format(i), "{},pi{},{}".format(address, i,
+                mode))
+            cam.initialize()
+            cams.append(cam)
+            threads.append(threading.Thread(target=consume, args=(cam, stats,
+                running, measuring)))
+    else:
+        for port in ports:
+            hub = imagezmq.ImageHub("tcp://*:{}".format(port))
+            threads.append(threading.Thread(target=serve, args=(hub,
+                args["jpeg"], stats, running, measuring)))
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    clients = []
+    for i in range(numClients):
+        port = ports[i % len(ports)]
+        p = ctx.Process(target=client, args=("pi{}".format(i), port,
+            args["width"], args["height"], args["rate"], args["jpeg"],
+            args["quality"], stop, mode))
+        p.daemon = True
+        p.start()
+        clients.append(p)
+
+    # let the clients start up before measuring
+    time.sleep(args["warmup"])
+    measuring.set()
+    (start, cpuStart) = (time.time(), time.process_time())
+    time.sleep(args["duration"])
+    measuring.clear()
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpuStart
+
+    # keep replying until the clients have sent their last frame
+    stop.set()
+    for p in clients:
+        p.join(timeout=2.0)
+        if p.is_alive():
+            p.terminate()
+    running.clear()
+    for t in threads:
+        t.join(timeout=1.0)
+    for cam in cams:
+        cam.close_camera()
+
+    return summarize(stats, numClients, elapsed, cpu)
+
+
+def summarize(stats, numClients, elapsed, cpu):
+    frames = sum(stats.frames.values())
+    latencies = np.concatenate([np.array(l) for l in stats.latencies.values()]) \
+        if stats.latencies else np.array([0.0])
+
+    # frames the clients skipped (or that never arrived) show up as gaps in
+    # their sequence numbers
+    expected = sum(stats.lastSeq[n] - stats.firstSeq[n] + 1 for n in stats.frames)
+    dropped = expected - frames
+
+    return {
+        "clients": numClients,
+        "seconds": elapsed,
+        "frames": frames,
+        "fps": frames / elapsed,
+        "fps_per_client": frames / elapsed / numClients,
+        "mb_per_sec": sum(stats.bytes.values()) / elapsed / 1e6,
+        "latency_ms_p50": float(np.percentile(latencies, 50) * 1000),
+        "latency_ms_p95": float(np.percentile(latencies, 95) * 1000),
+        "latency_ms_p99": float(np.percentile(latencies, 99) * 1000),
+        "dropped": dropped,
+        "drop_rate": dropped / float(expected) if expected else 0.0,
+        "hub_cpu": cpu / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--clients", type=int, nargs="+", default=[1, 2, 4, 8],
+        help="numbers of simulated Pi clients to sweep")
+    ap.add_argument("-r", "--rate", type=float, default=18,
+        help="frames per second each client tries to send (0 = as fast as possible)")
+    ap.add_argument("--width", type=int, default=640, help="frame width")
+    ap.add_argument("--height", type=int, default=480, help="frame height")
+    ap.add_argument("--jpeg", action="store_true",
+        help="send JPEG compressed frames instead of raw images")
+    ap.add_argument("-q", "--quality", type=int, default=85,
+        help="JPEG quality")
+    ap.add_argument("--hubs", choices=["shared", "per-camera", "consolidated"],
+        default="shared", help="one hub for every client, one hub (and "
+        "thread) per client, or the consolidated hub receiver")
+    ap.add_argument("-m", "--mode", choices=HUB_MODES, default="reqrep",
+        help="socket pattern for the consolidated hub receiver")
+    ap.add_argument("-d", "--duration", type=float, default=5.0,
+        help="seconds to measure each configuration")
+    ap.add_argument("--warmup", type=float, default=3.0,
+        help="seconds to let the clients connect before measuring")
+    ap.add_argument("--save", help="path to save the results as JSON")
+    args = vars(ap.parse_args())
+
+    print("[INFO] {}x{} {} frames at {} fps per client, {} hub{}".format(
+        args["width"], args["height"], "JPEG" if args["jpeg"] else "raw",
+        args["rate"] or "max", args["hubs"], " ({})".format(args["mode"])
+        if args["hubs"] == "consolidated" else ""))
+    print("{:>7} {:>8} {:>10} {:>8} {:>8} {:>8} {:>8} {:>7} {:>7}".format(
+        "clients", "fps", "fps/client", "MB/s", "p50 ms", "p95 ms", "p99 ms",
+        "drops", "cpu"))
+    rows = []
+    for numClients in args["clients"]:
+        row = run(numClients, args)
+        rows.append(row)
+        print("{:>7} {:>8.1f} {:>10.1f} {:>8.1f} {:>8.2f} {:>8.2f} {:>8.2f} "
+            "{:>7.1%} {:>7.0%}".format(row["clients"], row["fps"],
+            row["fps_per_client"], row["mb_per_sec"], row["latency_ms_p50"],
+            row["latency_ms_p95"], row["latency_ms_p99"], row["drop_rate"],
+            row["hub_cpu"]))
+
+    if args["save"] is not None:
+        with open(args["save"], "w") as f:
+            json.dump(rows, f, indent=2)
+        print("[INFO] saved results to {}".format(args["save"]))
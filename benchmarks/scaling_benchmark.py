@@ -0,0 +1,99 @@
+# USAGE
+# Sweep synthetic courts through BallFinder and the scorer to see how
+# detection time and accuracy scale with ball count, resolution and
+# lighting (no cameras or windows needed):
+#    python benchmarks/scaling_benchmark.py
+#    python benchmarks/scaling_benchmark.py --balls 1 2 4 --widths 600 1200 \
+#        --lighting 0.8 1.0 1.2 --seeds 10 --save scaling.json
+
+# import the necessary packages
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# run from the repository root so the games and benchmarks packages can be
+# found
+sys.path.append(os.path.abspath(os.getcwd()))
+from games.bocce.cv.ballfinder import BallFinder
+from benchmarks.synthetic import SceneGenerator, evaluate
+
+
+def run_config(ballsPerTeam, width, lighting, seeds, scaleBalls=True):
+    # the court keeps its 3:2 aspect ratio; the balls grow with the
+    # resolution unless scaleBalls is off
+    scale = width / 600.0 if scaleBalls else 1.0
+    generator = SceneGenerator(size=(width, int(width * 2 / 3)),
+        ballRadius=int(round(12 * scale)), pallinoRadius=int(round(7 * scale)),
+        lighting=lighting)
+
+    times = []
+    results = []
+    for seed in range(seeds):
+        (frame, truth) = generator.render(ballsPerTeam, ballsPerTeam, seed=seed)
+        finder = BallFinder(debug=False)
+        start = time.perf_counter()
+        try:
+            # the pipeline prints a lot; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                finder.pipeline(frame, ballsPerTeam, ballsPerTeam)
+        except Exception:
+            # i.e. too few balls were found to cluster
+            pass
+        times.append(time.perf_counter() - start)
+        results.append(evaluate(finder, truth))
+
+    errors = [r["error"] for r in results if r["error"] is not None]
+    return {
+        "ballsPerTeam": ballsPerTeam,
+        "width": width,
+        "lighting": lighting,
+        "median_ms": float(np.median(times) * 1000),
+        "recall": float(sum(r["found"] for r in results) /
+            float(sum(r["expected"] for r in results))),
+        "pallino": float(np.mean([r["pallino"] for r in results])),
+        "teams": float(np.mean([r["teams"] for r in results])),
+        "scored": float(np.mean([r["scored"] for r in results])),
+        "error_px": float(np.mean(errors)) if errors else None,
+    }
+
+
+if __name__ == "__main__":
+    # construct the argument parser and parse the arguments
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-b", "--balls", type=int, nargs="+", default=[1, 2, 4],
+        help="balls per team to sweep")
+    ap.add_argument("-w", "--widths", type=int, nargs="+",
+        default=[600, 900, 1200], help="frame widths to sweep")
+    ap.add_argument("-l", "--lighting", type=float, nargs="+",
+        default=[0.9, 1.0, 1.1], help="overall brightness factors to sweep")
+    ap.add_argument("-s", "--seeds", type=int, default=5,
+        help="number of random scenes per configuration")
+    ap.add_argument("--fixed-ball-size", action="store_true",
+        help="keep the ball size in pixels fixed across resolutions")
+    ap.add_argument("--save", help="path to save the results as JSON")
+    args = vars(ap.parse_args())
+
+    print("{:>5} {:>6} {:>6} {:>10} {:>7} {:>8} {:>6} {:>7} {:>9}".format(
+        "balls", "width", "light", "median ms", "recall", "pallino", "teams",
+        "scored", "error px"))
+    rows = []
+    for (balls, width, lighting) in itertools.product(args["balls"],
+        args["widths"], args["lighting"]):
+        row = run_config(balls, width, lighting, args["seeds"],
+            scaleBalls=not args["fixed_ball_size"])
+        rows.append(row)
+        print("{:>5} {:>6} {:>6.2f} {:>10.2f} {:>7.0%} {:>8.0%} {:>6.0%} "
+            "{:>7.0%} {:>9}".format(balls, width, lighting, row["median_ms"],
+            row["recall"], row["pallino"], row["teams"], row["scored"],
+            "" if row["error_px"] is None else "{:.1f}".format(row["error_px"])))
+
+    if args["save"] is not None:
+        with open(args["save"], "w") as f:
+            json.dump(rows, f, indent=2)
+        print("[INFO] saved results to {}".format(args["save"]))
@@ -0,0 +1,218 @@
+# imports
+import cv2
+import numpy as np
+from scipy.spatial import distance as dist
+from games.bocce.ball import Ball
+from games.bocce.frame import get_frame_points_and_leader
+
+# BGR colors of the balls: red home team, purple away team and the yellow
+# pallino (the same colors the game assigns in views/viewsui.py)
+HOME_COLOR = (40, 40, 200)
+AWAY_COLOR = (140, 40, 120)
+PALLINO_COLOR = (30, 210, 235)
+
+# HSV color of the court; inside BallFinder's default court range
+COURT_HSV = (100, 30, 180)
+
+
+class SceneGenerator():
+    """
+    Renders synthetic bocce courts with a known layout: a textured court,
+    a pallino and N home and away balls with shading, shadows, uneven
+    lighting and sensor noise. Scenes are deterministic for a given seed, so
+    they double as offline accuracy tests. The balls are placed in the part
+    of the frame BallFinder slices out when the court isn't calibrated.
+    """
+    def __init__(self, size=(600, 400), ballRadius=12, pallinoRadius=7,
+        noise=6.0, lighting=1.0, shadows=0.85, seed=42):
+        # frame (width, height) and ball radii in pixels
+        self.size = size
+        self.ballRadius = ballRadius
+        self.pallinoRadius = pallinoRadius
+
+        # std of the gaussian sensor noise, overall brightness, and how much
+        # the shadows darken the court (1.0 means no shadows)
+        self.noise = noise
+        self.lighting = lighting
+        self.shadows = shadows
+
+        self.seed = seed
+
+    def court_region(self):
+        # (x, y, w, h) of the frame which BallFinder.slice_court keeps
+        (w, h) = self.size
+        (y0, y1) = (int(h * .20), int(h * .80))
+        return (0, y0, int(w * .75), y1 - y0)
+
+    def render(self, numHome=2, numAway=2, seed=None):
+        # returns the BGR frame and its ground truth; coordinates are given
+        # in the sliced court's coordinates, like BallFinder's
+        rng = np.random.RandomState(self.seed if seed is None else seed)
+        frame = self.render_court(rng)
+
+        # place the balls without overlapping each other
+        (x, y, w, h) = self.court_region()
+        radii = [self.pallinoRadius] + [self.ballRadius] * (numHome + numAway)
+        centers = self.place_balls(rng, radii, (x, y, w, h))
+
+        # shadows go down first so that the balls cover them
+        if self.shadows < 1.0:
+            for (center, radius) in zip(centers, radii):
+                self.draw_shadow(frame, center, radius)
+
+        colors = [PALLINO_COLOR] + [HOME_COLOR] * numHome + [AWAY_COLOR] * numAway
+        for (center, radius, color) in zip(centers, radii, colors):
+            self.draw_ball(frame, center, radius, color)
+
+        # uneven lighting and sensor noise apply to the whole frame
+        frame = self.apply_lighting(frame, rng)
+
+        courtCenters = [(cX - x, cY - y) for (cX, cY) in centers]
+        truth = {
+            "pallino": courtCenters[0],
+            "homeBalls": courtCenters[1:1 + numHome],
+            "awayBalls": courtCenters[1 + numHome:],
+            "ballRadius": self.ballRadius,
+            "pallinoRadius": self.pallinoRadius,
+        }
+        return (frame, truth)
+
+    def render_court(self, rng):
+        # a flat court color with a coarse, low frequency texture
+        (w, h) = self.size
+        hsv = np.zeros((h, w, 3), dtype="float32")
+        hsv[:, :] = COURT_HSV
+        texture = rng.normal(0, 1, (max(h // 16, 2), max(w // 16, 2)))
+        texture = cv2.resize(texture.astype("float32"), (w, h),
+            interpolation=cv2.INTER_CUBIC)
+        hsv[:, :, 2] += texture * 8
+        hsv = np.clip(hsv, 0, 255).astype("uint8")
+        return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+    def place_balls(self, rng, radii, region, attempts=1000):
+        (x, y, w, h) = region
+        margin = 4
+        centers = []
+        for radius in radii:
+            for i in range(attempts):
+                cX = rng.randint(x + radius + margin, x + w - radius - margin)
+                cY = rng.randint(y + radius + margin, y + h - radius - margin)
+                if all(dist.euclidean((cX, cY), c) > radius + r + margin * 2
+                    for (c, r) in zip(centers, radii)):
+                    break
+            else:
+                raise ValueError("couldn't fit {} balls in {}x{}".format(
+                    len(radii), w, h))
+            centers.append((cX, cY))
+        return centers
+
+    def draw_shadow(self, frame, center, radius):
+        # a soft shadow down and to the right of the ball
+        shadow = np.zeros(frame.shape[:2], dtype="float32")
+        offset = int(radius * 0.4)
+        cv2.ellipse(shadow, (center[0] + offset, center[1] + offset),
+            (int(radius * 1.1), int(radius * 0.8)), 0, 0, 360, 1.0, -1)
+        shadow = cv2.GaussianBlur(shadow, (0, 0), radius * 0.3)
+        scale = 1.0 - (1.0 - self.shadows) * shadow
+        frame[:] = np.clip(frame * scale[:, :, np.newaxis], 0, 255)
+
+    def draw_ball(self, frame, center, radius, color):
+        # shade the ball so it is brighter towards a highlight up and to the
+        # left, like a sphere lit from above
+        (h, w) = frame.shape[:2]
+        (x0, y0) = (max(center[0] - radius, 0), max(center[1] - radius, 0))
+        (x1, y1) = (min(center[0] + radius + 1, w), min(center[1] + radius + 1, h))
+        (ys, xs) = np.mgrid[y0:y1, x0:x1].astype("float32")
+        d = np.sqrt((xs - center[0]) ** 2 + (ys - center[1]) ** 2) / radius
+        inside = d <= 1.0
+        (hX, hY) = (center[0] - radius * 0.35, center[1] - radius * 0.35)
+        highlight = np.sqrt((xs - hX) ** 2 + (ys - hY) ** 2) / radius
+        shade = np.clip(1.15 - 0.6 * highlight, 0.45, 1.15)
+        ball = np.array(color, dtype="float32") * shade[:, :, np.newaxis]
+        roi = frame[y0:y1, x0:x1]
+        roi[inside] = np.clip(ball[inside], 0, 255)
+
+    def apply_lighting(self, frame, rng):
+        # a brightness gradient across the court times the overall lighting,
+        # plus gaussian noise
+        (h, w) = frame.shape[:2]
+        gradient = np.linspace(0.92, 1.08, w, dtype="float32")[np.newaxis, :]
+        lit = frame.astype("float32") * (gradient * self.lighting)[:, :, np.newaxis]
+        if self.noise > 0:
+            lit += rng.normal(0, self.noise, lit.shape).astype("float32")
+        return np.clip(lit, 0, 255).astype("uint8")
+
+
+def match_balls(detected, expected, tolerance):
+    # greedily match detected to expected coordinates (closest first) and
+    # return the number matched within the tolerance and their mean error
+    pairs = sorted((dist.euclidean(d, e), i, j)
+        for (i, d) in enumerate(detected) for (j, e) in enumerate(expected))
+    (usedD, usedE, errors) = (set(), set(), [])
+    for (d, i, j) in pairs:
+        if d > tolerance or i in usedD or j in usedE:
+            continue
+        usedD.add(i)
+        usedE.add(j)
+        errors.append(d)
+    return (len(errors), float(np.mean(errors)) if errors else None)
+
+
+def evaluate(finder, truth):
+    # compare a BallFinder's result with the ground truth; the team labels
+    # BallFinder assigns come from cluster sizes rather than colors, so the
+    # teams count as correct if they're grouped right either way around
+    tolerance = truth["ballRadius"]
+    pallino = None if finder.pallino is None else finder.pallino.coordinates
+    home = [b.coordinates for b in finder.homeBalls]
+    away = [b.coordinates for b in finder.awayBalls]
+    detected = ([pallino] if pallino is not None else []) + home + away
+    expected = [truth["pallino"]] + truth["homeBalls"] + truth["awayBalls"]
+
+    (found, error) = match_balls(detected, expected, tolerance)
+    pallinoFound = bool(pallino is not None and
+        dist.euclidean(pallino, truth["pallino"]) <= tolerance)
+
+    def grouped(a, b):
+        return match_balls(a, b, tolerance)[0] == len(b) == len(a)
+    teamsGrouped = (grouped(home, truth["homeBalls"]) and
+        grouped(away, truth["awayBalls"])) or \
+        (grouped(home, truth["awayBalls"]) and
+        grouped(away, truth["homeBalls"]))
+
+    # the frame is scored right if the same balls lead by the same points
+    scored = False
+    if pallino is not None and home and away:
+        try:
+            (points, leader) = score(pallino, home, away)
+            (truePoints, trueLeader) = score(truth["pallino"],
+                truth["homeBalls"], truth["awayBalls"])
+            scored = points == truePoints and leader is not None and \
+                trueLeader is not None and grouped(leader, trueLeader)
+        except Exception:
+            scored = False
+
+    return {
+        "expected": len(expected),
+        "detected": len(detected),
+        "found": found,
+        "error": error,
+        "pallino": pallinoFound,
+        "teams": teamsGrouped,
+        "scored": scored,
+    }
+
+
+def score(pallino, homeBalls, awayBalls):
+    # run the game's scorer on coordinates; the leader is returned as the
+    # leading team's list of coordinates
+    def balls(coordinates):
+        ballList = []
+        for c in coordinates:
+            b = Ball(color=None)
+            b.coordinates = c
+            ballList.append(b)
+        return ballList
+
+    return get_frame_points_and_leader(balls([pallino])[0], balls(homeBalls),
+        balls(awayBalls), homeBalls, awayBalls)
@@ -6,5 +6,6 @@ __all__ = [
 	'team',
 	'throw',
 	'frame',
-	'game'
+	'game',
+	'courtfarm'
 ]
\ No newline at end of file
@@ -3,7 +3,11 @@ class Ball:
         self.color = color
         self.roi = roi
 
+        # coordinates are in the court image the ball was found in (the
+        # rectified court when the camera is calibrated); frameCoordinates
+        # are the same point in the camera frame, i.e. for drawing on it
         self.coordinates = (None, None)
+        self.frameCoordinates = (None, None)
         self.coordinates_history = []
         self.isThrown = False
         self.isMoving = False
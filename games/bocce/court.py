@@ -1,3 +1,7 @@
+# imports
+from .cv.courtcalibration import CourtCalibrator
+from .courtfarm import FarmCamera
+
 class Court:
 	def __init__(self, name, orientation="north-south"):
 		self.name = name
@@ -6,6 +10,13 @@ class Court:
 		self.playerCams = []
 		self.game = None
 
+		# court homographies are detected once and cached per camera
+		self.calibrator = CourtCalibrator()
+
+		# the CourtFarm capturing and scoring this court in its own process
+		# (see Venue.start_farm), if any
+		self.farm = None
+
 	def add_birdseye_cam(self, cam):
 		self.birdseyeCams.append(cam)
 
@@ -18,9 +29,36 @@ class Court:
 	def remove_player_cam(self, cam):
 		pass
 
+	def camera_specs(self):
+		# (cameraType, name, source, flip) of each camera for a CourtWorker
+		return [(type(cam).__name__, cam.name, cam.spec, cam.flip)
+			for cam in self.birdseyeCams + self.playerCams]
+
+	def use_farm(self, farm):
+		# the farm's worker opens the cameras, so swap ours for stand-ins
+		# which read its frames
+		self.farm = farm
+		self.birdseyeCams = [FarmCamera(farm, self.name, cam.name)
+			for cam in self.birdseyeCams]
+		self.playerCams = [FarmCamera(farm, self.name, cam.name)
+			for cam in self.playerCams]
+
+	def detect(self, throwsHome, throwsAway):
+		# detect and score the balls in the worker; returns the id of the
+		# "detection" (or "error") message which Venue.poll() will return
+		return self.farm.detect(self.name, throwsHome, throwsAway)
+
 	def set_game(self, game):
 		self.game = game
 		self.game.orientation = self.orientation
+		self.game.calibrator = self.calibrator
+
+	def recalibrate(self, cam=None):
+		# detect the court again on the next frame (i.e. a camera moved)
+		camName = None if cam is None else cam.name
+		self.calibrator.invalidate(camName)
+		if self.farm is not None:
+			self.farm.recalibrate(self.name, camName)
 
 	def end_game(self):
 		self.game = None
@@ -0,0 +1,343 @@
+# imports
+import time
+import ctypes
+import queue
+import threading
+import numpy as np
+import multiprocessing as mp
+from games.camera.camera import Camera, USBCamera, RTSPCamera, \
+    ImageZMQCamera, PubSubImageZMQCamera, ReplayCamera, HubCamera
+from .cv.ballfinder import BallFinder
+from .cv.courtcalibration import CourtCalibrator
+from .frame import get_frame_points_and_leader
+
+# camera specs name the camera class the same way the config tab does
+CAMERA_TYPES = {
+    "USBCamera": USBCamera,
+    "RTSPCamera": RTSPCamera,
+    "ImageZMQCamera": ImageZMQCamera,
+    "PubSubImageZMQCamera": PubSubImageZMQCamera,
+    "ReplayCamera": ReplayCamera,
+    "HubCamera": HubCamera,
+}
+
+# largest (height, width, channels) frame a court camera may produce
+MAX_FRAME_SHAPE = (720, 1280, 3)
+
+
+def make_camera(cameraType, name, source, flip=False):
+    # build (but don't open) a camera from one of Court.camera_specs()
+    return CAMERA_TYPES[cameraType](name=name, source=source, flip=flip)
+
+
+class SharedFrameBuffer():
+    """
+    A ring of frame slots in shared memory which one process writes and any
+    other process reads without pickling the pixels. The sequence number is
+    only published once a slot is completely written, and a reader retries
+    if the writer came back around to its slot while it was copying.
+    """
+    def __init__(self, maxShape=MAX_FRAME_SHAPE, slots=3):
+        self.maxShape = tuple(maxShape)
+        self.slots = slots
+        self.slotSize = int(np.prod(self.maxShape))
+
+        # the pixels, each slot's (h, w, channels) and the latest sequence
+        self.data = mp.RawArray(ctypes.c_uint8, self.slotSize * slots)
+        self.shapes = mp.RawArray(ctypes.c_int32, 3 * slots)
+        self.sequence = mp.RawValue(ctypes.c_int64, 0)
+
+        # numpy view of the slots (created lazily in each process)
+        self._view = None
+
+    def __getstate__(self):
+        # the shared memory is handed to the worker when it is spawned; the
+        # numpy view is rebuilt on the other side
+        state = self.__dict__.copy()
+        state["_view"] = None
+        return state
+
+    def view(self):
+        if self._view is None:
+            self._view = np.frombuffer(self.data, dtype="uint8").reshape(
+                self.slots, self.slotSize)
+        return self._view
+
+    def write(self, frame):
+        if frame.size > self.slotSize:
+            raise ValueError("frame of shape {} doesn't fit in {}".format(
+                frame.shape, self.maxShape))
+
+        # write into the slot after the one readers are looking at
+        sequence = self.sequence.value + 1
+        slot = sequence % self.slots
+        (h, w) = frame.shape[:2]
+        channels = 1 if frame.ndim == 2 else frame.shape[2]
+        self.view()[slot, :frame.size] = frame.reshape(-1)
+        self.shapes[3 * slot:3 * slot + 3] = [h, w, channels]
+
+        # publish the frame
+        self.sequence.value = sequence
+        return sequence
+
+    def read(self, lastSequence=None):
+        # returns (sequence, frame); the frame is None if nothing new was
+        # written since lastSequence
+        while True:
+            sequence = self.sequence.value
+            if sequence == 0 or sequence == lastSequence:
+                return (sequence, None)
+
+            slot = sequence % self.slots
+            (h, w, channels) = self.shapes[3 * slot:3 * slot + 3]
+            frame = self.view()[slot, :h * w * channels].copy()
+
+            # the writer reuses our slot slots - 1 frames later, so retry if
+            # it may have started overwriting it while we copied
+            if self.sequence.value - sequence < self.slots - 1:
+                if channels == 1:
+                    return (sequence, frame.reshape(h, w))
+                return (sequence, frame.reshape(h, w, channels))
+
+
+class CourtWorker():
+    """
+    Captures, detects and scores a single court in its own process. The
+    cameras are created inside the worker from their specs; frames are
+    published to shared memory and only compact result messages (ball
+    coordinates and scores) are sent back to the UI process.
+    """
+    def __init__(self, courtName, cameraSpecs, buffers, commands, results,
+        detectCam=None):
+        # cameraSpecs are (cameraType, name, source, flip) like the rows of
+        # the config tab
+        self.courtName = courtName
+        self.cameraSpecs = cameraSpecs
+        self.buffers = buffers
+        self.commands = commands
+        self.results = results
+
+        # the (birds eye) camera the balls are detected with
+        self.detectCam = detectCam if detectCam is not None \
+            else cameraSpecs[0][1]
+
+        self.cameras = {}
+        self.running = False
+
+    def run(self):
+        # entry point of the worker process
+        self.running = True
+        self.calibrator = CourtCalibrator()
+        self.start_cameras()
+        self.post("ready", cameras=sorted(self.cameras.keys()))
+
+        while self.running:
+            try:
+                command = self.commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.handle_command(*command)
+
+        for cam in self.cameras.values():
+            cam.close_camera()
+
+    def start_cameras(self):
+        for (cameraType, name, source, flip) in self.cameraSpecs:
+            cam = make_camera(cameraType, name, source, flip)
+            cam.thumbnailWidth = None
+            try:
+                cam.initialize()
+            except Exception as e:
+                # the capture thread's supervisor keeps trying to reconnect
+                cam.report_failure(e)
+            self.cameras[name] = cam
+
+            # each camera captures on its own thread in this process
+            t = threading.Thread(target=self.capture, args=(cam,))
+            t.daemon = True
+            t.start()
+
+    def capture(self, cam):
+        buffer = self.buffers[cam.name]
+        while self.running:
+            # the camera's supervisor backs off and reconnects on failures
+            if cam.supervised_get_frame():
+                buffer.write(cam.last_frame)
+                cam.record_frame()
+
+    def handle_command(self, name, *args):
+        if name == "detect":
+            self.detect(*args)
+        elif name == "recalibrate":
+            self.calibrator.invalidate(*args)
+        elif name == "record":
+            for cam in self.select_cameras(*args):
+                cam.start_recording()
+        elif name == "stop_recording":
+            for cam in self.select_cameras(*args):
+                cam.stop_recording()
+        elif name == "health":
+            self.post("health", cameras={camName: cam.supervisor.metrics()
+                for (camName, cam) in self.cameras.items()})
+        elif name == "stop":
+            self.running = False
+
+    def select_cameras(self, camName=None):
+        # one camera by name or, without one, all of the court's cameras
+        if camName is None:
+            return list(self.cameras.values())
+        return [self.cameras[camName]] if camName in self.cameras else []
+
+    def detect(self, requestId, throwsHome, throwsAway):
+        start = time.time()
+        (sequence, frame) = self.buffers[self.detectCam].read()
+        if frame is None:
+            self.post("error", requestId=requestId,
+                message="no frame from {}".format(self.detectCam))
+            return
+
+        try:
+            bf = BallFinder(calibrator=self.calibrator, debug=False)
+            bf.pipeline(frame, throwsHome, throwsAway, camName=self.detectCam)
+            (points, leader) = get_frame_points_and_leader(bf.pallino,
+                bf.homeBalls, bf.awayBalls, "home", "away")
+        except Exception as e:
+            self.post("error", requestId=requestId, message=str(e))
+            return
+
+        # only send the ball coordinates back, not the ball images
+        self.post("detection", requestId=requestId, camera=self.detectCam,
+            sequence=sequence,
+            pallino=None if bf.pallino is None else bf.pallino.coordinates,
+            homeBalls=[b.coordinates for b in bf.homeBalls],
+            awayBalls=[b.coordinates for b in bf.awayBalls],
+            points=points, leader=leader, duration=time.time() - start)
+
+    def post(self, kind, **kwargs):
+        kwargs.update(court=self.courtName, type=kind)
+        self.results.put(kwargs)
+
+
+class CourtFarm():
+    """
+    Runs one CourtWorker process per court so that a single venue PC can
+    score all of its courts on separate cores. The UI process sends
+    commands, reads camera frames from shared memory and polls for the
+    compact result messages. The workers are spawned and import the main
+    module again, so a script that starts the farm must do so under an
+    if __name__ == "__main__" guard (see obies_eyes.py).
+    """
+    def __init__(self, maxShape=MAX_FRAME_SHAPE):
+        # spawn the workers; forking a process with a GUI and camera
+        # threads isn't safe
+        self.context = mp.get_context("spawn")
+        self.maxShape = maxShape
+        self.results = self.context.Queue()
+
+        # courtName -> (process, commands, {camName: SharedFrameBuffer})
+        self.courts = {}
+        self.requestId = 0
+
+    def add_court(self, courtName, cameraSpecs, detectCam=None):
+        buffers = {}
+        for (cameraType, name, source, flip) in cameraSpecs:
+            buffers[name] = SharedFrameBuffer(self.maxShape)
+        commands = self.context.Queue()
+        worker = CourtWorker(courtName, cameraSpecs, buffers, commands,
+            self.results, detectCam)
+        process = self.context.Process(target=worker.run,
+            name="court-{}".format(courtName))
+        process.daemon = True
+        self.courts[courtName] = (process, commands, buffers)
+
+    def start(self):
+        for (process, commands, buffers) in self.courts.values():
+            if not process.is_alive():
+                process.start()
+
+    def stop(self, timeout=5.0):
+        for (process, commands, buffers) in self.courts.values():
+            if process.is_alive():
+                commands.put(("stop",))
+        for (process, commands, buffers) in self.courts.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def send(self, courtName, *command):
+        self.courts[courtName][1].put(command)
+
+    def detect(self, courtName, throwsHome, throwsAway):
+        # returns the id of the "detection" (or "error") result message
+        self.requestId += 1
+        self.send(courtName, "detect", self.requestId, throwsHome, throwsAway)
+        return self.requestId
+
+    def recalibrate(self, courtName, camName=None):
+        self.send(courtName, "recalibrate", camName)
+
+    def record(self, courtName, camName=None):
+        # the worker writes the video files; all cameras unless camName
+        self.send(courtName, "record", camName)
+
+    def stop_recording(self, courtName, camName=None):
+        self.send(courtName, "stop_recording", camName)
+
+    def health(self, courtName):
+        # the court's camera health and reconnect metrics arrive as a
+        # "health" result message
+        self.send(courtName, "health")
+
+    def get_frame(self, courtName, camName, lastSequence=None):
+        # (sequence, frame) straight from the worker's shared memory
+        return self.courts[courtName][2][camName].read(lastSequence)
+
+    def poll(self):
+        # drain the result messages without blocking
+        messages = []
+        while True:
+            try:
+                messages.append(self.results.get_nowait())
+            except queue.Empty:
+                return messages
+
+
+class FarmCamera(Camera):
+    """
+    Stands in for a camera that a CourtWorker captures, so the rest of the
+    game (Frame, the annotations) can read last_frame as usual. Frames come
+    from the worker's shared memory; recording is done by the worker.
+    """
+    def __init__(self, farm, courtName, name, timeout=2.0):
+        super(FarmCamera, self).__init__(name=name, source=courtName)
+        self.farm = farm
+        self.courtName = courtName
+        self.timeout = timeout
+        self.thumbnailWidth = None
+        self.lastSequence = None
+
+    def initialize(self):
+        self.initialized = True
+
+    def _get_frame(self):
+        # wait for a frame newer than the last one we read
+        deadline = time.time() + self.timeout
+        while True:
+            (sequence, frame) = self.farm.get_frame(self.courtName, self.name,
+                self.lastSequence)
+            if frame is not None:
+                self.lastSequence = sequence
+                return frame
+            if time.time() > deadline:
+                raise TimeoutError("no frame from {} on court {}".format(
+                    self.name, self.courtName))
+            time.sleep(0.005)
+
+    def start_recording(self):
+        self.recording = True
+        self.farm.record(self.courtName, self.name)
+
+    def stop_recording(self):
+        if self.recording:
+            self.recording = False
+            self.farm.stop_recording(self.courtName, self.name)
@@ -1,7 +1,6 @@
 # imports
 import time
 import cv2
-import imutils
 import numpy as np
 from scipy.spatial import distance as dist
 from sklearn.cluster import KMeans
@@ -10,6 +9,7 @@ from sklearn.cluster import KMeans
 try:
     from games.bocce.ball import Ball, Pallino, Bocce
     from .pyimagesearch.descriptors.histogram import Histogram
+    from .detectors import HSVDetector
     unit_test = False
 
 # otherwise, we're running main test code at the bottom of this script
@@ -19,11 +19,14 @@ except:
     sys.path.append(os.path.abspath(os.getcwd()))
     print(sys.path)
     from games.bocce.cv.pyimagesearch.descriptors.histogram import Histogram
+    from games.bocce.cv.detectors import HSVDetector
     from games.bocce.ball import Ball, Pallino, Bocce
     unit_test = True
 
 
 # Ball Algorithm pipeline:
+# (steps 1-4 are done by the detector backend, see detectors.py; a learned
+#  detector replaces them with a single network pass)
 # (1) Mask court via HSV
 # (2) Grabcut via ball mask (opposite of court mask)
 # (3) Find contours
@@ -42,7 +45,8 @@ except:
 
 
 class BallFinder():
-    def __init__(self):
+    def __init__(self, calibrator=None, debug=True, refiner=None,
+        detector=None):
         self.pallino = None
         self.homeBalls = []
         self.awayBalls = []
@@ -50,71 +54,121 @@ class BallFinder():
         self.minHSV = (72, 0, 134)
         self.maxHSV = (175, 66, 223)
 
+        # how the last sliced court relates to its camera frame: court
+        # pixels per frame pixel and a function mapping court (x, y) points
+        # to frame points (see slice_court)
+        self.areaScale = 1.0
+        self.courtToFrame = lambda pt: pt
+
+        # court calibrations (homographies) are cached per camera by the
+        # calibrator, so it should outlive this BallFinder
+        self.calibrator = calibrator
+
+        # show the intermediate images (and wait for a keypress); this must
+        # be off when running headless, e.g. in a detection worker process
+        self.debug = debug
+
+        # the detector backend finds the candidate balls (steps 1-4); it
+        # defaults to the classic HSV pipeline. Learned detectors load their
+        # model once, so pass in one that outlives this BallFinder. The
+        # optional GrabCutRefiner refines any detector's candidates.
+        if detector is None:
+            detector = HSVDetector(self.minHSV, self.maxHSV, refiner=refiner,
+                debug=debug)
+        elif refiner is not None:
+            detector.refiner = refiner
+        self.detector = detector
+
     def adjust_HSV_ranges(self, newMinHSV, newMaxHSV):
         self.minHSV = newMinHSV
         self.maxHSV = newMaxHSV
+        if isinstance(self.detector, HSVDetector):
+            self.detector.minHSV = newMinHSV
+            self.detector.maxHSV = newMaxHSV
 
-    def pipeline(self, court, throwsHome, throwsAway):
+    def pipeline(self, court, throwsHome, throwsAway, camName=None):
         # add the pallino, home throws, and away throws
         # todo doesn't take into account balls removed from play!!!!!
         expectedBalls = 1 + throwsHome + throwsAway
-        clusters = 1 + (1 if throwsHome >= 1 else 0) + (1 if throwsAway >= 1 else 0)
 
         # (0) slice out the court
-        (h, w) = court.shape[:2]
-        court = court[int(h*.20):int(h*.80), int(0):int(w*.75)]
-        cv2.imshow("court", court)
-        cv2.waitKey(0)
+        court = self.slice_court(court, camName)
+        if self.debug:
+            cv2.imshow("court", court)
+            cv2.waitKey(0)
 
         # (0.1) Stich birds eye feeds
         # todo
 
-        # (0.2) Detect court
-        # todo
-
-        # (1) Mask court via HSV
-        ballMask = self.mask_out_court(court, self.minHSV, self.maxHSV)
-        cv2.imshow("ballMask", ballMask)
-        cv2.waitKey(0)
-
-        # (2) Grabcut via ball mask (opposite of court mask)
-        # ballMask = self.grab_cut_mask(court, ballMask)
-        # cv2.imshow("ballMask", ballMask)
-        # cv2.waitKey(0)
+        # (1-4) Find the candidate balls with the detector backend
+        (cnts, ballMask) = self.detector.detect(court, expectedBalls, camName,
+            areaScale=self.areaScale)
 
-        # (3) Find contours
-        cnts = self.find_and_sort_ball_contours(ballMask, expectedBalls)
+        # (5-7) Create, cluster and assign the balls
+        self.find_balls(court, ballMask, cnts, throwsHome, throwsAway)
 
-        # (4) Filter contours based on (A) Aspect Ratio and (B) Area
-        cnts = self.filter_contours(cnts)
+    def pipeline_batch(self, frames, throwsHome, throwsAway, camNames=None):
+        # run the pipeline for several cameras at once so that the detector
+        # can batch them; returns a (pallino, homeBalls, awayBalls) tuple per
+        # camera
+        expectedBalls = 1 + throwsHome + throwsAway
+        if camNames is None:
+            camNames = [None] * len(frames)
+        courts = []
+        mappings = []
+        for (frame, camName) in zip(frames, camNames):
+            courts.append(self.slice_court(frame, camName))
+            mappings.append((self.areaScale, self.courtToFrame))
+        candidates = self.detector.detect_batch(courts, expectedBalls, camNames,
+            [areaScale for (areaScale, courtToFrame) in mappings])
+
+        results = []
+        for (court, (cnts, ballMask), (areaScale, courtToFrame)) in zip(courts,
+            candidates, mappings):
+            self.courtToFrame = courtToFrame
+            self.pallino = None
+            self.homeBalls = []
+            self.awayBalls = []
+            self.find_balls(court, ballMask, cnts, throwsHome, throwsAway)
+            results.append((self.pallino, self.homeBalls, self.awayBalls))
+        return results
+
+    def find_balls(self, court, ballMask, cnts, throwsHome, throwsAway):
+        expectedBalls = 1 + throwsHome + throwsAway
+        clusters = 1 + (1 if throwsHome >= 1 else 0) + (1 if throwsAway >= 1 else 0)
 
         # (5) Create Balls
         balls = self.extract_balls(court, ballMask, cnts, expectedBalls)
 
         # (6) Clustering - Cluster Ball ROIs based on L*A*B* Color Histogram
-        ballClusterIdxs = self.cluster_balls(balls, clusters, debug=True)
+        ballClusterIdxs = self.cluster_balls(balls, clusters, debug=self.debug)
 
-        # (6) Sort clusters and Assign team balls
+        # (7) Sort clusters and Assign team balls
         self.assign_balls(balls, ballClusterIdxs)
 
-    def mask_out_court(self, frame, minHSV, maxHSV):
-        # convert image to HSV
-        imageHSV = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-        # calculate the court mask and display it until keypress
-        courtMask = cv2.inRange(imageHSV, minHSV, maxHSV)
-
-        ballMask = cv2.bitwise_not(courtMask)
-        # cv2.imshow("ball mask", ballMask)
-
-        # apply "opening" (series of erosions followed by dilation) to
-        # eliminate salt and pepper noise and display it until keypress
-        # morphed = cv2.morphologyEx(ballMask, cv2.MORPH_OPEN, kernel, iterations=3)
-        morphed = cv2.erode(ballMask, (3, 3), iterations=6)
-        morphed = cv2.dilate(morphed, (3, 3), iterations=6)
-        morphed = cv2.erode(morphed, (3, 3), iterations=1)
-
-        return morphed
+        # locate the balls in the camera frame as well
+        for b in balls:
+            b.frameCoordinates = self.courtToFrame(b.coordinates)
+
+    def slice_court(self, frame, camName=None):
+        # (0.2) Detect court and warp it to a fixed size top-down view using
+        # the cached homography for this camera
+        if self.calibrator is not None:
+            court = self.calibrator.rectify(camName, frame, self.minHSV,
+                self.maxHSV)
+            if court is not None:
+                calibration = self.calibrator.get_calibration(camName)
+                self.areaScale = calibration.areaScale
+                self.courtToFrame = lambda pt: tuple(int(round(v)) for v in
+                    calibration.to_frame_coordinates([pt])[0])
+                return court
+
+        # otherwise, fall back to slicing hardcoded fractions of the frame
+        (h, w) = frame.shape[:2]
+        top = int(h*.20)
+        self.areaScale = 1.0
+        self.courtToFrame = lambda pt: (pt[0], pt[1] + top)
+        return frame[top:int(h*.80), int(0):int(w*.75)]
 
     def grab_cut_mask(self, court, mask):
         ####### BEGIN GRABCUT MASK ALGO
@@ -188,49 +242,6 @@ class BallFinder():
 
         return outputMask
 
-    def find_and_sort_ball_contours(self, ballMask, expectedBalls):
-        # find contours in the image, keeping only the EXTERNAL contours in
-        # the image
-        cnts = cv2.findContours(ballMask.copy(), cv2.RETR_EXTERNAL,
-                                cv2.CHAIN_APPROX_SIMPLE)
-        cnts = imutils.grab_contours(cnts)
-        # print("Found {} EXTERNAL contours".format(len(cnts)))
-
-        # sort the 1:1 aspect ratio contours according to size
-        cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:expectedBalls + 1]
-
-        return cnts
-
-    def filter_contours(self, cnts):
-        # loop over the contours to eliminate non 1:1 aspect ratio balls
-        filteredCnts = []
-        i = 0
-        for c in cnts:
-            # compute the area of the contour along with the bounding box
-            # to compute the aspect ratio
-            area = cv2.contourArea(c)
-            (x, y, w, h) = cv2.boundingRect(c)
-            if area > 1000:
-                print("[INFO] cnt[DISCARDED] area={}".format(area))
-                continue
-
-            # compute the aspect ratio of the contour, which is simply the width
-            # divided by the height of the bounding box
-            aspectRatio = w / float(h)
-
-            # if the aspect ratio is approximately one, then the shape is a
-            # circle or square
-            if aspectRatio >= 0.35 and aspectRatio <= 1.71:
-                print("[INFO] cnts[{}] aspectRatio={} area={}".format(i, aspectRatio, area))
-                filteredCnts.append(c)
-                i += 1
-
-            # otherwise, discard
-            else:
-                print("[INFO] cnt[DISCARDED] aspectRatio={} area={}".format(aspectRatio, area))
-
-        return filteredCnts
-
     def draw_contour(self, image, c, i):
         # compute the center of the contour area and draw a circle
         # representing the center
@@ -330,20 +341,9 @@ class BallFinder():
     def cluster_balls(self, balls, clusters=3, debug=False):
         print("expected clusters = {}".format(str(clusters)))
 
-        # initialize the image descriptor along with the image matrix
-        desc = Histogram([8, 8, 8], cv2.COLOR_BGR2LAB)
-        data = []
-
-        # loop over the input dataset of images
-        for ball in balls:
-            roi = ball.roi
-            # load the image, describe the image, then update the list of data
-            hist = desc.describe(roi)
-            data.append(hist)
-
-        # cluster the color histograms
-        clt = KMeans(n_clusters=clusters, random_state=42)
-        labels = clt.fit_predict(data)
+        # describe each ball and cluster the color histograms
+        data = self.describe_balls(balls)
+        labels = self.cluster_histograms(data, clusters)
 
         # list of stacks
         stacks = []
@@ -375,6 +375,25 @@ class BallFinder():
 
         return ballClusterIdxs
 
+    def describe_balls(self, balls):
+        # initialize the image descriptor along with the image matrix
+        desc = Histogram([8, 8, 8], cv2.COLOR_BGR2LAB)
+        data = []
+
+        # loop over the input dataset of images
+        for ball in balls:
+            roi = ball.roi
+            # load the image, describe the image, then update the list of data
+            hist = desc.describe(roi)
+            data.append(hist)
+
+        return data
+
+    def cluster_histograms(self, data, clusters):
+        # cluster the color histograms
+        clt = KMeans(n_clusters=clusters, random_state=42)
+        return clt.fit_predict(data)
+
     def assign_balls(self, balls, ballClusterIdxs):
         # sort the clusters by length
         sortedBallClusterIdxs = sorted(ballClusterIdxs, key=len)
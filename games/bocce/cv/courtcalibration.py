@@ -0,0 +1,186 @@
+# imports
+import cv2
+import imutils
+import numpy as np
+from imutils.perspective import order_points
+
+# typically we'll import modularly
+try:
+    from .warping import build_homography_maps
+    unit_test = False
+
+# otherwise, we're running main test code at the bottom of this script
+except:
+    import sys
+    import os
+    sys.path.append(os.path.abspath(os.getcwd()))
+    from games.bocce.cv.warping import build_homography_maps
+    unit_test = True
+
+# size (width, height) of the rectified top-down court image in pixels;
+# every calibrated camera is warped to this size so that pixel distances
+# are comparable across cameras
+RECTIFIED_SIZE = (600, 200)
+
+# the court must cover at least this fraction of the frame to be accepted
+MIN_COURT_AREA = 0.10
+
+
+class CourtCalibration():
+    def __init__(self, corners, frameShape, size=RECTIFIED_SIZE):
+        # corners are ordered top-left, top-right, bottom-right, bottom-left
+        self.corners = order_points(np.asarray(corners, dtype="float32"))
+        self.frameShape = frameShape[:2]
+        self.size = size
+
+        # compute the homography which maps the court corners to the
+        # corners of the top-down image
+        (w, h) = size
+        dst = np.array([
+            [0, 0],
+            [w - 1, 0],
+            [w - 1, h - 1],
+            [0, h - 1]], dtype="float32")
+        self.H = cv2.getPerspectiveTransform(self.corners, dst)
+
+        # precompute the remap tables once; warping a frame is then a
+        # single table lookup
+        (self.map1, self.map2) = build_homography_maps(self.H, size)
+
+        # court image pixels per frame pixel, to scale pixel areas (i.e.
+        # ball sizes) tuned on camera frames
+        self.areaScale = (w * h) / max(cv2.contourArea(self.corners), 1.0)
+
+    def rectify(self, frame):
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    def to_court_coordinates(self, pts):
+        # map frame (x, y) points into the rectified court coordinates
+        pts = np.asarray(pts, dtype="float32").reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(pts, self.H).reshape(-1, 2)
+
+    def to_frame_coordinates(self, pts):
+        # map rectified court (x, y) points back into the camera frame
+        pts = np.asarray(pts, dtype="float32").reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(pts, np.linalg.inv(self.H)).reshape(-1, 2)
+
+
+class CourtCalibrator():
+    def __init__(self, size=RECTIFIED_SIZE):
+        self.size = size
+
+        # calibrations are cached by camera name
+        self.calibrations = {}
+
+        # incremented whenever a calibration changes so that anything
+        # derived from the rectified courts (i.e. cached detections) can
+        # tell it is out of date
+        self.version = 0
+
+    def is_calibrated(self, camName):
+        return camName in self.calibrations
+
+    def get_calibration(self, camName):
+        return self.calibrations.get(camName)
+
+    def set_corners(self, camName, corners, frameShape):
+        # manually calibrate a camera (i.e. corners clicked by the umpire)
+        self.calibrations[camName] = CourtCalibration(corners, frameShape,
+            self.size)
+        self.version += 1
+        return self.calibrations[camName]
+
+    def set_calibration(self, camName, calibration):
+        # adopt a calibration made elsewhere, i.e. by a copy of this
+        # calibrator in a detection worker process
+        self.calibrations[camName] = calibration
+        self.version += 1
+
+    def invalidate(self, camName=None):
+        # forget one camera's calibration or all of them so that the court
+        # is detected again on demand (i.e. a camera was bumped)
+        if camName is None:
+            self.calibrations = {}
+        else:
+            self.calibrations.pop(camName, None)
+        self.version += 1
+
+    def calibrate(self, camName, frame, minHSV, maxHSV):
+        # detect the court and cache the calibration if we found it
+        corners = self.detect_court(frame, minHSV, maxHSV)
+        if corners is None:
+            print("[INFO] couldn't detect the court for camera {}".format(camName))
+            return None
+
+        print("[INFO] calibrated court for camera {}".format(camName))
+        return self.set_corners(camName, corners, frame.shape)
+
+    def rectify(self, camName, frame, minHSV, maxHSV):
+        # recalibrate if we haven't seen this camera yet or its frame size
+        # changed since calibrating
+        calibration = self.calibrations.get(camName)
+        if calibration is None or calibration.frameShape != frame.shape[:2]:
+            calibration = self.calibrate(camName, frame, minHSV, maxHSV)
+
+        # we couldn't calibrate, so let the caller fall back
+        if calibration is None:
+            return None
+
+        return calibration.rectify(frame)
+
+    def detect_court(self, frame, minHSV, maxHSV):
+        # mask the court surface via HSV
+        imageHSV = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        courtMask = cv2.inRange(imageHSV, minHSV, maxHSV)
+
+        # close the holes that the balls and players leave in the court
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+        courtMask = cv2.morphologyEx(courtMask, cv2.MORPH_CLOSE, kernel,
+            iterations=2)
+
+        # the court is the largest contour
+        cnts = cv2.findContours(courtMask, cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE)
+        cnts = imutils.grab_contours(cnts)
+        if len(cnts) == 0:
+            return None
+        c = max(cnts, key=cv2.contourArea)
+
+        # reject contours which are too small to be the court
+        (h, w) = frame.shape[:2]
+        if cv2.contourArea(c) < MIN_COURT_AREA * h * w:
+            return None
+
+        # approximate the contour with a quadrilateral, loosening the
+        # approximation until we have four corners
+        peri = cv2.arcLength(c, True)
+        for eps in (0.01, 0.02, 0.03, 0.04, 0.05):
+            approx = cv2.approxPolyDP(c, eps * peri, True)
+            if len(approx) == 4:
+                return approx.reshape(4, 2).astype("float32")
+
+        # otherwise, fall back to the minimum area rectangle
+        return cv2.boxPoints(cv2.minAreaRect(c)).astype("float32")
+
+
+# test code
+def test_static_image():
+    # load an image
+    frame = cv2.imread("exploratory_code/assets/court.png")
+
+    # calibrate and rectify using the default BallFinder court HSV range
+    cc = CourtCalibrator()
+    court = cc.rectify("test", frame, (72, 0, 134), (175, 66, 223))
+    if court is None:
+        print("[INFO] court detection failed")
+        return
+
+    # display until keypress
+    print(cc.get_calibration("test").corners)
+    cv2.imshow("rectified", court)
+    cv2.waitKey(0)
+
+
+# run the test code
+if __name__ == "__main__":
+    test_static_image()
@@ -0,0 +1,243 @@
+# imports
+import cv2
+import copy
+import hashlib
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# typically we'll import modularly
+try:
+    from .ballfinder import BallFinder
+    unit_test = False
+
+# otherwise, we're running main test code at the bottom of this script
+except:
+    import sys
+    import os
+    sys.path.append(os.path.abspath(os.getcwd()))
+    from games.bocce.cv.ballfinder import BallFinder
+    unit_test = True
+
+
+class Detection():
+    """
+    The result of a ball detection: the pallino and each team's balls. Use
+    compact() to drop the ball images before sending it to another process
+    or holding on to it.
+    """
+    def __init__(self, pallino, homeBalls, awayBalls, camName=None,
+        frameSequence=None, calibration=None):
+        self.pallino = pallino
+        self.homeBalls = homeBalls
+        self.awayBalls = awayBalls
+
+        # which camera frame the balls were detected in
+        self.camName = camName
+        self.frameSequence = frameSequence
+
+        # the court calibration a worker process used, so the parent can
+        # cache it instead of calibrating again (see detect_balls)
+        self.calibration = calibration
+
+    def balls(self):
+        return (self.pallino, self.homeBalls, self.awayBalls)
+
+    def compact(self):
+        # a copy without the ball ROIs
+        detection = copy.copy(self)
+        (detection.pallino, detection.homeBalls, detection.awayBalls) = \
+            strip_rois(self.balls())
+        return detection
+
+
+def strip_rois(balls):
+    # copy (pallino, homeBalls, awayBalls) without the ball images
+    def strip(ball):
+        if ball is None:
+            return None
+        roi = ball.roi
+        ball.roi = None
+        stripped = copy.deepcopy(ball)
+        ball.roi = roi
+        return stripped
+
+    (pallino, homeBalls, awayBalls) = balls
+    return (strip(pallino), [strip(b) for b in homeBalls],
+        [strip(b) for b in awayBalls])
+
+
+class DetectionCache():
+    """
+    A small LRU cache of candidate balls so that analyzing the same frame
+    with the same throw counts again (i.e. from the scorer and the UI) skips
+    the detector. Frames are identified by their camera and frame sequence
+    number or, without one, by a hash of a downsampled copy. The detector
+    keeps (and refines) as many candidates as balls are expected, so that
+    is part of the key too. Each lookup creates and clusters the balls
+    again, which gives every caller its own balls to mark as thrown.
+    """
+    def __init__(self, maxSize=32, hashWidth=64):
+        self.maxSize = maxSize
+        self.hashWidth = hashWidth
+        self.detections = OrderedDict()
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, frame, camName=None, frameSequence=None, params=()):
+        # the frame sequence number identifies a camera frame exactly;
+        # otherwise hash a downsampled copy of the frame
+        if frameSequence is not None:
+            return (camName, "seq", frameSequence, params)
+        (h, w) = frame.shape[:2]
+        small = cv2.resize(frame, (self.hashWidth,
+            max(int(h * self.hashWidth / float(w)), 1)),
+            interpolation=cv2.INTER_AREA)
+        digest = hashlib.sha1(small.tobytes()).hexdigest()
+        return (camName, "hash", digest, params)
+
+    def get(self, key):
+        if key not in self.detections:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.detections.move_to_end(key)
+        return self.detections[key]
+
+    def put(self, key, candidates):
+        self.detections[key] = candidates
+        self.detections.move_to_end(key)
+        while len(self.detections) > self.maxSize:
+            self.detections.popitem(last=False)
+
+    def detect(self, finder, frame, throwsHome, throwsAway, camName=None,
+        frameSequence=None):
+        # slice out the court first; it may (re)calibrate the camera, which
+        # changes the calibration version in the key
+        court = finder.slice_court(frame, camName)
+        version = None if finder.calibrator is None \
+            else finder.calibrator.version
+        expectedBalls = 1 + throwsHome + throwsAway
+        params = (type(finder.detector).__name__, tuple(finder.minHSV),
+            tuple(finder.maxHSV), version, expectedBalls)
+
+        # run the detector unless we've seen this frame with the same
+        # parameters before
+        key = self.key(frame, camName, frameSequence, params)
+        candidates = self.get(key)
+        if candidates is None:
+            candidates = finder.detector.detect(court, expectedBalls, camName,
+                areaScale=finder.areaScale)
+            self.put(key, candidates)
+
+        # create, cluster and assign the balls for the current counts
+        (cnts, ballMask) = candidates
+        finder.find_balls(court, ballMask, cnts, throwsHome, throwsAway)
+        return Detection(finder.pallino, finder.homeBalls, finder.awayBalls,
+            camName, frameSequence)
+
+    def clear(self):
+        self.detections = OrderedDict()
+
+    def __len__(self):
+        return len(self.detections)
+
+
+def detect_balls(frame, throwsHome, throwsAway, camName=None,
+    calibrator=None, minHSV=None, maxHSV=None, frameSequence=None,
+    detector=None, refiner=None):
+    # runs in a worker process, so it must never open a window
+    bf = BallFinder(calibrator=calibrator, debug=False, detector=detector,
+        refiner=refiner)
+    if minHSV is not None and maxHSV is not None:
+        bf.adjust_HSV_ranges(minHSV, maxHSV)
+    bf.pipeline(frame, throwsHome, throwsAway, camName=camName)
+
+    # drop the ball ROIs so that only coordinates and colors are pickled
+    # back to the parent process; the calibrator is a copy in this process,
+    # so send back the calibration it used as well
+    detection = Detection(bf.pallino, bf.homeBalls, bf.awayBalls, camName,
+        frameSequence).compact()
+    if calibrator is not None:
+        detection.calibration = calibrator.get_calibration(camName)
+    return detection
+
+
+def warmup():
+    # importing OpenCV, scipy and sklearn is the slow part of starting a
+    # worker, so do it before the first throw
+    return True
+
+
+class DetectionExecutor():
+    """
+    Runs ball detection in a pool of worker processes so that a throw never
+    blocks the GUI. Each submission works on its own snapshot of the frame
+    and returns a future. A newer submission makes the pending one stale:
+    it is cancelled if it hasn't started yet, and its result should be
+    ignored (see is_stale) if it has.
+    """
+    def __init__(self, maxWorkers=1):
+        # spawn (rather than fork) the workers; forking a process which is
+        # running a Qt event loop and camera threads isn't safe
+        self.pool = ProcessPoolExecutor(max_workers=maxWorkers,
+            mp_context=mp.get_context("spawn"))
+        self.pending = None
+        self.generation = 0
+
+    def warmup(self):
+        # start the worker processes ahead of time
+        return self.pool.submit(warmup)
+
+    def submit(self, frame, throwsHome, throwsAway, camName=None,
+        calibrator=None, minHSV=None, maxHSV=None, frameSequence=None,
+        detector=None, refiner=None):
+        # a newer frame supersedes whatever we were detecting before
+        self.cancel()
+
+        # snapshot the frame so the camera can keep overwriting its buffer
+        self.generation += 1
+        future = self.pool.submit(detect_balls, frame.copy(), throwsHome,
+            throwsAway, camName, calibrator, minHSV, maxHSV, frameSequence,
+            detector, refiner)
+        future.generation = self.generation
+        self.pending = future
+        return future
+
+    def cancel(self):
+        # cancel the pending detection; this only succeeds if a worker
+        # hasn't picked it up yet, otherwise its result is ignored when
+        # it arrives
+        if self.pending is not None and not self.pending.done():
+            self.pending.cancel()
+        self.pending = None
+        self.generation += 1
+
+    def is_stale(self, future):
+        return future.cancelled() or future.generation != self.generation
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self.pool.shutdown(wait=wait)
+
+
+# test code
+if __name__ == "__main__":
+    import time
+
+    # load an image
+    court = cv2.imread("exploratory_code/assets/court.png")
+
+    # detect the balls without blocking this process
+    executor = DetectionExecutor()
+    executor.warmup().result()
+    start = time.time()
+    future = executor.submit(court, 2, 2)
+    while not future.done():
+        time.sleep(0.01)
+    detection = future.result()
+    print("[INFO] detection took {:.2f} seconds".format(time.time() - start))
+    print(detection.balls())
+    executor.shutdown(wait=True)
@@ -0,0 +1,407 @@
+# imports
+import os
+import cv2
+import imutils
+import numpy as np
+
+# learned detectors are loaded from here so that they work offline
+MODEL_DIR = "models"
+DNN_MODEL = os.path.join(MODEL_DIR, "balls.onnx")
+
+# COCO "sports ball" class ids as numbered by the TensorFlow object
+# detection models (SSD) and by YOLO; a stock COCO model (see DNNDetector's
+# coco option) only keeps these
+COCO_SPORTS_BALL_SSD = 37
+COCO_SPORTS_BALL_YOLO = 32
+
+# contours larger than this many pixels of the camera frame aren't balls;
+# detectors scale it to the court image they are given (see areaScale)
+MAX_BALL_AREA = 1000
+
+
+def circle_contour(center, radius):
+    # approximate a circle with a contour so that circle detections go
+    # through the same ball extraction as HSV contours
+    center = (int(round(center[0])), int(round(center[1])))
+    radius = max(int(round(radius)), 1)
+    pts = cv2.ellipse2Poly(center, (radius, radius), 0, 0, 360, 10)
+    return pts.reshape(-1, 1, 2).astype("int32")
+
+
+# learned models loaded in this process, keyed by their paths, so that a
+# detector sent to a worker process only loads its model once there
+NETS = {}
+
+
+def load_net(modelPath, configPath=None):
+    key = (modelPath, configPath)
+    if key not in NETS:
+        if configPath is None:
+            net = cv2.dnn.readNet(modelPath)
+        else:
+            net = cv2.dnn.readNet(modelPath, configPath)
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        NETS[key] = net
+    return NETS[key]
+
+
+class BallDetector():
+    """
+    Finds candidate balls in (rectified) court images. Detectors return the
+    candidates as contours, largest or most confident first, along with the
+    ball mask if they have one. Any detector can have its candidates refined
+    with a GrabCutRefiner.
+    """
+    refiner = None
+
+    def detect(self, court, expectedBalls, camName=None, areaScale=1.0):
+        # areaScale is the number of court image pixels per camera frame
+        # pixel, i.e. from rectifying the court (see CourtCalibration)
+        return self.detect_batch([court], expectedBalls, [camName],
+            [areaScale])[0]
+
+    def detect_batch(self, courts, expectedBalls, camNames=None,
+        areaScales=None):
+        # detectors which can't batch just run one court at a time
+        if camNames is None:
+            camNames = [None] * len(courts)
+        if areaScales is None:
+            areaScales = [1.0] * len(courts)
+        return [self._detect(court, expectedBalls, camName, areaScale)
+            for (court, camName, areaScale) in zip(courts, camNames,
+                areaScales)]
+
+    def _detect(self, court, expectedBalls, camName=None, areaScale=1.0):
+        raise NotImplementedError
+
+    def warmup(self):
+        pass
+
+    def refine_candidates(self, court, cnts, ballMask=None, camName=None):
+        # detectors without a mask (i.e. boxes from a network) start GrabCut
+        # from their filled candidate circles
+        if ballMask is None:
+            ballMask = np.zeros(court.shape[:2], dtype="uint8")
+            cv2.drawContours(ballMask, cnts, -1, 255, -1)
+        ballMask = self.refiner.refine(court, ballMask, cnts, camName)
+
+        # keep the candidates' order, but take each one's shape from the
+        # refined pixels inside its circle which are nearer to it than to
+        # any other candidate, so touching balls stay apart
+        circles = [cv2.minEnclosingCircle(c) for c in cnts]
+        if len(circles) > 0:
+            (yy, xx) = np.indices(ballMask.shape)
+            nearest = np.argmin([(xx - cX) ** 2 + (yy - cY) ** 2
+                for ((cX, cY), radius) in circles], axis=0)
+        refined = []
+        for (i, (c, ((cX, cY), radius))) in enumerate(zip(cnts, circles)):
+            own = np.zeros(ballMask.shape, dtype="uint8")
+            cv2.circle(own, (int(cX), int(cY)), int(radius * 1.2) + 1, 255, -1)
+            own[nearest != i] = 0
+            found = cv2.findContours(cv2.bitwise_and(ballMask, own),
+                cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            found = imutils.grab_contours(found)
+            if len(found) == 0:
+                refined.append(c)
+            else:
+                refined.append(max(found, key=cv2.contourArea))
+
+        return (refined, ballMask)
+
+
+class HSVDetector(BallDetector):
+    """
+    The classic pipeline: mask out the court by color, optionally refine the
+    ball mask with GrabCut, and keep the roughly round contours.
+    """
+    def __init__(self, minHSV=(72, 0, 134), maxHSV=(175, 66, 223),
+        refiner=None, debug=False):
+        self.minHSV = minHSV
+        self.maxHSV = maxHSV
+        self.refiner = refiner
+        self.debug = debug
+
+    def _detect(self, court, expectedBalls, camName=None, areaScale=1.0):
+        # the largest ball area in this court image's pixels
+        maxArea = MAX_BALL_AREA * areaScale
+
+        # (1) Mask court via HSV
+        ballMask = self.mask_out_court(court, self.minHSV, self.maxHSV)
+        if self.debug:
+            cv2.imshow("ballMask", ballMask)
+            cv2.waitKey(0)
+
+        # (2) Grabcut via ball mask (opposite of court mask), but only in
+        # the ROIs around the candidate balls
+        if self.refiner is not None:
+            cnts = self.find_and_sort_ball_contours(ballMask, expectedBalls)
+            cnts = self.filter_contours(cnts, maxArea)
+            ballMask = self.refiner.refine(court, ballMask, cnts, camName)
+            if self.debug:
+                cv2.imshow("refined ballMask", ballMask)
+                cv2.waitKey(0)
+
+        # (3) Find contours
+        cnts = self.find_and_sort_ball_contours(ballMask, expectedBalls)
+
+        # (4) Filter contours based on (A) Aspect Ratio and (B) Area
+        cnts = self.filter_contours(cnts, maxArea)
+
+        return (cnts, ballMask)
+
+    def mask_out_court(self, frame, minHSV, maxHSV):
+        return self.morph(self.mask_court(frame, minHSV, maxHSV))
+
+    def mask_court(self, frame, minHSV, maxHSV):
+        # convert image to HSV
+        imageHSV = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+        # calculate the court mask and display it until keypress
+        courtMask = cv2.inRange(imageHSV, minHSV, maxHSV)
+
+        ballMask = cv2.bitwise_not(courtMask)
+        # cv2.imshow("ball mask", ballMask)
+        return ballMask
+
+    def morph(self, ballMask):
+        # apply "opening" (series of erosions followed by dilation) to
+        # eliminate salt and pepper noise and display it until keypress
+        # morphed = cv2.morphologyEx(ballMask, cv2.MORPH_OPEN, kernel, iterations=3)
+        morphed = cv2.erode(ballMask, (3, 3), iterations=6)
+        morphed = cv2.dilate(morphed, (3, 3), iterations=6)
+        morphed = cv2.erode(morphed, (3, 3), iterations=1)
+
+        return morphed
+
+    def find_and_sort_ball_contours(self, ballMask, expectedBalls):
+        # find contours in the image, keeping only the EXTERNAL contours in
+        # the image
+        cnts = cv2.findContours(ballMask.copy(), cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)
+        cnts = imutils.grab_contours(cnts)
+        # print("Found {} EXTERNAL contours".format(len(cnts)))
+
+        # sort the 1:1 aspect ratio contours according to size
+        cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:expectedBalls + 1]
+
+        return cnts
+
+    def filter_contours(self, cnts, maxArea=MAX_BALL_AREA):
+        # loop over the contours to eliminate non 1:1 aspect ratio balls
+        filteredCnts = []
+        i = 0
+        for c in cnts:
+            # compute the area of the contour along with the bounding box
+            # to compute the aspect ratio
+            area = cv2.contourArea(c)
+            (x, y, w, h) = cv2.boundingRect(c)
+            if area > maxArea:
+                print("[INFO] cnt[DISCARDED] area={}".format(area))
+                continue
+
+            # compute the aspect ratio of the contour, which is simply the width
+            # divided by the height of the bounding box
+            aspectRatio = w / float(h)
+
+            # if the aspect ratio is approximately one, then the shape is a
+            # circle or square
+            if aspectRatio >= 0.35 and aspectRatio <= 1.71:
+                print("[INFO] cnts[{}] aspectRatio={} area={}".format(i, aspectRatio, area))
+                filteredCnts.append(c)
+                i += 1
+
+            # otherwise, discard
+            else:
+                print("[INFO] cnt[DISCARDED] aspectRatio={} area={}".format(aspectRatio, area))
+
+        return filteredCnts
+
+
+class DNNDetector(BallDetector):
+    """
+    A learned ball detector run on the CPU with OpenCV's DNN module, so it
+    works with ONNX (i.e. YOLO) and TensorFlow/Caffe (i.e. SSD) models
+    without installing a deep learning framework. The model is loaded once
+    from a local file, courts are letterboxed to the network's input size,
+    and all the courts passed to detect_batch go through the network in a
+    single forward pass. With coco=True a stock COCO model can be used; only
+    its sports balls are kept.
+    """
+    def __init__(self, modelPath=DNN_MODEL, configPath=None,
+        inputSize=(320, 320), confidence=0.4, nmsThreshold=0.45,
+        classIds=None, scale=1 / 255.0, mean=(0, 0, 0), swapRB=True,
+        refiner=None, coco=False):
+        if not os.path.exists(modelPath):
+            raise IOError("ball detection model not found: {} (export one "
+                "there, pass modelPath or use the \"hsv\" detector)".format(
+                os.path.abspath(modelPath)))
+
+        # load the network once
+        self.modelPath = modelPath
+        self.configPath = configPath
+        self.net = load_net(modelPath, configPath)
+
+        # network input (width, height) and preprocessing
+        self.inputSize = tuple(inputSize)
+        self.scale = scale
+        self.mean = mean
+        self.swapRB = swapRB
+
+        # only keep confident detections of these classes (None keeps
+        # every class, i.e. for a model trained on balls only); a COCO
+        # model only keeps the sports ball class
+        self.confidence = confidence
+        self.nmsThreshold = nmsThreshold
+        self.classIds = classIds
+        self.coco = coco
+
+        # models exported with a fixed batch size of one can't batch, so we
+        # fall back to one forward pass per court
+        self.batching = True
+
+        # optionally refine the ball shapes with GrabCut
+        self.refiner = refiner
+
+    def __getstate__(self):
+        # the network can't be pickled; a worker process loads it again
+        state = self.__dict__.copy()
+        state["net"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.net = load_net(self.modelPath, self.configPath)
+
+    def warmup(self):
+        # the first forward pass allocates and initializes the network, so
+        # do it before the first throw
+        (w, h) = self.inputSize
+        self.detect_batch([np.zeros((h, w, 3), dtype="uint8")], 1)
+
+    def letterbox(self, image):
+        # resize the image to fit the network input without changing its
+        # aspect ratio and pad the rest with gray
+        (w, h) = self.inputSize
+        (iH, iW) = image.shape[:2]
+        scale = min(w / float(iW), h / float(iH))
+        (nW, nH) = (int(round(iW * scale)), int(round(iH * scale)))
+        (padX, padY) = ((w - nW) // 2, (h - nH) // 2)
+        boxed = np.full((h, w, 3), 114, dtype="uint8")
+        boxed[padY:padY + nH, padX:padX + nW] = cv2.resize(image, (nW, nH),
+            interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        return (boxed, scale, (padX, padY))
+
+    def detect_batch(self, courts, expectedBalls, camNames=None,
+        areaScales=None):
+        letterboxed = [self.letterbox(court) for court in courts]
+        images = [boxed for (boxed, scale, pad) in letterboxed]
+
+        # run every court through the network at once if we can
+        outputs = None
+        if self.batching and len(images) > 1:
+            try:
+                outputs = self.forward(images)
+            except cv2.error:
+                self.batching = False
+        if outputs is None:
+            outputs = [self.forward([image])[0] for image in images]
+
+        if camNames is None:
+            camNames = [None] * len(courts)
+        results = []
+        for (output, (boxed, scale, pad), court, camName) in zip(outputs,
+            letterboxed, courts, camNames):
+            boxes = self.decode(output)
+            cnts = self.to_contours(boxes, scale, pad, court.shape,
+                expectedBalls)
+            if self.refiner is not None:
+                results.append(self.refine_candidates(court, cnts,
+                    camName=camName))
+            else:
+                results.append((cnts, None))
+        return results
+
+    def forward(self, images):
+        blob = cv2.dnn.blobFromImages(images, self.scale, self.inputSize,
+            self.mean, swapRB=self.swapRB, crop=False)
+        self.net.setInput(blob)
+        output = self.net.forward()
+
+        # SSD models put every image's detections in one [1, 1, N, 7] array
+        # tagged with the image index
+        if output.ndim == 4 and output.shape[-1] == 7:
+            detections = output.reshape(-1, 7)
+            return [detections[detections[:, 0] == i]
+                for i in range(len(images))]
+
+        # YOLO models output [batch, N, 5 + classes]
+        return [output[i] for i in range(len(images))]
+
+    def decode(self, output):
+        # returns a list of (x, y, w, h) boxes in network input pixels
+        (w, h) = self.inputSize
+        boxes = []
+        scores = []
+
+        if output.shape[-1] == 7:
+            # SSD: [imageId, classId, confidence, x1, y1, x2, y2] with
+            # coordinates relative to the input size
+            for (imageId, classId, score, x1, y1, x2, y2) in output:
+                if score < self.confidence or not self.keep(int(classId),
+                    COCO_SPORTS_BALL_SSD):
+                    continue
+                boxes.append([x1 * w, y1 * h, (x2 - x1) * w, (y2 - y1) * h])
+                scores.append(float(score))
+        else:
+            # YOLO: [cX, cY, w, h, objectness, class scores...] in pixels
+            for row in output.reshape(-1, output.shape[-1]):
+                classId = int(np.argmax(row[5:])) if len(row) > 5 else 0
+                score = float(row[4] * (row[5 + classId] if len(row) > 5 else 1))
+                if score < self.confidence or not self.keep(classId,
+                    COCO_SPORTS_BALL_YOLO):
+                    continue
+                (cX, cY, bW, bH) = row[:4]
+                boxes.append([cX - bW / 2.0, cY - bH / 2.0, bW, bH])
+                scores.append(score)
+
+        # suppress overlapping detections of the same ball, most confident
+        # first
+        if len(boxes) == 0:
+            return []
+        idxs = cv2.dnn.NMSBoxes(boxes, scores, self.confidence,
+            self.nmsThreshold)
+        idxs = sorted(np.array(idxs).reshape(-1), key=lambda i: -scores[i])
+        return [boxes[i] for i in idxs]
+
+    def keep(self, classId, sportsBall):
+        # sportsBall is the COCO sports ball class id as the model numbers it
+        if self.coco:
+            return classId == sportsBall
+        return self.classIds is None or classId in self.classIds
+
+    def to_contours(self, boxes, scale, pad, shape, expectedBalls):
+        # undo the letterboxing and turn each box into a circular contour
+        (h, w) = shape[:2]
+        cnts = []
+        for (x, y, bW, bH) in boxes[:expectedBalls + 1]:
+            cX = (x + bW / 2.0 - pad[0]) / scale
+            cY = (y + bH / 2.0 - pad[1]) / scale
+            radius = min(bW, bH) / 2.0 / scale
+            if 0 <= cX < w and 0 <= cY < h:
+                cnts.append(circle_contour((cX, cY), radius))
+        return cnts
+
+
+DETECTORS = {
+    "hsv": HSVDetector,
+    "dnn": DNNDetector,
+}
+
+
+def get_detector(name="hsv", *args, **kwargs):
+    if name not in DETECTORS:
+        raise ValueError("unknown ball detector '{}', must be one of {}".format(
+            name, ", ".join(sorted(DETECTORS))))
+
+    return DETECTORS[name](*args, **kwargs)
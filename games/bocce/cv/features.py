@@ -0,0 +1,99 @@
+# imports
+import cv2
+import numpy as np
+
+
+class FeatureBackend():
+    # binary descriptors are compared with the Hamming distance and float
+    # descriptors with the L2 distance
+    normType = cv2.NORM_L2
+
+    def __init__(self):
+        self.descriptor = self.create()
+
+    def create(self):
+        raise NotImplementedError
+
+    def detectAndDescribe(self, image):
+        # convert the image to grayscale
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        # detect and extract features from the image
+        (kps, features) = self.descriptor.detectAndCompute(gray, None)
+
+        # convert the keypoints from KeyPoint objects to NumPy
+        # arrays
+        kps = np.float32([kp.pt for kp in kps])
+
+        # return a tuple of keypoints and features
+        return (kps, features)
+
+    def match(self, featuresA, featuresB, ratio):
+        # we need at least two candidates in B for the ratio test
+        if featuresA is None or featuresB is None or len(featuresB) < 2:
+            return (np.empty(0, dtype="int"), np.empty(0, dtype="int"))
+
+        # find the two nearest neighbors in B for every feature in A in
+        # one brute force call
+        dtype = cv2.CV_32S if self.normType == cv2.NORM_HAMMING else cv2.CV_32F
+        (dists, nidx) = cv2.batchDistance(featuresA, featuresB, dtype,
+            normType=self.normType, K=2)
+
+        # ensure the distance is within a certain ratio of each
+        # other (i.e. Lowe's ratio test), for all matches at once
+        good = dists[:, 0] < dists[:, 1] * ratio
+
+        # return the indexes of the matched features in A and in B
+        return (np.flatnonzero(good), nidx[good, 0])
+
+
+class ORBBackend(FeatureBackend):
+    normType = cv2.NORM_HAMMING
+
+    def __init__(self, nfeatures=2000):
+        self.nfeatures = nfeatures
+        super(ORBBackend, self).__init__()
+
+    def create(self):
+        return cv2.ORB_create(nfeatures=self.nfeatures)
+
+
+class AKAZEBackend(FeatureBackend):
+    normType = cv2.NORM_HAMMING
+
+    def create(self):
+        return cv2.AKAZE_create()
+
+
+class SIFTBackend(FeatureBackend):
+    normType = cv2.NORM_L2
+
+    def create(self):
+        # SIFT moved into the main module in OpenCV 4.4; older builds only
+        # have it in the contrib package
+        if hasattr(cv2, "SIFT_create"):
+            return cv2.SIFT_create()
+        return cv2.xfeatures2d.SIFT_create()
+
+    @staticmethod
+    def is_available():
+        return hasattr(cv2, "SIFT_create") or hasattr(cv2, "xfeatures2d")
+
+
+FEATURE_BACKENDS = {
+    "orb": ORBBackend,
+    "akaze": AKAZEBackend,
+    "sift": SIFTBackend,
+}
+
+
+def get_feature_backend(name=None):
+    # default to SIFT when this OpenCV build has it, otherwise ORB
+    if name is None:
+        name = "sift" if SIFTBackend.is_available() else "orb"
+
+    if name not in FEATURE_BACKENDS:
+        raise ValueError("unknown feature backend '{}', must be one of {}".format(
+            name, ", ".join(sorted(FEATURE_BACKENDS))))
+
+    return FEATURE_BACKENDS[name]()
@@ -0,0 +1,161 @@
+# imports
+import cv2
+import os
+import numpy as np
+
+# typically we'll import modularly
+try:
+    from .warping import build_homography_maps
+    from .pyimagesearch.panorama import Stitcher
+    unit_test = False
+
+# otherwise, we're running main test code at the bottom of this script
+except:
+    import sys
+    sys.path.append(os.path.abspath(os.getcwd()))
+    from games.bocce.cv.warping import build_homography_maps
+    from games.bocce.cv.pyimagesearch.panorama import Stitcher
+    unit_test = True
+
+# calibrated homographies are saved here and loaded at startup
+CALIBRATION_DIR = "calibration"
+PANORAMA_CALIBRATION = os.path.join(CALIBRATION_DIR, "panorama.npz")
+
+
+class PanoramaEngine():
+    """
+    Composes N camera frames into a single panorama. The remap tables and
+    seam masks are computed once from the homographies; each frame is then
+    warped straight into a preallocated canvas in a single pass.
+    """
+    def __init__(self, homographies, frameSize):
+        # homographies map each camera's frame into the coordinate system of
+        # the first (reference) camera; frames are supplied in the same
+        # left-to-right order
+        self.homographies = [np.asarray(H, dtype="float64") for H in homographies]
+        self.frameSize = frameSize
+
+        # per camera (x, y, w, h) canvas rectangle, remap tables, seam mask
+        # and warp buffer
+        self.rois = []
+        self.maps = []
+        self.masks = []
+        self.buffers = []
+
+        self.canvas = None
+        self.build()
+
+    def build(self):
+        (w, h) = self.frameSize
+        corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        center = np.float32([[w / 2.0, h / 2.0]]).reshape(-1, 1, 2)
+
+        # project each camera's corners to find the canvas bounds
+        projected = [cv2.perspectiveTransform(corners, H) for H in self.homographies]
+        allCorners = np.concatenate(projected).reshape(-1, 2)
+        (minX, minY) = np.floor(allCorners.min(axis=0)).astype("int")
+        (maxX, maxY) = np.ceil(allCorners.max(axis=0)).astype("int")
+        (canvasW, canvasH) = (int(maxX - minX), int(maxY - minY))
+
+        # translate everything so the canvas starts at (0, 0)
+        T = np.array([[1, 0, -minX], [0, 1, -minY], [0, 0, 1]], dtype="float64")
+        self.homographies = [T.dot(H) for H in self.homographies]
+
+        # each canvas pixel is owned by the camera whose (projected) center is
+        # closest among the cameras which see that pixel; this gives us seams
+        # halfway between neighboring cameras
+        (xs, ys) = np.meshgrid(np.arange(canvasW, dtype="float32"),
+                               np.arange(canvasH, dtype="float32"))
+        distances = np.full((len(self.homographies), canvasH, canvasW),
+            np.inf, dtype="float32")
+        coverageMask = np.full((h, w), 255, dtype="uint8")
+        for (i, H) in enumerate(self.homographies):
+            covered = cv2.warpPerspective(coverageMask, H, (canvasW, canvasH),
+                flags=cv2.INTER_NEAREST) > 0
+            (cX, cY) = cv2.perspectiveTransform(center, H).reshape(2)
+            d = (xs - cX) ** 2 + (ys - cY) ** 2
+            distances[i][covered] = d[covered]
+        owner = np.argmin(distances, axis=0)
+        owner[np.isinf(distances.min(axis=0))] = -1
+
+        # build the remap tables for just the rectangle each camera owns
+        self.rois, self.maps, self.masks, self.buffers = [], [], [], []
+        for (i, H) in enumerate(self.homographies):
+            seam = (owner == i).astype("uint8")
+            (x, y, rW, rH) = cv2.boundingRect(seam)
+            self.rois.append((x, y, rW, rH))
+            if rW == 0 or rH == 0:
+                self.maps.append(None)
+                self.masks.append(None)
+                self.buffers.append(None)
+                continue
+            self.maps.append(build_homography_maps(H, (rW, rH), origin=(x, y)))
+            self.masks.append(seam[y:y + rH, x:x + rW, np.newaxis] > 0)
+            self.buffers.append(np.zeros((rH, rW, 3), dtype="uint8"))
+
+        # preallocate the output canvas
+        self.canvas = np.zeros((canvasH, canvasW, 3), dtype="uint8")
+
+    def compose(self, frames):
+        # NOTE: the returned canvas is reused for the next call, so copy it if
+        # you need to hold onto it
+        if len(frames) != len(self.homographies):
+            raise ValueError("expected {} frames, got {}".format(
+                len(self.homographies), len(frames)))
+
+        for (i, frame) in enumerate(frames):
+            # skip cameras which don't contribute to the panorama
+            if self.maps[i] is None:
+                continue
+
+            if (frame.shape[1], frame.shape[0]) != tuple(self.frameSize):
+                raise ValueError("frame {} has size {}, expected {}".format(
+                    i, frame.shape[1::-1], self.frameSize))
+
+            # warp the camera's seam rectangle and copy it into the canvas
+            (x, y, w, h) = self.rois[i]
+            (map1, map2) = self.maps[i]
+            cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, dst=self.buffers[i])
+            np.copyto(self.canvas[y:y + h, x:x + w], self.buffers[i],
+                where=self.masks[i])
+
+        return self.canvas
+
+    def save(self, path=PANORAMA_CALIBRATION):
+        # persist the homographies so we can skip calibration at startup
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        np.savez(path, homographies=np.array(self.homographies),
+            frameSize=np.array(self.frameSize))
+
+    @classmethod
+    def load(cls, path=PANORAMA_CALIBRATION):
+        # load previously calibrated homographies if there are any
+        if not os.path.exists(path):
+            return None
+        data = np.load(path)
+        frameSize = tuple(int(v) for v in data["frameSize"])
+        return cls(list(data["homographies"]), frameSize)
+
+    @classmethod
+    def calibrate(cls, frames, stitcher=None, ratio=0.75, reprojThresh=4.0):
+        # estimate the homography between each pair of neighboring frames
+        # and chain them together so they map into the first frame
+        if stitcher is None:
+            stitcher = Stitcher()
+        homographies = [np.eye(3)]
+        for (frameB, frameA) in zip(frames[:-1], frames[1:]):
+            (kpsA, featuresA) = stitcher.detectAndDescribe(frameA)
+            (kpsB, featuresB) = stitcher.detectAndDescribe(frameB)
+            M = stitcher.matchKeypoints(kpsA, kpsB, featuresA, featuresB,
+                ratio, reprojThresh)
+
+            # if the match is None, then there aren't enough matched
+            # keypoints to create a panorama
+            if M is None or M[1] is None:
+                return None
+            homographies.append(homographies[-1].dot(M[1]))
+
+        (h, w) = frames[0].shape[:2]
+        return cls(homographies, (w, h))
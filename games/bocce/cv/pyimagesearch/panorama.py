@@ -1,15 +1,20 @@
 # import the necessary packages
 import numpy as np
-import imutils
 import cv2
+import os
+from ..features import get_feature_backend
 
 class Stitcher:
-	def __init__(self):
-		# determine if we are using OpenCV v3.X and initialize the
-		# cached homography matrix
-		self.isv3 = imutils.is_cv3(or_better=True)
+	def __init__(self, featureBackend=None):
+		# initialize the cached homography matrix
 		self.cachedH = None
 
+		# the feature backend is "orb", "akaze", "sift" or a backend
+		# object; by default SIFT is used when it is available
+		if featureBackend is None or isinstance(featureBackend, str):
+			featureBackend = get_feature_backend(featureBackend)
+		self.featureBackend = featureBackend
+
 	def stitch(self, imagePair, ratio=0.75, reprojThresh=4.0):
 		# unpack the images
 		(imageB, imageA) = imagePair
@@ -43,52 +48,20 @@ class Stitcher:
 		return result
 
 	def detectAndDescribe(self, image):
-		# convert the image to grayscale
-		gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-		# check to see if we are using OpenCV 3.X
-		if self.isv3:
-			# detect and extract features from the image
-			descriptor = cv2.xfeatures2d.SIFT_create()
-			(kps, features) = descriptor.detectAndCompute(image, None)
-
-		# otherwise, we are using OpenCV 2.4.X
-		else:
-			# detect keypoints in the image
-			detector = cv2.FeatureDetector_create("SIFT")
-			kps = detector.detect(gray)
-
-			# extract features from the image
-			extractor = cv2.DescriptorExtractor_create("SIFT")
-			(kps, features) = extractor.compute(gray, kps)
-
-		# convert the keypoints from KeyPoint objects to NumPy
-		# arrays
-		kps = np.float32([kp.pt for kp in kps])
-
-		# return a tuple of keypoints and features
-		return (kps, features)
+		# detect keypoints and extract features with the feature backend
+		return self.featureBackend.detectAndDescribe(image)
 
 	def matchKeypoints(self, kpsA, kpsB, featuresA, featuresB,
 		ratio, reprojThresh):
-		# compute the raw matches and initialize the list of actual
-		# matches
-		matcher = cv2.DescriptorMatcher_create("BruteForce")
-		rawMatches = matcher.knnMatch(featuresA, featuresB, 2)
-		matches = []
-
-		# loop over the raw matches
-		for m in rawMatches:
-			# ensure the distance is within a certain ratio of each
-			# other (i.e. Lowe's ratio test)
-			if len(m) == 2 and m[0].distance < m[1].distance * ratio:
-				matches.append((m[0].trainIdx, m[0].queryIdx))
+		# compute the matches which pass Lowe's ratio test
+		(idxsA, idxsB) = self.featureBackend.match(featuresA, featuresB, ratio)
+		matches = list(zip(idxsB.tolist(), idxsA.tolist()))
 
 		# computing a homography requires at least 4 matches
 		if len(matches) > 4:
 			# construct the two sets of points
-			ptsA = np.float32([kpsA[i] for (_, i) in matches])
-			ptsB = np.float32([kpsB[i] for (i, _) in matches])
+			ptsA = np.float32(kpsA[idxsA])
+			ptsB = np.float32(kpsB[idxsB])
 
 			# compute the homography between the two sets of points
 			(H, status) = cv2.findHomography(ptsA, ptsB, cv2.RANSAC,
@@ -99,4 +72,21 @@ class Stitcher:
 			return (matches, H, status)
 
 		# otherwise, no homograpy could be computed
-		return None
\ No newline at end of file
+		return None
+
+	def save(self, path):
+		# persist the calibrated homography so we can skip keypoint
+		# matching the next time the application starts
+		if self.cachedH is None:
+			raise ValueError("the stitcher isn't calibrated yet")
+		dirname = os.path.dirname(path)
+		if dirname and not os.path.exists(dirname):
+			os.makedirs(dirname)
+		np.save(path, self.cachedH)
+
+	def load(self, path):
+		# load a previously calibrated homography if there is one
+		if not os.path.exists(path):
+			return False
+		self.cachedH = np.load(path)
+		return True
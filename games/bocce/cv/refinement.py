@@ -0,0 +1,178 @@
+# imports
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class GrabCutRefiner():
+    """
+    Refines the rough HSV ball mask with GrabCut, but only inside small
+    padded ROIs around the candidate balls instead of the whole court. The
+    ROIs are segmented in parallel (cv2.grabCut releases the GIL), each one
+    gets an iteration budget, and all of them share a time limit. Refined
+    masks are cached per ball while the ball stays still.
+    """
+    def __init__(self, iterations=5, timeLimit=0.25, padding=0.5,
+        workers=4, quantization=4):
+        # GrabCut iterations per ball and the time limit (in seconds) for
+        # refining all of the balls
+        self.iterations = iterations
+        self.timeLimit = timeLimit
+
+        # pad each ROI by this fraction of the ball's radius
+        self.padding = padding
+
+        # balls whose center and radius don't change by more than this many
+        # pixels are considered to be still
+        self.quantization = quantization
+
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+        # cache keys are (camName, x, y, radius) quantized; values are the
+        # ROI (x, y, w, h) and its refined mask
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def refine(self, court, ballMask, cnts, camName=None):
+        # returns a copy of the ball mask with the ball ROIs replaced by
+        # their GrabCut segmentation
+        deadline = time.time() + self.timeLimit
+        refinedMask = ballMask.copy()
+
+        # look each candidate ball up in the cache
+        rois = []
+        cache = {}
+        for c in cnts:
+            roi = self.get_roi(c, court.shape)
+            if roi is None:
+                continue
+            key = self.get_key(camName, c)
+            circle = cv2.minEnclosingCircle(c)
+            if key in self.cache:
+                self.hits += 1
+                cache[key] = self.cache[key]
+                rois.append((roi, key, circle, None))
+                continue
+
+            # segment the balls we haven't seen (still) yet in parallel
+            self.misses += 1
+            (x, y, w, h) = roi
+            ((cX, cY), radius) = circle
+            future = self.pool.submit(self.grab_cut,
+                court[y:y + h, x:x + w].copy(),
+                ballMask[y:y + h, x:x + w].copy(),
+                (cX - x, cY - y), radius, deadline)
+            rois.append((roi, key, circle, future))
+
+        # collect the refined ROIs; balls which didn't finish in time keep
+        # their rough mask
+        refined = []
+        for (roi, key, circle, future) in rois:
+            if future is None:
+                (roi, mask) = cache[key]
+            else:
+                try:
+                    mask = future.result(max(deadline - time.time(), 0))
+                except Exception:
+                    future.cancel()
+                    continue
+                cache[key] = (roi, mask)
+
+            # GrabCut couldn't segment this ball, so keep the rough mask
+            if mask is None:
+                continue
+
+            # each ROI's mask only speaks for its own ball; everything
+            # outside of the ball's circle is background to it, including
+            # any neighboring ball
+            (x, y, w, h) = roi
+            ((cX, cY), radius) = circle
+            own = np.zeros(mask.shape, dtype="uint8")
+            cv2.circle(own, (int(cX - x), int(cY - y)), int(radius * 1.2) + 1,
+                255, -1)
+            refined.append((roi, own, np.where(own > 0, mask, 0)))
+
+        # replace the rough mask inside each refined ball's circle, then
+        # merge the balls so that touching balls don't erase each other
+        for ((x, y, w, h), own, mask) in refined:
+            refinedMask[y:y + h, x:x + w][own > 0] = 0
+        for ((x, y, w, h), own, mask) in refined:
+            view = refinedMask[y:y + h, x:x + w]
+            np.maximum(view, mask.astype(view.dtype), out=view)
+
+        # only keep the balls we saw this time; the others moved or left
+        self.cache = cache
+        return refinedMask
+
+    def grab_cut(self, image, mask, center, radius, deadline):
+        # any mask values greater than zero are probable foreground and the
+        # rest is probable background
+        gcMask = np.where(mask > 0, cv2.GC_PR_FGD, cv2.GC_PR_BGD).astype("uint8")
+
+        # everything well outside of the ball's enclosing circle is
+        # definitely background, and the (masked) core of the ball is
+        # definitely foreground
+        center = (int(center[0]), int(center[1]))
+        ball = np.zeros(gcMask.shape, dtype="uint8")
+        cv2.circle(ball, center, int(radius * 1.2) + 1, 255, -1)
+        gcMask[ball == 0] = cv2.GC_BGD
+        core = np.zeros(gcMask.shape, dtype="uint8")
+        cv2.circle(core, center, max(int(radius * 0.4), 1), 255, -1)
+        gcMask[(core > 0) & (mask > 0)] = cv2.GC_FGD
+
+        # GrabCut needs some of both to build its color models
+        if not (gcMask == cv2.GC_FGD).any():
+            return None
+
+        # run one iteration at a time so that we can stop at the deadline
+        fgModel = np.zeros((1, 65), dtype="float")
+        bgModel = np.zeros((1, 65), dtype="float")
+        mode = cv2.GC_INIT_WITH_MASK
+        for i in range(self.iterations):
+            if time.time() >= deadline:
+                break
+            (gcMask, bgModel, fgModel) = cv2.grabCut(image, gcMask, None,
+                bgModel, fgModel, iterCount=1, mode=mode)
+            mode = cv2.GC_EVAL
+
+        # definite and probable foreground become 255, the rest 0
+        refined = np.where((gcMask == cv2.GC_FGD) | (gcMask == cv2.GC_PR_FGD),
+            255, 0)
+        return refined.astype("uint8")
+
+    def get_roi(self, c, shape):
+        # pad the ball's enclosing circle and clip it to the image
+        ((cX, cY), radius) = cv2.minEnclosingCircle(c)
+        pad = radius * (1 + self.padding) + 2
+        (h, w) = shape[:2]
+        (x0, y0) = (max(int(cX - pad), 0), max(int(cY - pad), 0))
+        (x1, y1) = (min(int(cX + pad) + 1, w), min(int(cY + pad) + 1, h))
+        if x1 - x0 < 3 or y1 - y0 < 3:
+            return None
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def get_key(self, camName, c):
+        ((cX, cY), radius) = cv2.minEnclosingCircle(c)
+        q = self.quantization
+        return (camName, int(cX // q), int(cY // q), int(radius // q))
+
+    def __getstate__(self):
+        # a copy sent to a detection worker process gets its own threads and
+        # starts with an empty cache
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def clear(self):
+        self.cache = {}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
@@ -5,6 +5,7 @@ import imutils
 # typically we'll import modularly
 try:
     from games.bocce.cv.pyimagesearch.panorama import Stitcher
+    from games.bocce.cv.panorama import PanoramaEngine
     from camera.camera import ImageZMQCamera
     unit_test = False
 
@@ -16,6 +17,7 @@ except:
     print(sys.path)
     from games.camera.camera import ImageZMQCamera
     from games.bocce.cv.pyimagesearch.panorama import Stitcher
+    from games.bocce.cv.panorama import PanoramaEngine
     unit_test = True
 
 
@@ -88,12 +90,22 @@ if __name__ == "__main__":
     #
     # print(errorCode)
 
-    s = Stitcher()
-    result = s.stitch((frame0, frame1))
+    # load the saved calibration, otherwise calibrate once and save it; the
+    # remap tables are reused for every frame after this
+    pe = PanoramaEngine.load()
+    if pe is None:
+        pe = PanoramaEngine.calibrate((frame0, frame1, frame2),
+            stitcher=Stitcher(featureBackend="orb"))
+        pe.save()
+    result = pe.compose((frame0, frame1, frame2))
 
     cv2.imshow("stitched", result)
     cv2.waitKey(0)
 
-    result2 = s.stitch((result, frame2))
-    cv2.imshow("stitched2", result2)
-    cv2.waitKey(0)
\ No newline at end of file
+    # compose the live panorama in a single pass per frame
+    while True:
+        frames = [imutils.resize(c._get_frame(), width=600) for c in (c0, c1, c2)]
+        result = pe.compose(frames)
+        cv2.imshow("stitched", result)
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
@@ -0,0 +1,28 @@
+# imports
+import cv2
+import numpy as np
+
+
+def build_homography_maps(H, size, origin=(0, 0)):
+    # the maps are built for the *destination* image, so we need the
+    # inverse homography to look up where each destination pixel comes
+    # from in the source image
+    Hinv = np.linalg.inv(np.asarray(H, dtype="float64"))
+
+    # build a grid of destination pixel coordinates (offset by the origin
+    # so we can build maps for just a sub-rectangle of a larger canvas)
+    (w, h) = size
+    (oX, oY) = origin
+    (xs, ys) = np.meshgrid(np.arange(oX, oX + w, dtype="float32"),
+                           np.arange(oY, oY + h, dtype="float32"))
+    pts = np.dstack([xs, ys]).reshape(-1, 1, 2)
+
+    # project the destination grid back into the source image
+    srcPts = cv2.perspectiveTransform(pts, Hinv).reshape(h, w, 2)
+
+    # convert the floating point map into the fixed-point representation
+    # which cv2.remap can use much faster than two float maps
+    (map1, map2) = cv2.convertMaps(srcPts, None, cv2.CV_16SC2)
+
+    # return the fixed-point maps
+    return (map1, map2)
@@ -8,9 +8,72 @@ from scipy.spatial import distance as dist
 # for now, these are "pixels" (not "inches" or "cm")
 TOO_CLOSE_MARGIN = 5
 
+
+def get_frame_points_and_leader(pallino, homeBalls, awayBalls, teamHome,
+    teamAway):
+    # teamHome and teamAway are returned as the frame leader; they can be
+    # Team objects or just labels (i.e. in a court worker process)
+    def get_frame_points(ballDistancesA, ballDistancesB):
+        framePoints = 0
+        for (i, dB) in enumerate(ballDistancesB):
+            for (j, dA) in enumerate(ballDistancesA):
+                if dA < dB:
+                    framePoints += 1
+                else:
+                    break
+            break
+        return framePoints
+
+
+    if pallino is None:
+        print("not annotating; couldn't find pallino")
+
+    # calculate Euclidean distance for each ball to the pallino
+    homeBallsDistances = []
+    awayBallsDistances = []
+    for ball in homeBalls:
+        D = dist.euclidean(pallino.coordinates, ball.coordinates)
+        homeBallsDistances.append(D)
+    for ball in awayBalls:
+        D = dist.euclidean(pallino.coordinates, ball.coordinates)
+        awayBallsDistances.append(D)
+
+    # sort balls and distances
+    homeBallsDistances, homeBalls = zip(*sorted(zip(homeBallsDistances, homeBalls)))
+    awayBallsDistances, awayBalls = zip(*sorted(zip(awayBallsDistances, awayBalls)))
+
+    # grab each min distance (the 0th element in the sorted list)
+    homeBallsMinDistance = homeBallsDistances[0]
+    awayBallsMinDistance = awayBallsDistances[0]
+
+    # who is closer?
+    homeIsCloser = homeBallsMinDistance < awayBallsMinDistance
+    awayIsCloser = awayBallsMinDistance < homeBallsMinDistance
+    equidistant = homeBallsMinDistance == awayBallsMinDistance
+
+    # check if it is "too close to call"
+    tooCloseToCall = abs(homeBallsMinDistance - awayBallsMinDistance) <= TOO_CLOSE_MARGIN
+
+    # determine framePoints and frameWinner
+    framePoints = None
+    frameLeader = None
+    if homeIsCloser:
+        framePoints = get_frame_points(homeBallsDistances, awayBallsDistances)
+        frameLeader = teamHome
+    elif awayIsCloser:
+        framePoints = get_frame_points(awayBallsDistances, homeBallsDistances)
+        frameLeader = teamAway
+    elif equidistant or tooCloseToCall:
+        # todo how do we handle when both teams' closest ball is equidistant
+        framePoints = None
+
+    return framePoints, frameLeader
+
+
 class Frame:
     def __init__(self, frameNumber, throwingEnd, pallinoThrowingTeam,
-        teamHome, teamAway, cam):
+        teamHome, teamAway, cam, calibrator=None, refiner=None,
+        detector=None, detectionCache=None, debug=True):
 
         self.frameNumer = frameNumber
         self.throwingEnd = throwingEnd
@@ -22,6 +85,13 @@ class Frame:
 
         # todo
         self.cam = cam
+        self.calibrator = calibrator
+        self.refiner = refiner
+        self.detector = detector
+        self.detectionCache = detectionCache
+
+        # show the ball finder's debug windows when finding the balls here
+        self.debug = debug
 
         self.pallinoInPlay = False
         self.ballMotion = False
@@ -39,6 +109,10 @@ class Frame:
 
         self.throw_trigger = False
 
+        # a throw which was made but not scored yet, i.e. while its balls
+        # are detected asynchronously (see handle_throw and score_throw)
+        self.awaitingDetection = False
+
         self.num_total_team_balls = None
 
     def initialize_balls(self, playersPerTeam):
@@ -86,7 +160,8 @@ class Frame:
         elif team == self.teamAway:
             self.numThrowsTeamAway += 1
 
-    def throw_bocce(self, team, followPallino=False):
+    def throw_bocce(self, team, followPallino=False, detection=None,
+        deferScoring=False):
         thrower = None
 
         # whichever team threw the pallino throws again
@@ -118,8 +193,13 @@ class Frame:
         # update who is in
         if followPallino:
             self.whoseIn = self.get_other_team(self.pallinoThrowingTeam)
+        elif deferScoring:
+            # the caller detects the balls with the new throw counts and
+            # passes them to score_throw
+            self.awaitingDetection = True
         else:
-            self.whoseIn = self.determine_whose_in(self.cam.last_frame)
+            self.whoseIn = self.determine_whose_in(self.cam.last_frame,
+                detection=detection)
 
         # debug
         print("{}({}) threw a bocce. Throw is {}. {} is in with points={}. {} remaining balls={}".format(
@@ -129,6 +209,14 @@ class Frame:
 
         return valid
 
+    def score_throw(self, detection=None):
+        # finish a throw made with deferScoring using the balls detected
+        # after it
+        self.whoseIn = self.determine_whose_in(self.cam.last_frame,
+            detection=detection)
+        self.awaitingDetection = False
+        print("{} is in with points={}".format(self.whoseIn, self.inPoints))
+
     def get_a_team_ball(self, balls):
         for ball in balls:
             # go to the next ball if this one is already thrown
@@ -157,7 +245,18 @@ class Frame:
 
         return numBalls
 
-    def handle_throw(self):
+    def needs_detection(self):
+        # the next throw is scored with computer vision once the pallino and
+        # each team's first ball are on the court
+        return self.pallino.isThrown and self.first_bocce_thrown \
+            and self.second_bocce_thrown and self.either_team_has_balls()
+
+    def handle_throw(self, detection=None, deferScoring=False):
+        # detection is an (already computed) Detection of the court before
+        # the throw is counted, e.g. from the DetectionExecutor; otherwise
+        # the balls are found here. The thrown ball changes the counts the
+        # court is scored with afterwards, so with deferScoring the caller
+        # detects the balls again and finishes the throw with score_throw
         if not self.pallino.isThrown:
             # throw the pallino
             self.throw_pallino(self.pallinoThrowingTeam)
@@ -196,11 +295,13 @@ class Frame:
         else:
             if self.either_team_has_balls():
                 # throw all remaining balls
-                self.inPoints, self.whoseIn = self.determine_whose_in(self.cam)
+                self.inPoints, self.whoseIn = self.determine_whose_in(
+                    self.cam.last_frame, detection=detection)
 
                 # the other team (furthest team) throws
                 valid = self.throw_bocce(self.get_other_team(self.whoseIn),
-                                             followPallino=False)
+                                             followPallino=False,
+                                             deferScoring=deferScoring)
 
             else:
                 print("Please score the frame")
@@ -213,12 +314,28 @@ class Frame:
         return self.teamHome
 
     """Finds closest ball with computer vision"""
-    def determine_whose_in(self, court):
-        bf = BallFinder()
-        bf.pipeline(court, self.numThrowsTeamHome, self.numThrowsTeamAway)
-        self.pallino = bf.pallino
-        self.teamHome.balls = bf.homeBalls
-        self.teamAway.balls = bf.awayBalls
+    def determine_whose_in(self, court, detection=None):
+        # find the balls unless they were already detected (asynchronously)
+        if detection is None:
+            bf = BallFinder(calibrator=self.calibrator, debug=self.debug,
+                refiner=self.refiner, detector=self.detector)
+
+            # look the frame up in the detection cache first
+            if self.detectionCache is not None:
+                # only key on the sequence if court is the frame it belongs to
+                (latest, sequence) = self.cam.latest
+                frameSequence = sequence if court is latest else None
+                detection = self.detectionCache.detect(bf, court,
+                    self.numThrowsTeamHome, self.numThrowsTeamAway,
+                    camName=self.cam.name, frameSequence=frameSequence)
+            else:
+                bf.pipeline(court, self.numThrowsTeamHome,
+                    self.numThrowsTeamAway, camName=self.cam.name)
+                detection = (bf.pallino, bf.homeBalls, bf.awayBalls)
+
+        if not isinstance(detection, tuple):
+            detection = detection.balls()
+        (self.pallino, self.teamHome.balls, self.teamAway.balls) = detection
 
         points, frameLeader = self.get_frame_points_and_frame_leader(self.pallino, self.teamHome.balls,
             self.teamAway.balls)
@@ -227,61 +344,8 @@ class Frame:
 
 
     def get_frame_points_and_frame_leader(self, pallino, homeBalls, awayBalls):
-        def get_frame_points(ballDistancesA, ballDistancesB):
-            framePoints = 0
-            for (i, dB) in enumerate(ballDistancesB):
-                for (j, dA) in enumerate(ballDistancesA):
-                    if dA < dB:
-                        framePoints += 1
-                    else:
-                        break
-                break
-            return framePoints
-
-
-        if pallino is None:
-            print("not annotating; couldn't find pallino")
-
-        # calculate Euclidean distance for each ball to the pallino
-        homeBallsDistances = []
-        awayBallsDistances = []
-        for ball in homeBalls:
-            D = dist.euclidean(pallino.coordinates, ball.coordinates)
-            homeBallsDistances.append(D)
-        for ball in awayBalls:
-            D = dist.euclidean(pallino.coordinates, ball.coordinates)
-            awayBallsDistances.append(D)
-
-        # sort balls and distances
-        homeBallsDistances, homeBalls = zip(*sorted(zip(homeBallsDistances, homeBalls)))
-        awayBallsDistances, awayBalls = zip(*sorted(zip(awayBallsDistances, awayBalls)))
-
-        # grab each min distance (the 0th element in the sorted list)
-        homeBallsMinDistance = homeBallsDistances[0]
-        awayBallsMinDistance = awayBallsDistances[0]
-
-        # who is closer?
-        homeIsCloser = homeBallsMinDistance < awayBallsMinDistance
-        awayIsCloser = awayBallsMinDistance < homeBallsMinDistance
-        equidistant = homeBallsMinDistance == awayBallsMinDistance
-
-        # check if it is "too close to call"
-        tooCloseToCall = abs(homeBallsMinDistance - awayBallsMinDistance) <= TOO_CLOSE_MARGIN
-
-        # determine framePoints and frameWinner
-        framePoints = None
-        frameLeader = None
-        if homeIsCloser:
-            framePoints = get_frame_points(homeBallsDistances, awayBallsDistances)
-            frameLeader = self.teamHome
-        elif awayIsCloser:
-            framePoints = get_frame_points(awayBallsDistances, homeBallsDistances)
-            frameLeader = self.teamAway
-        elif equidistant or tooCloseToCall:
-            # todo how do we handle when both teams' closest ball is equidistant
-            framePoints = None
-
-        return framePoints, frameLeader
+        return get_frame_points_and_leader(pallino, homeBalls, awayBalls,
+            self.teamHome, self.teamAway)
 
 
     """Determine's who is in and accounts for their points"""
@@ -1,5 +1,7 @@
 # imports
 from .frame import Frame
+from .cv.detection import DetectionCache
+from .cv.detectors import get_detector
 import time
 
 
@@ -21,7 +23,8 @@ class Timer():
         self.outOfTime = True
 
 class Game:
-    def __init__(self, teamHome, teamAway, umpire, playTo=12, gameMinutes=25):
+    def __init__(self, teamHome, teamAway, umpire, playTo=12, gameMinutes=25,
+        detector="hsv"):
         self.playTo = playTo
 
         self.teamHome = teamHome
@@ -32,6 +35,16 @@ class Game:
         self.gameWinner = None
 
         self.orientation = None
+        self.calibrator = None
+
+        # optional GrabCut refinement of the ball masks (see GrabCutRefiner)
+        # and ball detector backend (see set_detector)
+        self.refiner = None
+        self.detector = None
+
+        # recent detections, shared by every frame of the game
+        self.detectionCache = DetectionCache()
+        self.set_detector(detector)
 
         self.umpire = umpire
 
@@ -50,6 +63,19 @@ class Game:
         
 
 
+    def set_detector(self, name="hsv", **kwargs):
+        # "hsv" is BallFinder's default pipeline; other detectors (i.e.
+        # "dnn", see detectors.py) load their model once here and are used
+        # by every frame from the next one on
+        try:
+            self.detector = None if name == "hsv" \
+                else get_detector(name, **kwargs)
+        except IOError as e:
+            # i.e. the model hasn't been exported to models/ on this machine
+            print("[WARN] using the hsv ball detector: {}".format(e))
+            self.detector = None
+        self.detectionCache.clear()
+
     def set_umpire(self, umpire):
         self.umpire = umpire
 
@@ -76,7 +102,11 @@ class Game:
                                   pallinoThrowingTeam=pallinoThrowingTeam,
                                   teamHome=self.teamHome,
                                   teamAway=self.teamAway,
-                                  cam=self.cam)
+                                  cam=self.cam,
+                                  calibrator=self.calibrator,
+                                  refiner=self.refiner,
+                                  detector=self.detector,
+                                  detectionCache=self.detectionCache)
         print("current frame is set")
         self.frames.append(self.currentFrame)
         self.currentFrame.initialize_balls(len(self.teamHome.players))
@@ -1,8 +1,14 @@
+# imports
+from .courtfarm import CourtFarm
+
 class Venue():
 	def __init__(self, name):
 		self.name = name
 		self.courts = []
 
+		# runs each court in its own process (see start_farm)
+		self.farm = None
+
 	def add_court(self, court):
 		self.courts.append(court)
 
@@ -10,6 +16,29 @@ class Venue():
 		# todo feature to remove court
 		pass
 
+	def start_farm(self):
+		# capture, detect and score every court that has cameras in a
+		# worker process of its own
+		self.farm = CourtFarm()
+		for court in self.courts:
+			specs = court.camera_specs()
+			if len(specs) > 0:
+				self.farm.add_court(court.name, specs)
+				court.use_farm(self.farm)
+		self.farm.start()
+		return self.farm
+
+	def stop_farm(self):
+		if self.farm is not None:
+			self.farm.stop()
+			self.farm = None
+
+	def poll(self):
+		# the courts' detection, health and error messages
+		if self.farm is None:
+			return []
+		return self.farm.poll()
+
 	def str_courts(self):
 		# build a comma separated listing of courts and then remove
 		# the last ", "
@@ -3,21 +3,233 @@ import imutils
 import time
 import cv2
 import imagezmq
+import zmq
 import threading
 import numpy as np
+import random
 import multiprocessing as mp
+from collections import deque
 from datetime import datetime
+import glob
 import os
 
 VIDEO_DIR = "videos"
 
+# recordings are written at this frame rate (see Camera.initialize_writer);
+# replayed image sequences default to it too
+RECORDING_FPS = 18
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
 MAX_RECORDING_RESTARTS = 8
 
+# connection health states (see ConnectionSupervisor)
+CONNECTING = "connecting"
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+RECONNECTING = "reconnecting"
+
+# the consolidated hub keeps at most this many frames queued per sender, so
+# a slow consumer drops frames instead of stalling the Pis
+HUB_HWM = 2
+
+# socket patterns the consolidated hub can receive with: REQ/REP (what
+# client.py uses today), PUSH/PULL and PUB/SUB
+HUB_MODES = ("reqrep", "pull", "sub")
+
+# ImageHubReceivers shared by the HubCameras, keyed by (mode, address)
+_hubs = {}
+_hubsLock = threading.Lock()
+
+
+def recv_frame(socket):
+    # receive an imagezmq message sent with either send_image or send_jpg;
+    # raw images carry their dtype and shape, jpgs don't
+    md = socket.recv_json()
+    buf = socket.recv()
+    if "dtype" in md:
+        return (md["msg"], np.frombuffer(buf, dtype=md["dtype"]).reshape(
+            md["shape"]))
+    return (md["msg"], buf)
+
+
+def decode_frame(payload):
+    # a raw image or a jpg buffer from recv_frame
+    if isinstance(payload, np.ndarray):
+        return payload
+    return cv2.imdecode(np.frombuffer(payload, dtype='uint8'), -1)
+
+
+def parse_metadata(msg):
+    # split an imagezmq message into the sender's name and the metadata
+    # header obie_imagezmq/client.py appends ("name|seq=12|cap=5321.20|..."),
+    # parsing the numbers; older clients only send their name
+    fields = msg.split("|")
+    metadata = {"name": fields[0]}
+    for field in fields[1:]:
+        (key, _, value) = field.partition("=")
+        try:
+            metadata[key] = float(value) if "." in value else int(value)
+        except ValueError:
+            metadata[key] = value
+    return metadata
+
+
+class FrameClock:
+    """
+    Puts a Pi's frame metadata on the hub's clock. A Pi's monotonic clock
+    has an unknown offset from ours, so the smallest (receive - sent) seen
+    recently is taken as the offset. That puts the capture times of every
+    camera on the same clock (to align them) and gives each frame's
+    latency, not counting the shortest network delay. Gaps in the sequence
+    numbers count as frames lost on the way.
+    """
+    def __init__(self, window=100):
+        self.offsets = deque(maxlen=window)
+        self.lastSequence = None
+        self.dropped = 0
+
+    def update(self, msg, received):
+        # received is the hub's time.monotonic() when the frame arrived
+        metadata = parse_metadata(msg)
+        metadata["received"] = received
+        if "sent" in metadata:
+            self.offsets.append(received - metadata["sent"])
+            if "cap" in metadata:
+                metadata["captureTime"] = metadata["cap"] + min(self.offsets)
+                metadata["latency"] = received - metadata["captureTime"]
+
+        if "seq" in metadata:
+            # a Pi that restarted starts counting again
+            if self.lastSequence is not None and \
+                metadata["seq"] > self.lastSequence + 1:
+                self.dropped += metadata["seq"] - self.lastSequence - 1
+            self.lastSequence = metadata["seq"]
+        return metadata
+
+
+class ConnectionSupervisor:
+    """
+    Tracks the health of one camera's connection and paces its retries.
+    A failed frame makes the camera DEGRADED; after a few failures in a row
+    it is RECONNECTING and the camera reopens its source. Retries back off
+    exponentially with full jitter (so a venue full of cameras doesn't
+    retry in lockstep) up to maxDelay. Each camera has its own supervisor
+    and waits in its own thread, so one flaky camera never holds up the
+    others. The first good frame makes it HEALTHY again.
+    """
+    def __init__(self, name=None, baseDelay=0.5, maxDelay=30.0,
+        failuresBeforeReconnect=3, logInterval=10.0):
+        self.name = name
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.failuresBeforeReconnect = failuresBeforeReconnect
+
+        # print failures at most once every logInterval seconds
+        self.logInterval = logInterval
+        self.lastLog = None
+        self.unloggedFailures = 0
+
+        self.state = CONNECTING
+        self.stateSince = time.time()
+        self.consecutiveFailures = 0
+        self.lastError = None
+
+        # metrics
+        self.frames = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.failedReconnects = 0
+
+        # set to interrupt a backoff (i.e. when the camera is closed)
+        self.stopEvent = threading.Event()
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        # a camera flapping between healthy and degraded isn't news, losing
+        # or getting back the connection is
+        if state == RECONNECTING or self.state == RECONNECTING:
+            print("[INFO] camera {} is {} (was {})".format(self.name, state,
+                self.state))
+        self.state = state
+        self.stateSince = time.time()
+
+    def success(self):
+        self.frames += 1
+        self.consecutiveFailures = 0
+        self.set_state(HEALTHY)
+
+    def failure(self, error):
+        # returns how long to wait before trying again
+        self.failures += 1
+        self.consecutiveFailures += 1
+        self.lastError = "{}: {}".format(type(error).__name__, error)
+        self.unloggedFailures += 1
+        now = time.time()
+        if self.lastLog is None or now - self.lastLog >= self.logInterval:
+            print("[WARN] camera {} failed to grab a frame {} time(s) ({} in a "
+                "row): {}".format(self.name, self.unloggedFailures,
+                self.consecutiveFailures, self.lastError))
+            self.lastLog = now
+            self.unloggedFailures = 0
+        self.set_state(RECONNECTING if self.should_reconnect() else DEGRADED)
+        return self.backoff()
+
+    def should_reconnect(self):
+        return self.consecutiveFailures >= self.failuresBeforeReconnect
+
+    def reconnected(self, ok):
+        self.reconnects += 1
+        if not ok:
+            self.failedReconnects += 1
+
+    def backoff(self):
+        # full jitter: uniform between 0 and the exponential delay
+        exponent = min(self.consecutiveFailures - 1, 16)
+        delay = min(self.maxDelay, self.baseDelay * 2 ** exponent)
+        return random.uniform(0, delay)
+
+    def wait(self, delay):
+        # returns True if the wait was interrupted by stop()
+        return self.stopEvent.wait(delay)
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def stopped(self):
+        return self.stopEvent.is_set()
+
+    def metrics(self):
+        return {
+            "state": self.state,
+            "seconds_in_state": time.time() - self.stateSince,
+            "frames": self.frames,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutiveFailures,
+            "reconnects": self.reconnects,
+            "failed_reconnects": self.failedReconnects,
+            "last_error": self.lastError,
+        }
+
+
+def make_reply(quality=None):
+    # the reply to a Pi's frame; it lowers its JPEG quality to at most
+    # quality (see obie_imagezmq/client.py)
+    if quality is None:
+        return b'OK'
+    return "OK|quality={}".format(int(quality)).encode("utf-8")
+
 class Camera:
     def __init__(self, name=None, source=None, flip=False, *args, **kwargs):
         self.name = name
         self.source = source
         self.flip = flip
+
+        # the source as it was given (subclasses split it up), i.e. to open
+        # the same camera in another process (see Court.camera_specs)
+        self.spec = source
+
         self.recording = False
         self.writer = None
         self.h = None
@@ -27,57 +239,125 @@ class Camera:
         self.recordingStartTime = time.time()
         self.restartCount = 0
 
+        # connection health, backoff and reconnect metrics
+        self.supervisor = ConnectionSupervisor(name)
+
+        # incremented for every new frame so consumers can tell whether
+        # last_frame changed
+        self.frameSequence = 0
+
+        # (last_frame, frameSequence), published together so that a reader
+        # on another thread never pairs a frame with the wrong sequence
+        self.latest = (None, 0)
+
+        # cheap downscaled copy of the last frame (i.e. for the multi-camera
+        # wall), made on demand; set thumbnailWidth to None to disable
+        self.thumbnailWidth = 200
+        self.thumbnail = (None, None)
+
+        # the Pi's metadata for the last frame (see parse_metadata and
+        # FrameClock); only cameras fed by obie_imagezmq clients have it
+        self.last_metadata = None
+
         self.teams = "None-vs-None"
 
     def initialize(self):
         pass
 
     def get_frame(self):
-        self.last_frame = self._get_frame()
+        frame = self._get_frame()
+        sequence = self.frameSequence + 1
+        self.latest = (frame, sequence)
+        self.last_frame = frame
+        self.frameSequence = sequence
+
+    @property
+    def last_thumbnail(self):
+        # only downscale when someone (i.e. the camera wall) asks, and at
+        # most once per frame
+        frame = getattr(self, "last_frame", None)
+        (source, thumbnail) = self.thumbnail
+        if source is not frame:
+            thumbnail = self.make_thumbnail(frame)
+            self.thumbnail = (frame, thumbnail)
+        return thumbnail
+
+    def make_thumbnail(self, frame):
+        if self.thumbnailWidth is None or frame is None:
+            return None
+        (h, w) = frame.shape[:2]
+        height = int(h * self.thumbnailWidth / float(w))
+        return cv2.resize(frame, (self.thumbnailWidth, height),
+            interpolation=cv2.INTER_AREA)
 
     def _get_frame(self):
         pass
 
+    def supervised_get_frame(self):
+        # grab a frame; on failure back off and, after a few failures in a
+        # row, reconnect. Returns whether we got a new frame
+        self.supervisor.name = self.name
+        try:
+            self.get_frame()
+            self.supervisor.success()
+            return True
+        except Exception as e:
+            # a closed camera fails until its thread notices, so don't
+            # reopen it
+            if self.supervisor.stopped():
+                return False
+            delay = self.supervisor.failure(e)
+            if self.supervisor.should_reconnect():
+                self.reconnect()
+            self.supervisor.wait(delay)
+            return False
+
+    def report_failure(self, error):
+        # count a failure that happened outside of supervised_get_frame,
+        # i.e. the camera couldn't be opened, so that the supervisor backs
+        # off and reconnects; returns the delay before the next attempt
+        return self.supervisor.failure(error)
+
+    def reconnect(self):
+        # reopen the source without stopping the recording
+        try:
+            self._close_camera()
+        except Exception as e:
+            print("[WARN] camera {} didn't close cleanly: {}".format(self.name, e))
+        self.initialized = False
+        try:
+            self.initialize()
+            self.supervisor.reconnected(True)
+        except Exception as e:
+            self.supervisor.reconnected(False)
+            self.supervisor.lastError = "{}: {}".format(type(e).__name__, e)
+
     def acquire_movie(self):
-        while True:
+        # runs until the camera is closed
+        while not self.supervisor.stopped():
             # stop recording after 5 minutes (300 seconds)
             # if not self.recording and time.time() - self.recordingStartTime >= 300:
             #     self.stop_recording()
 
-            # try to grab a frame
-            try:
-                self.get_frame()
-
-            # if grabbing a frame was unsuccessful, try again
-            except:
-                print("\n\nEXCEPTION while trying to grab frame; passing.\n\n")
-                pass
-                # if self.recording and not self.writer is None:
-                    # print("\n\nEXCEPTION while trying to grab frame; stopping recording, "
-                    #       "restarting connection, and starting recording again.\n\n")
-                    # if self.restartCount >= MAX_RECORDING_RESTARTS:
-                    #     print("Restart count {} of {}".format(self.restartCount, MAX_RECORDING_RESTARTS))
-                    #     self.stop_recording()
-                    #     self.close_camera()
-                    #     return
-                    # self.restartCount += 1
-                    # self.stop_recording()
-                    # self.close_camera()
-                    # self.initialize()
-                    # self.recording = True
-                    # self.get_frame()
-            if self.recording:
-                if self.writer is None:
-                    self.recordingStartTime = time.time()
-                    self.initialize_writer()
-                elif self.writer is not None:
-                    try:
-                        self.writer.write(self.last_frame)
-                    except Exception as e:
-                        print("\n\nEXCEPTION while writing to disk; stopping recording.\n{}\n\n".format(str(e)))
-                        self.stop_recording()
-                else:
-                    continue
+            # try to grab a frame; the supervisor backs off and reconnects
+            # if that fails
+            if not self.supervised_get_frame():
+                continue
+            self.record_frame()
+
+    def record_frame(self):
+        # write the last frame to the video file while recording; the file
+        # is opened on the first frame after start_recording()
+        if self.recording:
+            if self.writer is None:
+                self.recordingStartTime = time.time()
+                self.initialize_writer()
+            elif self.writer is not None:
+                try:
+                    self.writer.write(self.last_frame)
+                except Exception as e:
+                    print("\n\nEXCEPTION while writing to disk; stopping recording.\n{}\n\n".format(str(e)))
+                    self.stop_recording()
 
     def initialize_writer(self):
         self.fourcc = cv2.VideoWriter_fourcc(*"MJPG") # use with the .avi file extension
@@ -85,7 +365,7 @@ class Camera:
         filename = str(self.name) + "_" + self.teams + "_" \
                    + datetime.now().strftime("%Y-%m-%d_%H%M%S") + ".avi"
         self.filepath = os.path.join(VIDEO_DIR, filename)
-        self.writer = cv2.VideoWriter(self.filepath, self.fourcc, 18, (self.w, self.h), True)
+        self.writer = cv2.VideoWriter(self.filepath, self.fourcc, RECORDING_FPS, (self.w, self.h), True)
 
     def start_recording(self):
         # todo should starting self.recordingStartTime go here? see Line ~62
@@ -110,6 +390,7 @@ class Camera:
         self.stop_recording()
         self.teams = "None-vs-None"
         self.initialized = False
+        self.supervisor.stop()
         self._close_camera()
 
     def _close_camera(self):
@@ -118,7 +399,8 @@ class Camera:
 
 class USBCamera(Camera):
     def __init__(self, name=None, source=None, flip=False, *args, **kwargs):
-        super(USBCamera, self).__init__(*args, **kwargs)
+        super(USBCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
         self.source = int(source)
 
     def initialize(self):
@@ -140,7 +422,8 @@ class USBCamera(Camera):
 
 class RTSPCamera(Camera):
     def __init__(self, name=None, source=None, flip=False, *args, **kwargs):
-        super(RTSPCamera, self).__init__(*args, **kwargs)
+        super(RTSPCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
         self.name = name
         self.source = str(source)
         self.flip = flip
@@ -154,24 +437,44 @@ class RTSPCamera(Camera):
         self.last_frame = None
         self.initialized = False
 
+        # seconds to wait for the capture process to return a frame
+        self.timeout = 10.0
+
     def initialize(self):
         if not self.initialized:
-            # use multiprocessing
-            self.parent_conn, child_conn = mp.Pipe()
-            self.is_open = True
-            self.p = mp.Process(target=self.rtsp_update, args=(child_conn, self.source, self.is_open))
-
-            # start the process
-            self.p.daemon = True
-            self.p.start()
+            self.start_capture()
             self.get_frame()
             self.initialized = True
 
+    def start_capture(self):
+        # use multiprocessing
+        self.parent_conn, child_conn = mp.Pipe()
+        self.is_open = True
+        self.p = mp.Process(target=self.rtsp_update, args=(child_conn, self.source, self.is_open))
+
+        # start the process
+        self.p.daemon = True
+        self.p.start()
+
     def _get_frame(self):
-        # request a frame and send ack
+        # request a frame and send ack; the capture process may be stuck
+        # on the network, so don't wait on it forever
+        if not self.p.is_alive():
+            raise ConnectionError("RTSP capture process for {} died".format(
+                self.source))
         self.parent_conn.send(1)
+        if not self.parent_conn.poll(self.timeout):
+            # its late reply would be taken for the answer to our next
+            # request, so start over with a new capture process rather than
+            # get out of step with it
+            self.stop_capture()
+            self.start_capture()
+            raise TimeoutError("Timeout while reading from {}".format(
+                self.source))
         frame = self.parent_conn.recv()
         self.parent_conn.send(0)
+        if frame is None:
+            raise ConnectionError("No frame from {}".format(self.source))
 
         # convert to RGB and resize
         #frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -189,8 +492,15 @@ class RTSPCamera(Camera):
             # recieve input data
             rec_dat = conn.recv()
             if rec_dat == 1:
-                # if frame requested
+                # if frame requested; after a failed read, reopen the stream
+                # first (the parent paces the retries)
+                if not cap.isOpened():
+                    cap.release()
+                    cap = cv2.VideoCapture(rtsp)
                 ret, frame = cap.read()
+                if not ret:
+                    cap.release()
+                    frame = None
                 conn.send(frame)
             elif rec_dat == 2:
                 # if close requested
@@ -200,13 +510,161 @@ class RTSPCamera(Camera):
         conn.close()
 
     def _close_camera(self):
-        #self.is_open = False
-        self.p.join()
+        self.stop_capture()
         self.initialized = False
 
+    def stop_capture(self):
+        #self.is_open = False
+        # ask the capture process to close, or stop it if it's stuck
+        try:
+            if self.p.is_alive():
+                self.parent_conn.send(2)
+        except (BrokenPipeError, OSError):
+            pass
+        self.p.join(timeout=2.0)
+        if self.p.is_alive():
+            self.p.terminate()
+        self.parent_conn.close()
+
+class ReplayCamera(Camera):
+    """
+    Plays back a recorded .avi (i.e. one written by initialize_writer) or an
+    image sequence (a directory or glob pattern) as if it were a live camera,
+    so the capture -> detect -> annotate -> record chain can be run and load
+    tested without any hardware. Frames are paced at the recording's frame
+    rate times speed, skipping frames the consumer is too slow for like a
+    live camera would, or delivered as fast as they're read if speed is None.
+    The source may be given as "path,fast" to replay as fast as possible.
+    """
+    def __init__(self, name=None, source=None, flip=False, speed=1.0,
+        loop=True, fps=None, *args, **kwargs):
+        super(ReplayCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
+        self.name = name
+        self.flip = flip
+        self.width = 600
+        self.last_frame = None
+
+        parts = str(source).split(",")
+        self.source = parts[0]
+        if len(parts) > 1 and parts[1].strip() == "fast":
+            speed = None
+        self.speed = speed
+        self.loop = loop
+
+        # frame rate of the recording; read from the video if not given
+        self.fps = fps
+
+        self.cap = None
+        self.paths = None
+        self.index = 0
+        self.startTime = None
+
+        # playback stats
+        self.framesRead = 0
+        self.framesSkipped = 0
+        self.loops = 0
+        self.finished = False
+
+    def initialize(self):
+        if not self.initialized:
+            if os.path.isdir(self.source) or glob.has_magic(self.source):
+                pattern = os.path.join(self.source, "*") \
+                    if os.path.isdir(self.source) else self.source
+                self.paths = sorted(p for p in glob.glob(pattern)
+                    if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS)
+                if len(self.paths) == 0:
+                    raise IOError("no images found in {}".format(self.source))
+                if self.fps is None:
+                    self.fps = RECORDING_FPS
+            else:
+                self.cap = cv2.VideoCapture(self.source)
+                if not self.cap.isOpened():
+                    raise IOError("couldn't open {}".format(self.source))
+                if self.fps is None:
+                    self.fps = self.cap.get(cv2.CAP_PROP_FPS) or RECORDING_FPS
+
+            self.rewind()
+            self.get_frame()
+            self.initialized = True
+
+    def rewind(self):
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.index = 0
+        self.startTime = time.monotonic()
+
+    def _get_frame(self):
+        # once a non-looping replay runs out, hold the last frame like a
+        # paused camera
+        if self.finished:
+            time.sleep(1.0 / self.fps)
+            return self.last_frame
+
+        if self.speed is not None:
+            # skip the frames which are already overdue, then wait for the
+            # next one to be due
+            due = int((time.monotonic() - self.startTime) * self.fps * self.speed)
+            while self.index < due and self.skip():
+                self.framesSkipped += 1
+            self.wait_for(self.index)
+
+        frame = self.read()
+        if frame is None:
+            if not self.loop or self.index == 0:
+                self.finished = True
+                return self.last_frame
+            self.loops += 1
+            self.rewind()
+            frame = self.read()
+
+        self.framesRead += 1
+        frame = imutils.resize(frame, width=self.width)
+        if self.flip:
+            frame = cv2.flip(frame, 1)
+        return frame
+
+    def wait_for(self, index):
+        if self.speed is None:
+            return
+        delay = self.startTime + index / (self.fps * self.speed) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read(self):
+        # the next frame, or None at the end of the recording
+        frame = None
+        if self.cap is not None:
+            (grabbed, frame) = self.cap.read()
+            if not grabbed:
+                frame = None
+        elif self.index < len(self.paths):
+            frame = cv2.imread(self.paths[self.index])
+        if frame is not None:
+            self.index += 1
+        return frame
+
+    def skip(self):
+        # advance one frame without decoding it; returns False at the end
+        if self.cap is not None:
+            if not self.cap.grab():
+                return False
+        elif self.index >= len(self.paths) - 1:
+            return False
+        self.index += 1
+        return True
+
+    def _close_camera(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self.paths = None
+        self.finished = False
+
 class ImageZMQCamera(Camera):
     def __init__(self, name, source, flip=False, *args, **kwargs):
-        super(ImageZMQCamera, self).__init__(*args, **kwargs)
+        super(ImageZMQCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
         self.name = name
         self.source = str(source).split(",")[0]
         self.port = str(source).split(",")[1]
@@ -221,6 +679,14 @@ class ImageZMQCamera(Camera):
         self.last_frame = None
         self.initialized = False
 
+        # the reply to each frame; can carry a JPEG quality cap for the Pi
+        self.reply = b'OK'
+        self.clock = FrameClock()
+        self.timeout = 5.0
+
+    def set_quality(self, quality=None):
+        self.reply = make_reply(quality)
+
     def initialize(self):
         if not self.initialized:
             self.image_hub = imagezmq.ImageHub('tcp://*:' + self.port)
@@ -229,9 +695,17 @@ class ImageZMQCamera(Camera):
             self.initialized = True
 
     def _get_frame(self):
-        rpi_name, frame = self.image_hub.recv_image()
-        #image = cv2.imdecode(np.frombuffer(jpg_buffer, dtype='uint8'), -1)
-        self.image_hub.send_reply(b'OK')
+        # don't block forever on a Pi that went away, so the supervisor can
+        # tell the camera is down
+        if not self.image_hub.zmq_socket.poll(int(self.timeout * 1000)):
+            raise TimeoutError("Timeout while waiting for a frame on port {}"
+                .format(self.port))
+
+        # the Pi may send raw images or JPEGs
+        rpi_name, payload = recv_frame(self.image_hub.zmq_socket)
+        self.image_hub.send_reply(self.reply)
+        self.last_metadata = self.clock.update(rpi_name, time.monotonic())
+        frame = decode_frame(payload)
         frame = imutils.resize(frame, width=self.width)
         if self.flip:
             frame = cv2.flip(frame, 1)
@@ -243,7 +717,8 @@ class ImageZMQCamera(Camera):
 
 class PubSubImageZMQCamera(Camera):
     def __init__(self, name, source, flip=False, *args, **kwargs):
-        super(PubSubImageZMQCamera, self).__init__(*args, **kwargs)
+        super(PubSubImageZMQCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
         self.name = name
         self.source = source
         self.flip = flip
@@ -257,6 +732,10 @@ class PubSubImageZMQCamera(Camera):
         self.port = 5555
         self.receiver = None
         self.last_frame = None
+        self.clock = FrameClock()
+
+        # seconds without a frame before the supervisor counts a failure
+        self.timeout = 5.0
 
         self.initialized = False
 
@@ -267,7 +746,8 @@ class PubSubImageZMQCamera(Camera):
             self.initialized = True
 
     def _get_frame(self):
-        msg, frame = self.receiver.receive()
+        msg, frame = self.receiver.receive(self.timeout)
+        self.last_metadata = self.clock.update(msg, self.receiver.received)
         image = cv2.imdecode(np.frombuffer(frame, dtype='uint8'), -1)
 
         frame = imutils.resize(image, width=self.width)
@@ -277,6 +757,7 @@ class PubSubImageZMQCamera(Camera):
 
     def _close_camera(self):
         self.receiver.close()
+        self.initialized = False
 
 class VideoStreamSubscriber:
     def __init__(self, hostname, port):
@@ -284,6 +765,7 @@ class VideoStreamSubscriber:
         self.port = port
         self._stop = False
         self._data_ready = threading.Event()
+        self.received = None
         self._thread = threading.Thread(target=self._run, args=())
         self._thread.daemon = True
         self._thread.start()
@@ -299,9 +781,243 @@ class VideoStreamSubscriber:
     def _run(self):
         receiver = imagezmq.ImageHub("tcp://{}:{}".format(self.hostname, self.port), REQ_REP=False)
         while not self._stop:
+            # poll so that close() doesn't wait for the next frame
+            if not receiver.zmq_socket.poll(100):
+                continue
             self._data = receiver.recv_jpg()
+            self.received = time.monotonic()
             self._data_ready.set()
         receiver.close()
 
     def close(self):
-        self._stop = True
\ No newline at end of file
+        self._stop = True
+        self._thread.join(timeout=1.0)
+
+class ImageHubReceiver:
+    """
+    One socket and one thread receiving frames from many Pis. Frames are
+    demultiplexed by the sender's rpi_name into per-camera buffers which
+    only hold the latest frame, and decoding is left to the consumer, so a
+    slow or absent consumer just drops frames. In "reqrep" mode the reply
+    goes out as soon as a frame arrives rather than after it's processed;
+    "pull" and "sub" don't wait for replies at all and queue at most hwm
+    frames per sender.
+    """
+    def __init__(self, address, mode="reqrep", hwm=HUB_HWM):
+        if mode not in HUB_MODES:
+            raise ValueError("unknown hub mode '{}', must be one of {}".format(
+                mode, ", ".join(HUB_MODES)))
+        self.address = address
+        self.mode = mode
+        self.hwm = hwm
+
+        # rpi_name -> (sequence, message, image or jpg buffer, metadata)
+        self.frames = {}
+        self.clocks = {}
+        self.lock = threading.Lock()
+
+        # one condition per sender so a frame only wakes its own camera
+        self.conditions = {}
+
+        # stats per rpi_name: frames received, frames replaced before any
+        # consumer took them, and the sequence of the last frame taken
+        self.received = {}
+        self.overwritten = {}
+        self.consumed = {}
+
+        # zmq sockets aren't thread safe, so PUB/SUB connections requested
+        # by other threads are made by the receiving thread
+        self.pendingConnections = []
+        self.refs = 0
+
+        # rpi_name -> reply to its frames in "reqrep" mode
+        self.replies = {}
+
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def connect(self, address):
+        # subscribe to another Pi's PUB socket
+        with self.lock:
+            self.pendingConnections.append(address)
+
+    def _open(self):
+        self.context = imagezmq.SerializingContext()
+        socketType = {"reqrep": zmq.REP, "pull": zmq.PULL, "sub": zmq.SUB}
+        socket = self.context.socket(socketType[self.mode])
+        socket.setsockopt(zmq.RCVHWM, self.hwm)
+        socket.setsockopt(zmq.LINGER, 0)
+        if self.mode == "sub":
+            socket.setsockopt(zmq.SUBSCRIBE, b"")
+            if self.address is not None:
+                socket.connect(self.address)
+        else:
+            socket.bind(self.address)
+        return socket
+
+    def _run(self):
+        socket = self._open()
+        while not self._stop:
+            with self.lock:
+                (pending, self.pendingConnections) = \
+                    (self.pendingConnections, [])
+            for address in pending:
+                socket.connect(address)
+
+            # poll so that close() doesn't wait for the next frame
+            if not socket.poll(100):
+                continue
+            (msg, payload) = recv_frame(socket)
+            if self.mode == "reqrep":
+                socket.send(self.replies.get(msg.split("|")[0], b"OK"))
+            self.put(msg, payload)
+        socket.close()
+        self.context.term()
+
+    def put(self, msg, payload):
+        # anything after a "|" in the message is per frame data for the
+        # consumer; the sender is the rpi_name in front of it
+        name = msg.split("|")[0]
+        with self.lock:
+            (sequence, last) = (0, self.frames.get(name))
+            if last is not None:
+                sequence = last[0]
+                if sequence > self.consumed.get(name, 0):
+                    self.overwritten[name] = self.overwritten.get(name, 0) + 1
+            if name not in self.clocks:
+                self.clocks[name] = FrameClock()
+            metadata = self.clocks[name].update(msg, time.monotonic())
+            self.frames[name] = (sequence + 1, msg, payload, metadata)
+            self.received[name] = self.received.get(name, 0) + 1
+            self.condition(name).notify_all()
+
+    def condition(self, name):
+        # callers must hold self.lock
+        if name not in self.conditions:
+            self.conditions[name] = threading.Condition(self.lock)
+        return self.conditions[name]
+
+    def get(self, name, lastSequence=0, timeout=15.0):
+        # wait for a frame from the named sender newer than lastSequence and
+        # return (sequence, message, image or jpg buffer, metadata)
+        with self.lock:
+            ready = self.condition(name).wait_for(lambda: name in self.frames and
+                self.frames[name][0] > lastSequence, timeout=timeout)
+            if not ready:
+                raise TimeoutError("Timeout while waiting for {} on {}".format(
+                    name, self.address))
+            frame = self.frames[name]
+            self.consumed[name] = frame[0]
+            return frame
+
+    def set_quality(self, name, quality=None):
+        # cap the named Pi's JPEG quality (None to let it adapt freely)
+        self.replies[name] = make_reply(quality)
+
+    def names(self):
+        with self.lock:
+            return sorted(self.frames)
+
+    def close(self):
+        self._stop = True
+        self._thread.join(timeout=1.0)
+
+
+def get_hub(address, mode="reqrep", hwm=HUB_HWM):
+    # cameras on the same port (or every PUB/SUB camera) share a receiver
+    key = (mode, None if mode == "sub" else address)
+    with _hubsLock:
+        if key not in _hubs:
+            _hubs[key] = ImageHubReceiver(None if mode == "sub" else address,
+                mode, hwm)
+        hub = _hubs[key]
+        hub.refs += 1
+    if mode == "sub":
+        hub.connect(address)
+    return hub
+
+
+def release_hub(hub):
+    with _hubsLock:
+        hub.refs -= 1
+        if hub.refs > 0:
+            return
+        for (key, h) in list(_hubs.items()):
+            if h is hub:
+                del _hubs[key]
+    hub.close()
+
+
+class HubCamera(Camera):
+    """
+    A Pi camera received through a shared ImageHubReceiver rather than its
+    own hub. The source is "address,rpi_name[,mode]" where address is the
+    port to bind for "reqrep" (the default) and "pull", or the Pi's
+    host:port to subscribe to for "sub".
+    """
+    def __init__(self, name, source, flip=False, hwm=HUB_HWM, timeout=15.0,
+        *args, **kwargs):
+        super(HubCamera, self).__init__(name, source, flip, *args,
+            **kwargs)
+        self.name = name
+        self.source = str(source)
+        parts = [p.strip() for p in self.source.split(",")]
+        self.mode = parts[2] if len(parts) > 2 else "reqrep"
+        self.rpiName = parts[1]
+        if self.mode == "sub":
+            address = parts[0] if ":" in parts[0] else parts[0] + ":5555"
+            self.address = "tcp://" + address
+        else:
+            self.address = "tcp://*:" + parts[0]
+        self.flip = flip
+        self.width = 600
+        self.hwm = hwm
+        self.timeout = timeout
+
+        self.hub = None
+        self.hubSequence = 0
+        self.last_frame = None
+        self.initialized = False
+
+        # the sender's message and the size it sent for the last frame
+        self.last_message = None
+        self.last_size = None
+
+        # frames the hub received which we never got to (frames lost before
+        # reaching the hub are in hub.clocks[rpiName].dropped)
+        self.framesDropped = 0
+
+    def set_quality(self, quality=None):
+        self.hub.set_quality(self.rpiName, quality)
+
+    def initialize(self):
+        if not self.initialized:
+            self.hub = get_hub(self.address, self.mode, self.hwm)
+            frame = cv2.imread('views/ui/oddball.png')
+            self.last_frame = imutils.resize(frame, width=600)
+            self.initialized = True
+
+    def _get_frame(self):
+        (sequence, msg, payload, metadata) = self.hub.get(self.rpiName,
+            self.hubSequence, self.timeout)
+        if self.hubSequence > 0:
+            self.framesDropped += sequence - self.hubSequence - 1
+        self.hubSequence = sequence
+        self.last_message = msg
+        self.last_metadata = metadata
+
+        # only the frames we actually use get decoded
+        frame = decode_frame(payload)
+        self.last_size = payload.nbytes if isinstance(payload, np.ndarray) \
+            else len(payload)
+        frame = imutils.resize(frame, width=self.width)
+        if self.flip:
+            frame = cv2.flip(frame, 1)
+        return frame
+
+    def _close_camera(self):
+        release_hub(self.hub)
+        self.hub = None
+        self.hubSequence = 0
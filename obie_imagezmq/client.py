@@ -4,50 +4,209 @@
 #
 # Or if you're running it standalone:
 #    python client.py --server-ip Davids-MBP --server-port 5558
+#
+# Frames are downscaled to the hub's width and sent as JPEGs whose quality
+# adapts to the round trip time; use --raw to send uncompressed frames
+#
+# To save the hub and the network some work between throws, crop to the
+# court and only stream at full rate while something is moving:
+#    python client.py --server-ip Davids-MBP --server-port 5558 \
+#        --roi 0,120,1280,480 --motion
+#
+# Each frame's message is the host name followed by a metadata header:
+#    pict1birdeast|seq=812|frame=1630|cap=5321.204133|enc=4.1|sent=5321.251870
+# seq counts the frames sent and frame the frames captured (so gaps in seq
+# are frames lost on the way to the hub), cap and sent are this Pi's
+# time.monotonic() when the frame was captured and sent, and enc is the
+# encode time in milliseconds
 
 # import the necessary packages
 from imutils.video import VideoStream
 import argparse
 import imagezmq
+import imutils
+import queue
 import socket
+import threading
 import time
-import signal
 import cv2
+import zmq
 
-# constant for the patience timeout
+# seconds to wait for the hub's reply before reconnecting
 TIMEOUT = 5
 
-class Patience:
+# the hub resizes every frame to this width, so there's no point sending
+# more pixels than that
+HUB_WIDTH = 600
+
+def parse_roi(roi):
+    # x,y,w,h with a non-negative corner and a positive size
+    try:
+        (x, y, w, h) = (int(v) for v in roi.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected x,y,w,h, got '{}'".format(roi))
+    if x < 0 or y < 0 or w <= 0 or h <= 0:
+        raise argparse.ArgumentTypeError("'{}' isn't a valid region".format(roi))
+    return (x, y, w, h)
+
+def clamp_roi(roi, shape):
+    # clip the region to a frame of the given shape; None if nothing is left
+    (x, y, w, h) = roi
+    (frameH, frameW) = shape[:2]
+    (x1, y1) = (min(x + w, frameW), min(y + h, frameH))
+    if x >= x1 or y >= y1:
+        return None
+    return (x, y, x1 - x, y1 - y)
+
+class LatestQueue:
     """
-    This class is borrowed from Jeff Bass' GitHub ImageNode
-
-    Timing class using operating system SIGALRM signal.
-    When instantiated, starts a timer using the system SIGALRM signal.
-    If the timer expires before __exit__ is called, raises Timeout exception.
-    Caveats:
-    1. There can be only 1 active SIGALRM timer running per program. If a
-       second SIGALRM timer is started, it replaces and nullifies the first one.
-    2. This class can only be used in the main thread. Python only allows the
-       use of SIGALRM in the main thread (or also in the main thread of a separate
-       process? Don't know. Need to run the experiment.)
-    Parameters:
-        seconds (int): number of seconds to wait before raising exception
+    A bounded queue between two pipeline stages. When it is full the oldest
+    frame is dropped to make room, so a slow stage always works on the
+    latest frame instead of falling further and further behind.
     """
-    class Timeout(Exception):
-        pass
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
 
-    def __init__(self, seconds):
-        self.seconds = seconds
+class MotionDetector:
+    """
+    Cheap motion detection for the Pi: frames are shrunk, grayed and blurred,
+    then compared against a running average of the background. There is
+    motion if enough pixels differ from the background, and for hold
+    seconds afterwards so that a ball rolling to a stop is sent in full.
+    """
+    def __init__(self, threshold=0.0005, delta=25, hold=2.0, width=320,
+        accumWeight=0.5):
+        # fraction of pixels which must change, and by how much
+        self.threshold = threshold
+        self.delta = delta
+        self.hold = hold
+        self.width = width
+        self.accumWeight = accumWeight
 
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.raise_timeout)
-        signal.alarm(self.seconds)
+        self.background = None
+        self.lastMotion = None
 
-    def __exit__(self, *args):
-        signal.alarm(0)    # disable alarm
+    def update(self, frame):
+        gray = cv2.cvtColor(imutils.resize(frame, width=self.width),
+            cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (7, 7), 0)
 
-    def raise_timeout(self, *args):
-        raise Patience.Timeout()
+        # the first frame is the background
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype("float")
+            return False
+
+        # compare against the background, then fold the frame into it
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        changed = cv2.countNonZero(cv2.threshold(diff, self.delta, 255,
+            cv2.THRESH_BINARY)[1]) / float(diff.size)
+        cv2.accumulateWeighted(gray, self.background, self.accumWeight)
+
+        now = time.time()
+        if changed >= self.threshold:
+            self.lastMotion = now
+        return self.lastMotion is not None and now - self.lastMotion <= self.hold
+
+class HubSender:
+    """
+    An ImageSender whose replies time out after TIMEOUT seconds. The timeout
+    is the socket's own receive timeout, so unlike a SIGALRM timer it works
+    from any thread. A REQ socket that missed its reply can't send again,
+    so after a timeout the socket is closed and a new one is connected.
+    """
+    def __init__(self, address, timeout=TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self.timeouts = 0
+        self.connect()
+
+    def connect(self):
+        self.sender = imagezmq.ImageSender(connect_to=self.address)
+        self.sender.zmq_socket.setsockopt(zmq.RCVTIMEO, int(self.timeout * 1000))
+        self.sender.zmq_socket.setsockopt(zmq.LINGER, 0)
+
+    def send(self, send, *args):
+        # returns the hub's reply, or None if it didn't reply in time
+        try:
+            return send(*args)
+        except zmq.Again:
+            self.timeouts += 1
+            print('TIMEOUT: No imagehub reply for ' + str(self.timeout) + ' seconds')
+            print('RECONNECT: Reopening the connection to ' + self.address)
+            self.sender.close()
+            self.connect()
+            return None
+
+    def send_image(self, msg, image):
+        return self.send(self.sender.send_image, msg, image)
+
+    def send_jpg(self, msg, jpg_buffer):
+        return self.send(self.sender.send_jpg, msg, jpg_buffer)
+
+class AdaptiveQuality:
+    """
+    Picks the JPEG quality for the next frame. The quality steps down while
+    the smoothed round trip time is over the target (the network or the hub
+    can't keep up) and creeps back up while it is well under it. The hub
+    can cap the quality by replying with "OK|quality=NN".
+    """
+    def __init__(self, quality=80, minQuality=40, maxQuality=90,
+        targetRTT=0.1, step=5, smoothing=0.2):
+        self.quality = quality
+        self.minQuality = minQuality
+        self.maxQuality = maxQuality
+        self.targetRTT = targetRTT
+        self.step = step
+        self.smoothing = smoothing
+
+        # smoothed round trip time and the hub's quality cap
+        self.rtt = None
+        self.hubQuality = None
+
+    def update(self, rtt, reply=None):
+        # exponentially weighted moving average of the round trip time
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt = self.smoothing * rtt + (1 - self.smoothing) * self.rtt
+
+        # the hub may ask for a lower quality (i.e. its CPU is busy)
+        self.hubQuality = self.parse_reply(reply)
+
+        if self.rtt > self.targetRTT:
+            self.quality -= self.step
+        elif self.rtt < self.targetRTT / 2:
+            self.quality += 1
+
+        maxQuality = self.maxQuality if self.hubQuality is None \
+            else min(self.maxQuality, self.hubQuality)
+        self.quality = max(self.minQuality, min(self.quality, maxQuality))
+        return self.quality
+
+    def parse_reply(self, reply):
+        if not reply:
+            return None
+        for field in reply.decode("utf-8", "ignore").split("|")[1:]:
+            (key, _, value) = field.partition("=")
+            if key == "quality" and value.isdigit():
+                return int(value)
+        return None
 
 # construct the argument parser and parse the arguments
 ap = argparse.ArgumentParser()
@@ -55,12 +214,34 @@ ap.add_argument("-s", "--server-ip", required=True,
     help="ip address of the server to which the client will connect")
 ap.add_argument("-p", "--server-port", required=True,
     help="ip address of the server to which the client will connect")
+ap.add_argument("-w", "--width", type=int, default=HUB_WIDTH,
+    help="downscale frames to this width before sending (0 to keep the "
+         "camera's resolution)")
+ap.add_argument("-q", "--quality", type=int, default=80,
+    help="initial JPEG quality")
+ap.add_argument("--min-quality", type=int, default=40,
+    help="lowest JPEG quality to adapt down to")
+ap.add_argument("--max-quality", type=int, default=90,
+    help="highest JPEG quality to adapt up to")
+ap.add_argument("--target-rtt", type=float, default=0.1,
+    help="round trip time (seconds) above which the quality is lowered")
+ap.add_argument("--raw", action="store_true",
+    help="send uncompressed frames instead of JPEGs")
+ap.add_argument("--roi", type=parse_roi,
+    help="x,y,w,h of the court in the (flipped) camera frame; only this "
+         "region is sent")
+ap.add_argument("--motion", action="store_true",
+    help="only send at full rate while there is motion")
+ap.add_argument("--motion-threshold", type=float, default=0.0005,
+    help="fraction of the frame which must change to count as motion")
+ap.add_argument("--motion-hold", type=float, default=2.0,
+    help="seconds to keep sending at full rate after the motion stops")
+ap.add_argument("--keepalive", type=float, default=1.0,
+    help="seconds between frames while there is no motion")
 args = vars(ap.parse_args())
 
-# initialize the ImageSender object with the socket address of the
-# server
-sender = imagezmq.ImageSender(connect_to="tcp://{}:{}".format(
-    args["server_ip"], args["server_port"]))
+# initialize the HubSender object with the socket address of the server
+sender = HubSender("tcp://{}:{}".format(args["server_ip"], args["server_port"]))
 
 # get the host name, initialize the video stream, and allow the
 # camera sensor to warmup
@@ -75,23 +256,98 @@ vs = VideoStream(usePiCamera=True).start()
 # wait for the camera to warm up
 time.sleep(2.0)
 
-# loop over frames from the camera
-while True:
-    # read a frame from the camera stream
+# clip the court region to the camera's frames; a region outside of them
+# would leave nothing to send
+if args["roi"] is not None:
     frame = vs.read()
+    while frame is None:
+        time.sleep(0.1)
+        frame = vs.read()
+    roi = clamp_roi(args["roi"], frame.shape)
+    if roi is None:
+        vs.stop()
+        ap.error("--roi {} is outside of the {}x{} camera frames".format(
+            ",".join(str(v) for v in args["roi"]), frame.shape[1],
+            frame.shape[0]))
+    if roi != args["roi"]:
+        print("[INFO] clipped --roi to {} to fit the {}x{} camera frames".format(
+            ",".join(str(v) for v in roi), frame.shape[1], frame.shape[0]))
+    args["roi"] = roi
 
-    # flip horizontally and vertically
-    frame = cv2.flip(frame, -1)
+quality = AdaptiveQuality(args["quality"], args["min_quality"],
+    args["max_quality"], args["target_rtt"])
 
-    # begins a try/catch block
-    try:
-        # be patient for 5 seconds
-        with Patience(TIMEOUT):
-            # send an image to the ImageHub
-            hub_reply = sender.send_image(rpiName, frame)
-
-    # if 5 seconds passed with no response from ImageHub, then catch
-    # the timeout
-    except Patience.Timeout:
-        print('TIMOUT: No imagehub reply for ' + str(int(TIMEOUT)) + ' seconds')
-        print('RESTART: The systemd service handles restarting this script if it is running')
+# the capture, encode and send stages each run in their own thread and
+# hand the latest frame to the next stage, so the frame rate is limited by
+# the slowest stage instead of the sum of all three
+captured = LatestQueue()
+encoded = LatestQueue()
+
+motion = MotionDetector(args["motion_threshold"], hold=args["motion_hold"]) \
+    if args["motion"] else None
+
+def capture():
+    last = None
+    frameNumber = 0
+    while True:
+        # read a frame from the camera stream, skipping the ones we've
+        # already seen
+        frame = vs.read()
+        if frame is None or frame is last:
+            time.sleep(0.005)
+            continue
+        last = frame
+        frameNumber += 1
+        captured.put((frame, frameNumber, time.monotonic()))
+
+def encode():
+    lastSent = 0
+    while True:
+        (frame, frameNumber, captureTime) = captured.get()
+        start = time.monotonic()
+
+        # flip horizontally and vertically
+        frame = cv2.flip(frame, -1)
+
+        # crop to the court
+        if args["roi"] is not None:
+            (x, y, w, h) = args["roi"]
+            frame = frame[y:y + h, x:x + w]
+
+        # while nothing moves, only send a keepalive frame now and then
+        if motion is not None and not motion.update(frame) and \
+            time.time() - lastSent < args["keepalive"]:
+            continue
+        lastSent = time.time()
+
+        # downscale to the width the hub works at
+        if args["width"] > 0 and frame.shape[1] > args["width"]:
+            frame = imutils.resize(frame, width=args["width"])
+
+        if not args["raw"]:
+            (ok, frame) = cv2.imencode(".jpg", frame,
+                [int(cv2.IMWRITE_JPEG_QUALITY), quality.quality])
+        encoded.put((frame, frameNumber, captureTime, time.monotonic() - start))
+
+def send():
+    seq = 0
+    while True:
+        # send an image to the ImageHub along with its metadata
+        (payload, frameNumber, captureTime, encodeTime) = encoded.get()
+        seq += 1
+        start = time.monotonic()
+        msg = "{}|seq={}|frame={}|cap={:.6f}|enc={:.1f}|sent={:.6f}".format(
+            rpiName, seq, frameNumber, captureTime, encodeTime * 1000, start)
+        if args["raw"]:
+            sender.send_image(msg, payload)
+        else:
+            hub_reply = sender.send_jpg(msg, payload)
+            quality.update(time.monotonic() - start, hub_reply)
+
+for stage in (capture, encode):
+    t = threading.Thread(target=stage)
+    t.daemon = True
+    t.start()
+
+# send from the main thread
+send()
@@ -3,20 +3,23 @@ from PyQt5.QtWidgets import QApplication
 from PyQt5 import QtGui
 from views.viewsui import MainWindow
 
-# start application with windows for each camera
-app = QApplication([])
+# the ball detection workers are spawned and import this module again, so
+# only start the application when it is run directly
+if __name__ == "__main__":
+    # start application with windows for each camera
+    app = QApplication([])
 
-# load and set the application icon (Obie)
-app.setWindowIcon(QtGui.QIcon("views/ui/obie.png"))
+    # load and set the application icon (Obie)
+    app.setWindowIcon(QtGui.QIcon("views/ui/obie.png"))
 
-# set the application title
-app.setApplicationName("Obie's Eyes")
+    # set the application title
+    app.setApplicationName("Obie's Eyes")
 
-# start windows
-win = MainWindow()
+    # start windows
+    win = MainWindow()
 
-# show windows
-win.show()
+    # show windows
+    win.show()
 
-# exit app when all windows are closed
-app.exit(app.exec_())
\ No newline at end of file
+    # exit app when all windows are closed
+    app.exit(app.exec_())
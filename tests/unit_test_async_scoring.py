@@ -0,0 +1,131 @@
+# imports
+import sys
+import os
+import random
+import contextlib
+import io
+
+# add the parent directory (absolute, not relative) to the sys.path
+# (this makes the games and benchmarks package imports work)
+sys.path.append(os.path.abspath(os.pardir))
+
+# imports
+from games.bocce.team import Team
+from games.bocce.person import Player
+from games.bocce.frame import Frame
+from games.bocce.cv.detection import DetectionExecutor
+from games.camera.camera import Camera
+from benchmarks.synthetic import SceneGenerator
+
+# the scene and the throwers are seeded, so both paths see the same game
+SEED = 0
+
+# throws after each team's first ball; a detection replaces the frame's
+# pallino with the detected one (which isn't marked as thrown), so every
+# other throw is scored with computer vision
+THROWS = 4
+
+
+class StillCamera(Camera):
+    # a camera which keeps showing the same court
+    def __init__(self, frame):
+        super(StillCamera, self).__init__(name="still")
+        self.last_frame = frame
+        self.frameSequence = 1
+        self.latest = (frame, 1)
+
+
+def new_frame(cam):
+    teamHome = Team("Home")
+    teamHome.set_team_ball_color("red")
+    teamHome.add_player(Player("Home 1", None))
+    teamHome.add_player(Player("Home 2", None))
+    teamAway = Team("Away")
+    teamAway.set_team_ball_color("blue")
+    teamAway.add_player(Player("Away 1", None))
+    teamAway.add_player(Player("Away 2", None))
+
+    # the pallino and each team's first ball don't need computer vision
+    frame = Frame(1, "north", teamHome, teamHome, teamAway, cam, debug=False)
+    frame.initialize_balls(2)
+    for _ in range(3):
+        frame.handle_throw()
+    return frame
+
+
+def scored(frame):
+    # what a throw leaves behind: who is in and where the balls are
+    def coordinates(balls):
+        return sorted(tuple(b.coordinates) for b in balls)
+
+    (inPoints, whoseIn) = (frame.inPoints, frame.whoseIn)
+    if isinstance(whoseIn, tuple):
+        (inPoints, whoseIn) = whoseIn
+    return (inPoints, getattr(whoseIn, "teamName", whoseIn),
+        frame.numThrowsTeamHome, frame.numThrowsTeamAway,
+        tuple(frame.pallino.coordinates),
+        coordinates(frame.teamHome.balls), coordinates(frame.teamAway.balls))
+
+
+def play_sync(cam):
+    random.seed(SEED)
+    frame = new_frame(cam)
+    results = []
+    for _ in range(THROWS):
+        vision = frame.needs_detection()
+        frame.handle_throw()
+        results.append((vision, scored(frame)))
+    return results
+
+
+def play_async(cam, executor):
+    # what the GUI does: detect the snapshot with the counts before the
+    # throw, make the throw and detect again with the counts after it
+    def detect(frame):
+        return executor.submit(cam.last_frame, frame.numThrowsTeamHome,
+            frame.numThrowsTeamAway, camName=cam.name).result()
+
+    random.seed(SEED)
+    frame = new_frame(cam)
+    results = []
+    for _ in range(THROWS):
+        # like the GUI, only throws which need computer vision are detected
+        vision = frame.needs_detection()
+        if not vision:
+            frame.handle_throw()
+        else:
+            frame.handle_throw(detection=detect(frame), deferScoring=True)
+            frame.score_throw(detection=detect(frame))
+        results.append((vision, scored(frame)))
+    return results
+
+
+if __name__ == "__main__":
+    # render a court
+    print("\n[INFO] Rendering a synthetic court...")
+    (court, truth) = SceneGenerator().render(2, 2, seed=SEED)
+    cam = StillCamera(court)
+
+    # score the same throws in this process and in a worker process
+    print("\n[INFO] Scoring {} throws synchronously and asynchronously..."
+        .format(THROWS))
+    executor = DetectionExecutor()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            syncResults = play_sync(cam)
+            asyncResults = play_async(cam, executor)
+    finally:
+        executor.shutdown(wait=True)
+
+    for (i, ((vision, s), (_, a))) in enumerate(zip(syncResults,
+        asyncResults)):
+        print("throw {}{}: sync in={} points={}, async in={} points={}".format(
+            i + 1, " (vision)" if vision else "", s[1], s[0], a[1], a[0]))
+
+    if not any(vision for (vision, s) in syncResults):
+        print("\n[FAIL] none of the throws were scored with computer vision")
+        sys.exit(1)
+    if syncResults != asyncResults:
+        print("\n[FAIL] the asynchronous path scored the throws differently")
+        sys.exit(1)
+    print("\n[PASS] both paths scored the throws the same")
@@ -0,0 +1,70 @@
+# imports
+import sys
+import os
+
+# add the parent directory (absolute, not relative) to the sys.path
+# (this makes the games package imports work)
+sys.path.append(os.path.abspath(os.pardir))
+
+# imports
+from games.bocce.court import Court
+from games.bocce.courtfarm import CAMERA_TYPES, make_camera
+
+# a source for each camera type, as it is typed into the config tab, and
+# the attributes the camera parses out of it
+SOURCES = {
+    "USBCamera": ("0", ("source",)),
+    "RTSPCamera": ("rtsp://10.0.0.20:554/stream1", ("source",)),
+    "ImageZMQCamera": ("10.0.0.21,5556", ("source", "port")),
+    "PubSubImageZMQCamera": ("10.0.0.22", ("source", "hostname", "port")),
+    "ReplayCamera": ("recordings/court.avi,fast", ("source", "speed")),
+    "HubCamera": ("10.0.0.23:5557,pi-court,sub",
+        ("source", "address", "rpiName", "mode")),
+}
+
+# every camera a CourtWorker can open needs a source here
+missing = set(CAMERA_TYPES) - set(SOURCES)
+if missing:
+    print("[FAIL] no test source for {}".format(", ".join(sorted(missing))))
+    sys.exit(1)
+
+# put one of each camera on a court
+print("\n[INFO] Creating one camera of each type on a court...")
+court = Court("Sidewalk", "north-south")
+cameras = {}
+for (cameraType, (source, attributes)) in sorted(SOURCES.items()):
+    cam = CAMERA_TYPES[cameraType](name=cameraType.lower(), source=source,
+        flip=True)
+    court.add_birdseye_cam(cam)
+    cameras[cam.name] = cam
+
+# build them again from the specs the court sends to its worker process
+print("\n[INFO] Rebuilding the cameras from the court's camera specs...")
+failures = 0
+for spec in court.camera_specs():
+    (cameraType, name, source, flip) = spec
+    try:
+        rebuilt = make_camera(cameraType, name, source, flip)
+    except Exception as e:
+        print("[FAIL] {}: {}: {}".format(cameraType, type(e).__name__, e))
+        failures += 1
+        continue
+
+    original = cameras[name]
+    checks = ("name", "flip", "spec") + SOURCES[cameraType][1]
+    different = [a for a in checks
+        if getattr(rebuilt, a) != getattr(original, a)]
+    if different or rebuilt.supervisor.name != name:
+        print("[FAIL] {}: {} differ".format(cameraType,
+            ", ".join(different) or "supervisor name"))
+        failures += 1
+    else:
+        print("{}: {!r} -> {}".format(cameraType, source, ", ".join(
+            "{}={!r}".format(a, getattr(rebuilt, a))
+            for a in SOURCES[cameraType][1])))
+
+if failures:
+    print("\n[FAIL] {} of {} cameras didn't survive the round trip".format(
+        failures, len(SOURCES)))
+    sys.exit(1)
+print("\n[PASS] every camera type survives the round trip")
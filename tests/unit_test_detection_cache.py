@@ -0,0 +1,85 @@
+# imports
+import sys
+import os
+import contextlib
+import io
+
+# add the parent directory (absolute, not relative) to the sys.path
+# (this makes the games and benchmarks package imports work)
+sys.path.append(os.path.abspath(os.pardir))
+
+# imports
+import cv2
+from games.bocce.cv.ballfinder import BallFinder
+from games.bocce.cv.detection import DetectionCache
+from benchmarks.synthetic import SceneGenerator
+
+# the scenes are seeded, so the results are the same on every run
+SEEDS = range(3)
+
+# (throwsHome, throwsAway) to look each court up with, i.e. before and
+# after a throw is counted and then again
+COUNTS = [(2, 1), (2, 2), (2, 1), (2, 2)]
+
+
+def add_litter(frame):
+    # a rake lying on the court (bigger than a ball, but not round) and a few
+    # leaves (round, but smaller than a ball), so the detector finds more
+    # candidates than there are balls
+    (h, w) = frame.shape[:2]
+    litter = frame.copy()
+    cv2.rectangle(litter, (20, int(h * .72)), (int(w * .5), int(h * .72) + 8),
+        (40, 40, 40), -1)
+    for (i, x) in enumerate(range(60, int(w * .7), 80)):
+        cv2.circle(litter, (x, int(h * .25) + 6 * (i % 2)), 5, (30, 60, 90), -1)
+    return litter
+
+
+def balls(pallino, homeBalls, awayBalls):
+    # what a detection is scored with
+    def coordinates(balls):
+        return sorted((tuple(b.coordinates), tuple(b.frameCoordinates))
+            for b in balls)
+
+    return (None if pallino is None else tuple(pallino.coordinates),
+        coordinates(homeBalls), coordinates(awayBalls))
+
+
+def uncached(frame, throwsHome, throwsAway):
+    bf = BallFinder(debug=False)
+    bf.pipeline(frame, throwsHome, throwsAway, camName="cam")
+    return balls(bf.pallino, bf.homeBalls, bf.awayBalls)
+
+
+# render the scenes
+print("\n[INFO] Rendering {} synthetic courts...".format(len(SEEDS)))
+generator = SceneGenerator()
+scenes = [add_litter(generator.render(2, 2, seed=seed)[0]) for seed in SEEDS]
+
+# look every court up with each set of counts, by frame sequence number and
+# by frame hash, and compare with running the pipeline every time
+print("\n[INFO] Comparing cached and uncached detections...")
+cache = DetectionCache()
+mismatches = 0
+for (seed, frame) in zip(SEEDS, scenes):
+    for (throwsHome, throwsAway) in COUNTS:
+        for frameSequence in (seed, None):
+            with contextlib.redirect_stdout(io.StringIO()):
+                cached = cache.detect(BallFinder(debug=False), frame,
+                    throwsHome, throwsAway, camName="cam",
+                    frameSequence=frameSequence)
+                expected = uncached(frame, throwsHome, throwsAway)
+            if balls(*cached.balls()) != expected:
+                print("[WARN] seed {}, counts {}/{}, {}: cached balls differ"
+                    .format(seed, throwsHome, throwsAway,
+                    "by sequence" if frameSequence is not None else "by hash"))
+                mismatches += 1
+
+print("cache hits={}, misses={}".format(cache.hits, cache.misses))
+
+# each (court, counts) pair is detected once per key type and hit after that
+if mismatches or cache.hits != cache.misses:
+    print("\n[FAIL] {} cached detections differ from the pipeline".format(
+        mismatches))
+    sys.exit(1)
+print("\n[PASS] cached detections match the pipeline")
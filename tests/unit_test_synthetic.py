@@ -0,0 +1,60 @@
+# imports
+import sys
+import os
+import contextlib
+import io
+
+# add the parent directory (absolute, not relative) to the sys.path
+# (this makes the games and benchmarks package imports work)
+sys.path.append(os.path.abspath(os.pardir))
+
+# imports
+from games.bocce.cv.ballfinder import BallFinder
+from benchmarks.synthetic import SceneGenerator, evaluate
+
+# the scenes are seeded, so the results are the same on every run
+SEEDS = range(5)
+THROWS_HOME = 2
+THROWS_AWAY = 2
+
+# render the scenes
+print("\n[INFO] Rendering {} synthetic courts...".format(len(SEEDS)))
+generator = SceneGenerator()
+scenes = [generator.render(THROWS_HOME, THROWS_AWAY, seed=seed)
+    for seed in SEEDS]
+
+# find the balls and compare them with the ground truth
+print("\n[INFO] Finding the balls...")
+results = []
+for (seed, (frame, truth)) in zip(SEEDS, scenes):
+    bf = BallFinder(debug=False)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            bf.pipeline(frame, THROWS_HOME, THROWS_AWAY)
+    except Exception as e:
+        print("[WARN] seed {}: pipeline failed: {}".format(seed,
+            str(e).strip().splitlines()[0]))
+    r = evaluate(bf, truth)
+    results.append(r)
+    print("seed {}: found {}/{} balls, error={}, pallino={}, teams={}, "
+        "scored={}".format(seed, r["found"], r["expected"],
+        "-" if r["error"] is None else "{:.1f}px".format(r["error"]),
+        r["pallino"], r["teams"], r["scored"]))
+
+# summarize
+found = sum(r["found"] for r in results)
+expected = sum(r["expected"] for r in results)
+print("\n[INFO] Found {} of {} balls ({:.0%})".format(found, expected,
+    found / float(expected)))
+print("[INFO] Pallino found in {} of {} scenes".format(
+    sum(r["pallino"] for r in results), len(results)))
+print("[INFO] Teams grouped right in {} of {} scenes".format(
+    sum(r["teams"] for r in results), len(results)))
+print("[INFO] Frame scored right in {} of {} scenes".format(
+    sum(r["scored"] for r in results), len(results)))
+
+# every ball should at least be found in these clean scenes
+if found < expected:
+    print("\n[FAIL] missed {} balls".format(expected - found))
+    sys.exit(1)
+print("\n[PASS] all balls found")
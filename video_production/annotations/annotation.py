@@ -21,3 +21,31 @@ class Annotation():
     """annotation logic happens here"""
     def _annotate(self, frame, *args, **kwargs):
         pass
+
+    """inputs the rendered overlay depends on (must be hashable)"""
+    def key(self, *args, **kwargs):
+        # inactive annotations don't draw anything
+        if self.active:
+            return self._key(*args, **kwargs)
+
+        # otherwise, don't render
+        else:
+            return None
+
+    def _key(self, *args, **kwargs):
+        return ()
+
+    """overlay is expected to be in BGRA color space; returns the dirty
+    rectangles as a list of (x, y, w, h)"""
+    def render(self, overlay, *args, **kwargs):
+        # render if this annotation is active
+        if self.active:
+            return self._render(overlay, *args, **kwargs)
+
+        # otherwise, don't render
+        else:
+            return []
+
+    """overlay rendering logic happens here"""
+    def _render(self, overlay, *args, **kwargs):
+        return []
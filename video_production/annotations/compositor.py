@@ -0,0 +1,127 @@
+# imports
+import numpy as np
+
+
+def alpha_blend(frame, bgra, x, y):
+    # clip the sprite to the frame
+    (h, w) = frame.shape[:2]
+    (sH, sW) = bgra.shape[:2]
+    (x0, y0) = (max(x, 0), max(y, 0))
+    (x1, y1) = (min(x + sW, w), min(y + sH, h))
+    if x1 <= x0 or y1 <= y0:
+        return frame
+
+    # blend the sprite onto the frame region in place
+    sprite = bgra[y0 - y:y1 - y, x0 - x:x1 - x]
+    alpha = sprite[:, :, 3:].astype("uint16")
+    premultiplied = sprite[:, :, :3] * alpha
+    blend_region(frame[y0:y1, x0:x1], premultiplied, 255 - alpha)
+    return frame
+
+
+def paste(overlay, bgra, x, y):
+    # clip the sprite to the overlay
+    (h, w) = overlay.shape[:2]
+    (sH, sW) = bgra.shape[:2]
+    (x0, y0) = (max(x, 0), max(y, 0))
+    (x1, y1) = (min(x + sW, w), min(y + sH, h))
+    if x1 <= x0 or y1 <= y0:
+        return overlay
+
+    # copy the sprite's visible pixels into the overlay
+    sprite = bgra[y0 - y:y1 - y, x0 - x:x1 - x]
+    np.copyto(overlay[y0:y1, x0:x1], sprite, where=sprite[:, :, 3:] > 0)
+    return overlay
+
+
+def blend_region(roi, premultiplied, inverseAlpha):
+    # out = (fg * a + bg * (255 - a)) / 255, rounded, for a whole region at
+    # once in integer math
+    blended = roi * inverseAlpha
+    blended += premultiplied
+    blended += 127
+    blended //= 255
+    roi[...] = blended
+
+
+def merge_rects(rects):
+    # merge overlapping rectangles so that no pixel is blended twice
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                (ax, ay, aw, ah) = rects[i]
+                (bx, by, bw, bh) = rects[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    x = min(ax, bx)
+                    y = min(ay, by)
+                    rects[i] = (x, y, max(ax + aw, bx + bw) - x,
+                        max(ay + ah, by + bh) - y)
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+class Compositor():
+    """
+    Collects the active annotations into one cached BGRA overlay layer. The
+    layer is only re-rendered when an annotation's inputs (its key) change,
+    and it is blended onto the frame only inside its dirty rectangles.
+    """
+    def __init__(self):
+        self.keys = None
+        self.overlay = None
+
+        # per dirty rectangle: (x, y, w, h), premultiplied BGR and the
+        # inverse alpha, precomputed at render time
+        self.regions = []
+
+    def compose(self, frame, layers):
+        # layers is a list of (annotation, kwargs) in drawing order
+        keys = (frame.shape,) + tuple(
+            annotation.key(**kwargs) for (annotation, kwargs) in layers)
+
+        # re-render the overlay only when its inputs changed
+        if keys != self.keys:
+            self.render(frame.shape, layers)
+            self.keys = keys
+
+        # blend the overlay onto the frame (in place) within the dirty
+        # rectangles
+        for (x, y, w, h, premultiplied, inverseAlpha) in self.regions:
+            blend_region(frame[y:y + h, x:x + w], premultiplied, inverseAlpha)
+
+        return frame
+
+    def render(self, shape, layers):
+        # draw every active annotation into a fresh transparent overlay
+        (h, w) = shape[:2]
+        self.overlay = np.zeros((h, w, 4), dtype="uint8")
+        rects = []
+        for (annotation, kwargs) in layers:
+            rects.extend(annotation.render(self.overlay, **kwargs))
+
+        # clip the dirty rectangles to the frame and drop the empty ones
+        clipped = []
+        for (x, y, rW, rH) in rects:
+            (x0, y0) = (max(int(x), 0), max(int(y), 0))
+            (x1, y1) = (min(int(x + rW), w), min(int(y + rH), h))
+            if x1 > x0 and y1 > y0:
+                clipped.append((x0, y0, x1 - x0, y1 - y0))
+
+        # precompute the blending terms for each region
+        self.regions = []
+        for (x, y, rW, rH) in merge_rects(clipped):
+            region = self.overlay[y:y + rH, x:x + rW]
+            alpha = region[:, :, 3:].astype("uint16")
+            premultiplied = region[:, :, :3] * alpha
+            self.regions.append((x, y, rW, rH, premultiplied, 255 - alpha))
+
+    def invalidate(self):
+        # force the overlay to be re-rendered for the next frame
+        self.keys = None
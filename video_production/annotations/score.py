@@ -36,24 +36,75 @@ class Score(Annotation):
                 "fonts/Luckiest_Guy/LuckiestGuy-Regular.ttf",
                 size=220)
 
+        # load the scoreboard graphic once; each score is drawn onto a copy
+        if unit_test:
+            self.scoreboard = Image.open("../graphics/scoreboard.png")
+        else:
+            self.scoreboard = Image.open("video_production/graphics/scoreboard.png")
+        self.scoreboard.load()
 
+        # finished BGR scoreboard sprites keyed by (score, frame width,
+        # relative frame size); only sprites for the current score are kept
+        self.sprites = {}
+        self.spritesScore = None
 
     def _annotate(self, frame, score=None, relFrameSize=0.20, *args, **kwargs):
         # force score to 0-0 if no score is passed or if it is unknown
         if score is None:
             score = (0, 0)
 
+        # grab the pre-rendered scoreboard for this score and frame width
+        h, w = frame.shape[:2]
+        scoreboard = self.get_sprite(tuple(score), w, relFrameSize)
+        sH, sW = scoreboard.shape[:2]
+
+        # slice the scoreboard into the frame
+        frame[20:20+sH, 20:20+sW] = scoreboard
+
+        # return the frame
+        return frame
+
+    def _key(self, score=None, relFrameSize=0.20, *args, **kwargs):
+        return (None if score is None else tuple(score), relFrameSize)
+
+    def _render(self, overlay, score=None, relFrameSize=0.20, *args, **kwargs):
+        # force score to 0-0 if no score is passed or if it is unknown
+        if score is None:
+            score = (0, 0)
+
+        # grab the pre-rendered scoreboard for this score and frame width
+        h, w = overlay.shape[:2]
+        scoreboard = self.get_sprite(tuple(score), w, relFrameSize)
+        sH, sW = scoreboard.shape[:2]
+
+        # draw the (opaque) scoreboard into the overlay
+        overlay[20:20+sH, 20:20+sW, :3] = scoreboard
+        overlay[20:20+sH, 20:20+sW, 3] = 255
+
+        # return the dirty rectangle
+        return [(20, 20, sW, sH)]
+
+    def get_sprite(self, score, frameWidth, relFrameSize):
+        # evict the cached sprites when the score changes
+        if score != self.spritesScore:
+            self.sprites = {}
+            self.spritesScore = score
+
+        # render the sprite if we haven't already for this frame size
+        key = (score, frameWidth, relFrameSize)
+        if key not in self.sprites:
+            self.sprites[key] = self.render_sprite(score, frameWidth,
+                relFrameSize)
+
+        return self.sprites[key]
+
+    def render_sprite(self, score, frameWidth, relFrameSize):
         # convert to string and fill with another digit
         teamHomeScore = str(score[0]).zfill(2)
         teamAwayScore = str(score[1]).zfill(2)
 
-        if unit_test:
-            scoreboard = Image.open(
-                "../graphics/scoreboard.png")
-        else:
-            scoreboard = Image.open("video_production/graphics/scoreboard.png")
-
-        # prepare the image for drawing
+        # prepare a copy of the scoreboard for drawing
+        scoreboard = self.scoreboard.copy()
         draw = ImageDraw.Draw(scoreboard)
 
         # determine the placement of characters
@@ -90,15 +141,7 @@ class Score(Annotation):
         scoreboard = cv2.cvtColor(np.array(scoreboard), cv2.COLOR_RGBA2BGR)
 
         # resize the scoreboard relative to the frame
-        h, w = frame.shape[:2]
-        scoreboard = imutils.resize(scoreboard, width=int(w * relFrameSize))
-        sH, sW = scoreboard.shape[:2]
-
-        # slice the scoreboard into the frame
-        frame[20:20+sH, 20:20+sW] = scoreboard
-
-        # return the frame
-        return frame
+        return imutils.resize(scoreboard, width=int(frameWidth * relFrameSize))
 
 
 
@@ -7,6 +7,7 @@ from scipy.spatial import distance as dist
 # typically we'll import modularly
 try:
     from .annotation import Annotation
+    from .compositor import alpha_blend, paste
     unit_test = False
 
 # otherwise, we're running main test code at the bottom of this script
@@ -15,6 +16,7 @@ except:
     import os
     sys.path.append(os.path.abspath(os.pardir))
     from annotation import Annotation
+    from compositor import alpha_blend, paste
 
     unit_test = True
 
@@ -36,16 +38,69 @@ class Vectors(Annotation):
                 "fonts/Luckiest_Guy/LuckiestGuy-Regular.ttf",
                 size=30)
 
+        # rendered text sprites keyed by text
+        self.textSprites = {}
+
     # todo sometimes the second balls are "tooCloseToCall"
     # todo need to account for that in the future
     def _annotate(self, frame, pallino=None, homeBalls=None, awayBalls=None, *args, **kwargs):
         # ball format is list of Ball objects
+        measurement = self.measure(pallino, homeBalls, awayBalls)
+        if measurement is None:
+            return frame
+        (vectors, tooClose) = measurement
+
+        # draw the "closer team's" closest ball vectors
+        for (start, end, color) in vectors:
+            frame = cv2.line(frame, start, end, color, 3)
+
+        # inform the umpire that they need to measure
+        if tooClose:
+            (h, w) = frame.shape[:2]
+            for (text, (x, y)) in self.get_umpire_text(w, h):
+                alpha_blend(frame, self.get_text_sprite(text), x, y)
+
+        return frame
+
+    def _key(self, pallino=None, homeBalls=None, awayBalls=None, *args, **kwargs):
+        # the vectors only change when a ball moves
+        if pallino is None or not homeBalls or not awayBalls:
+            return None
+        return ((pallino.coordinates, pallino.color),
+                tuple((b.coordinates, b.color) for b in homeBalls),
+                tuple((b.coordinates, b.color) for b in awayBalls))
+
+    def _render(self, overlay, pallino=None, homeBalls=None, awayBalls=None, *args, **kwargs):
+        measurement = self.measure(pallino, homeBalls, awayBalls)
+        if measurement is None:
+            return []
+        (vectors, tooClose) = measurement
+
+        # draw the "closer team's" closest ball vectors (opaque)
+        rects = []
+        for (start, end, color) in vectors:
+            cv2.line(overlay, start, end, tuple(color[:3]) + (255,), 3)
+            rects.append((min(start[0], end[0]) - 3, min(start[1], end[1]) - 3,
+                abs(start[0] - end[0]) + 7, abs(start[1] - end[1]) + 7))
+
+        # inform the umpire that they need to measure
+        if tooClose:
+            (h, w) = overlay.shape[:2]
+            for (text, (x, y)) in self.get_umpire_text(w, h):
+                sprite = self.get_text_sprite(text)
+                paste(overlay, sprite, x, y)
+                rects.append((x, y, sprite.shape[1], sprite.shape[0]))
+
+        return rects
 
+    def measure(self, pallino, homeBalls, awayBalls):
         if pallino is None:
             print("not annotating; couldn't find pallino")
+            return None
 
-        # grab frame dimensions
-        (h, w) = frame.shape[:2]
+        # we need at least one ball from each team to compare
+        if not homeBalls or not awayBalls:
+            return None
 
         # calculate Euclidean distance for each ball to the pallino
         homeBallsDistances = []
@@ -58,8 +113,10 @@ class Vectors(Annotation):
             awayBallsDistances.append(D)
 
         # sort balls and distances
-        homeBallsDistances, homeBalls = zip(*sorted(zip(homeBallsDistances, homeBalls)))
-        awayBallsDistances, awayBalls = zip(*sorted(zip(awayBallsDistances, awayBalls)))
+        homeBallsDistances, homeBalls = zip(*sorted(zip(homeBallsDistances, homeBalls),
+            key=lambda db: db[0]))
+        awayBallsDistances, awayBalls = zip(*sorted(zip(awayBallsDistances, awayBalls),
+            key=lambda db: db[0]))
 
         # grab each min distance (the 0th element in the sorted list)
         homeBallsMinDistance = homeBallsDistances[0]
@@ -73,49 +130,53 @@ class Vectors(Annotation):
         # check if it is "too close to call"
         tooCloseToCall = abs(homeBallsMinDistance - awayBallsMinDistance) <= TOO_CLOSE_MARGIN
 
-
-        # draw the "closer team's" closest ball vectors
+        # find the "closer team's" closest ball vectors
+        vectors = []
         if homeIsCloser:
-            frame, framePoints = self.draw_lines_and_get_frame_points(frame, pallino,
+            vectors, framePoints = self.get_vectors_and_frame_points(pallino,
                 homeBalls, homeBallsDistances, awayBalls, awayBallsDistances)
         elif awayIsCloser:
-            frame, framePoints = self.draw_lines_and_get_frame_points(frame, pallino,
+            vectors, framePoints = self.get_vectors_and_frame_points(pallino,
                 awayBalls, awayBallsDistances, homeBalls, homeBallsDistances)
 
-        # inform the umpire that they need to measure
-        if tooCloseToCall or equidistant:
-            # load the image for annotation with PIL
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame = Image.fromarray(frame)
-            draw = ImageDraw.Draw(frame)
-            draw.text(xy=(int(w * .5), int(h * .25)),
-                      text="Too close:",
-                      align="center",
-                      font=self.font)
-            draw.text(xy=(int(w * .5), int(h * .75)),
-                      text="Umpire please measure!",
-                      align="center",
-                      font=self.font)
+        return vectors, tooCloseToCall or equidistant
 
-            frame = cv2.cvtColor(np.array(frame), cv2.COLOR_RGBA2BGR)
-
-        return frame
-
-    def draw_lines_and_get_frame_points(self, frame, pallino, teamA_balls_sorted,
+    def get_vectors_and_frame_points(self, pallino, teamA_balls_sorted,
         teamA_distances_sorted, teamB_balls_sorted, teamB_distances_sorted):
 
-        # draw the closest vectors and at the same time calculate the points for this frame
+        # find the closest vectors and at the same time calculate the points for this frame
         framePoints = 0
+        vectors = []
         for (i, dB) in enumerate(teamB_distances_sorted):
             for (j, dA) in enumerate(teamA_distances_sorted):
                 if dA < dB:
                     framePoints += 1
-                    frame = cv2.line(frame, pallino.coordinates,
-                        teamA_balls_sorted[j].coordinates, teamA_balls_sorted[j].color, 3)
+                    vectors.append((pallino.coordinates,
+                        teamA_balls_sorted[j].coordinates, teamA_balls_sorted[j].color))
                 else:
                     break
             break
-        return frame, framePoints
+        return vectors, framePoints
+
+    def get_umpire_text(self, w, h):
+        return (("Too close:", (int(w * .5), int(h * .25))),
+                ("Umpire please measure!", (int(w * .5), int(h * .75))))
+
+    def get_text_sprite(self, text):
+        # render the text once with PIL into a small BGRA sprite rather than
+        # converting the whole frame to PIL on every frame
+        if text not in self.textSprites:
+            (left, top, right, bottom) = self.font.getbbox(text)
+            sprite = Image.new("RGBA", (right, bottom), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(sprite)
+            draw.text(xy=(0, 0),
+                      text=text,
+                      align="center",
+                      font=self.font,
+                      fill=(255, 255, 255, 255))
+            self.textSprites[text] = cv2.cvtColor(np.array(sprite), cv2.COLOR_RGBA2BGRA)
+
+        return self.textSprites[text]
 
 
 # test code
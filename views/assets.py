@@ -0,0 +1,49 @@
+# imports
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+# UI images
+CHECK_GRAY = "views/ui/check_gray.png"
+OBIE = "views/ui/obie.png"
+ODDBALL = "views/ui/oddball.png"
+
+# (path, size, width) of the UI images used while scoring; these are loaded
+# once at startup so no disk I/O or resizing happens when the umpire clicks
+UI_ASSETS = [
+    (CHECK_GRAY, (25, 25), None),
+    (CHECK_GRAY, (50, 50), None),
+    (OBIE, (50, 50), None),
+    (ODDBALL, None, 600),
+]
+
+
+class AssetCache():
+    def __init__(self):
+        # ready-to-use pixmaps keyed by (path, size, width)
+        self.pixmaps = {}
+
+    def preload(self, assets=UI_ASSETS):
+        for (path, size, width) in assets:
+            self.get_pixmap(path, size=size, width=width)
+
+    def get_pixmap(self, path, size=None, width=None):
+        # size is a (width, height) tuple; width alone keeps the aspect ratio
+        key = (path, size, width)
+        if key not in self.pixmaps:
+            self.pixmaps[key] = self.load_pixmap(path, size, width)
+        return self.pixmaps[key]
+
+    def load_pixmap(self, path, size=None, width=None):
+        # Qt keeps the alpha channel and the RGB order of the PNG
+        image = QImage(path)
+        if image.isNull():
+            raise IOError("couldn't load UI image {}".format(path))
+
+        # resize once
+        if size is not None:
+            image = image.scaled(size[0], size[1], Qt.IgnoreAspectRatio,
+                Qt.SmoothTransformation)
+        elif width is not None:
+            image = image.scaledToWidth(width, Qt.SmoothTransformation)
+
+        return QPixmap.fromImage(image)
@@ -0,0 +1,41 @@
+# imports
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+
+# Qt >= 5.14 can display BGR pixels directly
+HAS_BGR888 = hasattr(QImage, "Format_BGR888")
+
+
+class DisplayImage():
+    """
+    Wraps a BGR frame in a QImage without a color conversion or a copy (when
+    Qt supports Format_BGR888). The QImage doesn't own its pixels, so this
+    object keeps the array alive for as long as the image is in use.
+    """
+    def __init__(self, frame):
+        # fall back to converting to RGB on Qt versions without BGR888
+        if HAS_BGR888:
+            imageFormat = QImage.Format_BGR888
+        else:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            imageFormat = QImage.Format_RGB888
+
+        # QImage needs contiguous rows
+        self.frame = np.ascontiguousarray(frame)
+        height, width = self.frame.shape[:2]
+        bytesPerLine = self.frame.strides[0]
+        self.image = QImage(self.frame.data, width, height, bytesPerLine,
+            imageFormat)
+
+    def pixmap(self):
+        return QPixmap.fromImage(self.image)
+
+
+def show_frame(label, frame):
+    # paint a BGR frame into a label and schedule (rather than force) the
+    # repaint
+    displayImage = DisplayImage(frame)
+    label.setPixmap(displayImage.pixmap())
+    label.update()
+    return displayImage
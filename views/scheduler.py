@@ -0,0 +1,87 @@
+# imports
+import time
+
+
+class DisplayScheduler():
+    """
+    Decides when the preview is repainted: only when the camera has a new
+    frame, never faster than the GUI keeps up with, and with at most one
+    frame in flight so stale frames are skipped instead of queued. Capture,
+    recording and detection don't go through here, so they keep running at
+    full rate when the preview slows down.
+    """
+    def __init__(self, minInterval=30, maxInterval=250, pendingTimeout=1.0):
+        # preview interval bounds in milliseconds
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.interval = minInterval
+
+        # give up waiting on a frame the GUI never acknowledged
+        self.pendingTimeout = pendingTimeout
+
+        self.lastCamera = None
+        self.lastSequence = None
+        self.pending = False
+        self.renderStart = None
+        self.lastRender = 0
+
+        # stats
+        self.shown = 0
+        self.skipped = 0
+
+    def should_render(self, camera):
+        # only one frame may be in flight to the GUI at a time
+        if self.pending:
+            if time.time() - self.renderStart < self.pendingTimeout:
+                return False
+            self.pending = False
+
+        # respect the adaptive preview interval
+        if (time.time() - self.lastRender) * 1000 < self.interval:
+            return False
+
+        # only render when the camera produced a new frame
+        if camera is self.lastCamera and camera.frameSequence == self.lastSequence:
+            return False
+
+        return True
+
+    def rendering(self, camera):
+        # count the frames the preview skipped since the last one it showed
+        sequence = camera.frameSequence
+        if camera is self.lastCamera and self.lastSequence is not None:
+            self.skipped += max(sequence - self.lastSequence - 1, 0)
+
+        self.lastCamera = camera
+        self.lastSequence = sequence
+        self.pending = True
+        self.renderStart = time.time()
+        self.lastRender = self.renderStart
+
+    def displayed(self):
+        # called from the GUI thread once a frame has been handed to Qt
+        if not self.pending:
+            return
+        self.pending = False
+        self.shown += 1
+
+        # back off quickly when rendering plus the GUI round trip takes
+        # longer than the interval, and recover slowly when it keeps up
+        latency = (time.time() - self.renderStart) * 1000
+        if latency > self.interval:
+            self.interval = min(self.interval * 1.5, self.maxInterval)
+        else:
+            self.interval = max(self.interval * 0.9, self.minInterval)
+
+    def failed(self):
+        # called when a frame couldn't be rendered; nothing is in flight, so
+        # the next new frame may be rendered right away
+        self.pending = False
+
+    def next_delay(self):
+        # milliseconds until the next frame is due; once it is due (or while
+        # the GUI is busy) poll every 5ms for a new frame
+        if self.pending:
+            return 5
+        remaining = self.interval - (time.time() - self.lastRender) * 1000
+        return int(max(remaining, 5))
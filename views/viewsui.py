@@ -1,6 +1,8 @@
+import copy
 import sys
 
 import os
+import time
 
 # add the parent directory (absolute, not relative) to the sys.path
 # (this makes the games package imports work)
@@ -10,10 +12,15 @@ import cv2
 import imutils
 from PyQt5 import QtCore, QtWidgets
 from PyQt5 import uic
-from PyQt5.QtCore import QThread, QTimer
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap, QColor
 from PyQt5.QtWidgets import QTableWidgetItem
 from games.bocce.cv import ballfinder
+from games.bocce.cv.detection import DetectionExecutor
+from views.display import DisplayImage, show_frame
+from views.scheduler import DisplayScheduler
+from views.wall import CameraWall
+from views.assets import AssetCache, CHECK_GRAY, OBIE, ODDBALL
 
 # bocce imports
 from games.bocce.venue import Venue
@@ -21,7 +28,7 @@ from games.bocce.court import Court
 from games.bocce.team import Team
 from games.bocce.person import Player, Umpire
 from games.bocce.game import Game
-from games.camera.camera import USBCamera, RTSPCamera, PubSubImageZMQCamera, ImageZMQCamera
+from games.camera.camera import USBCamera, RTSPCamera, PubSubImageZMQCamera, ImageZMQCamera, ReplayCamera, HubCamera
 
 # video production imports (as A_____ accordingly)
 from video_production.annotations.score import Score as AScore
@@ -31,9 +38,21 @@ from video_production.annotations.time import Time as ATime
 from video_production.annotations.player import Player as APlayer
 from video_production.annotations.balltrails import BallTrails as ABallTrails
 from video_production.annotations.vectors import Vectors as AVectors
+from video_production.annotations.compositor import Compositor
 
 
 
+def in_frame(ball):
+    # a copy of the ball at its camera frame coordinates for drawing on the
+    # frame; balls which weren't detected (i.e. not thrown yet) keep theirs
+    if ball is None:
+        return None
+    ball = copy.copy(ball)
+    if ball.frameCoordinates[0] is not None:
+        ball.coordinates = ball.frameCoordinates
+    return ball
+
+
 class MovieThread(QThread):
     def __init__(self, camera):
         super().__init__()
@@ -47,7 +66,74 @@ class MovieThread(QThread):
     def quit(self):
         self.camera.stop_recording()
 
+class RenderThread(QThread):
+    # display-ready images are handed to the GUI thread via a queued signal
+    frameReady = pyqtSignal(object)
+
+    def __init__(self, compositor, scheduler=None):
+        super().__init__()
+        self.compositor = compositor
+        self.scheduler = DisplayScheduler() if scheduler is None else scheduler
+        self.camera = None
+        self.running = False
+
+        # the annotation layers to draw, replaced wholesale by the GUI thread
+        # (see set_layers) so this thread never reads the live game state
+        self.layers = []
+
+    def set_layers(self, layers):
+        # layers is a list of (annotation, kwargs) built from copies of the
+        # game state on the GUI thread
+        self.layers = layers
+
+    def run(self):
+        self.running = True
+        while self.running:
+            # grab the last frame from the selected camera source, but only
+            # render it if it is new and the GUI is keeping up
+            camera = self.camera
+            frame = None if camera is None else getattr(camera, "last_frame", None)
+            if frame is not None and self.scheduler.should_render(camera):
+                self.scheduler.rendering(camera)
+                annotate = not isinstance(camera, CameraWall)
+
+                # a bad frame or annotation mustn't kill the preview, so
+                # skip it and try the next one
+                try:
+                    self.frameReady.emit(self.render(frame, annotate))
+                except Exception as e:
+                    print("[WARN] couldn't render frame: {}: {}".format(
+                        type(e).__name__, e))
+                    self.compositor.invalidate()
+                    self.scheduler.failed()
+
+            # wait until the next frame is due
+            self.msleep(self.scheduler.next_delay())
+
+    def render(self, frame, annotate=True):
+        # annotate a copy so we don't draw on the frame being recorded (the
+        # camera wall isn't annotated, but it is reused for the next frame)
+        frame = frame.copy()
+        if annotate:
+            # the compositor only re-renders its overlay when an input
+            # changes and blends it onto the frame within the dirty rectangles
+            frame = self.compositor.compose(frame, self.layers)
+
+        # wrap the BGR frame for Qt without converting it; the DisplayImage
+        # keeps the (thread-local) copy alive while the GUI paints it
+        return DisplayImage(frame)
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
 class MainWindow(QtWidgets.QMainWindow):
+    # finished ball detections are posted back to the GUI thread
+    detectionReady = pyqtSignal(object)
+
+    # snapshots of the annotation layers are posted to the render thread
+    annotationsChanged = pyqtSignal(object)
+
     """
     constructor
     """
@@ -81,6 +167,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.label_rec_indicator.hide()
         self.movie_ticker = 0
 
+        # annotation and color conversion happen on the render thread so
+        # they can't freeze the GUI; the GUI thread only swaps pixmaps
+        self.render_thread = None
+        self.display_image = None
+
         # game timer and down/back setting
         self.GAME_MINUTES = None
         self.DOWN_BACK_ENABLED = None
@@ -109,6 +200,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.radioButton_cam7.clicked.connect(self.get_camera_source)
         self.radioButton_cam8.clicked.connect(self.get_camera_source)
 
+        # tiled wall of every active camera; click a tile to focus it
+        self.camera_wall = None
+        self.camera_wall_ids = []
+        self.checkBox_camera_wall.clicked.connect(self.toggle_camera_wall)
+        self.label_camera.installEventFilter(self)
+
         #############
         # annotations
         self.annotation_score = None
@@ -118,6 +215,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.annotation_balltrails = None
         self.annotation_venue = None
         self.annotation_vectors = None
+        self.compositor = None
         # initialize annotations
         self.initialize_annotations()
         # venue
@@ -142,6 +240,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.checkBox_annotation_vectors.clicked.connect(
             lambda:self.annotation_change(self.annotation_vectors, self.checkBox_annotation_vectors))
 
+        # load the UI images once
+        self.assets = AssetCache()
+        self.assets.preload()
+
         # set the no camera image
         self.set_default_img()
 
@@ -160,6 +262,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.pushButton_throw.clicked.connect(self.throw)
         self.pushButton_end_frame.clicked.connect(self.end_frame)
 
+        # balls are detected in a worker process so a throw doesn't freeze
+        # the GUI; start the worker now so the first throw isn't slow
+        self.detector = DetectionExecutor()
+        self.detector.warmup()
+
+        # (snapshot, frame sequence) of each throw still waiting on its
+        # detection, oldest first
+        self.pending_throws = []
+        self.detectionReady.connect(self.detection_ready)
+
     def closeEvent(self, event):
         """
         Runs when the QMainWindow is closed
@@ -174,17 +286,19 @@ class MainWindow(QtWidgets.QMainWindow):
                 getattr(self, "movie_thread_{}".format(t[0])).quit()
                 print("stopped: movie_thread_{} gracefully before exiting".format(t[0]))
 
+        # stop rendering frames for the GUI
+        if self.render_thread is not None:
+            self.render_thread.stop()
 
+        # stop detecting balls
+        self.detector.shutdown()
 
-    def set_default_img(self):
-        frame = cv2.imread('views/ui/oddball.png')
-        frame = imutils.resize(frame, width = 600)
-        height, width, channel = frame.shape
-        bytesPerLine = 3 * width
-        qImg = QImage(frame.data, width, height, bytesPerLine, QImage.Format_RGB888)
 
-        self.label_camera.setPixmap(QPixmap(qImg))
-        self.label_camera.repaint()
+
+    def set_default_img(self):
+        self.display_image = None
+        self.label_camera.setPixmap(self.assets.get_pixmap(ODDBALL, width=600))
+        self.label_camera.update()
 
     def get_camera_source(self):
         """
@@ -219,6 +333,49 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             return None
 
+    def toggle_camera_wall(self):
+        """
+        shows every active camera at once (or goes back to the selected one)
+        :return:
+        """
+        if not self.checkBox_camera_wall.isChecked():
+            self.camera_wall = None
+            self.camera_wall_ids = []
+            return
+
+        # tile the active cameras in the order of the config table
+        table_data = self.get_tableWidget_cameras_data(self.tableWidget_cameras)
+        cameras = []
+        self.camera_wall_ids = []
+        for t in table_data:
+            if t[1] and getattr(self, t[0]) is not None:
+                cameras.append((t[5], getattr(self, t[0])))
+                self.camera_wall_ids.append(t[0])
+        self.camera_wall = CameraWall(cameras)
+
+    def eventFilter(self, obj, event):
+        """
+        focuses the camera whose wall tile was clicked
+        :param obj:
+        :param event:
+        :return:
+        """
+        if obj is self.label_camera and self.camera_wall is not None \
+            and event.type() == QtCore.QEvent.MouseButtonPress:
+            # the label scales its contents, so map the click onto the wall
+            (h, w) = self.camera_wall.canvas.shape[:2]
+            x = event.pos().x() * w / float(self.label_camera.width())
+            y = event.pos().y() * h / float(self.label_camera.height())
+            index = self.camera_wall.tile_at(x, y)
+            if index is not None:
+                # show the full resolution feed of that camera
+                camId = self.camera_wall_ids[index]
+                getattr(self, "radioButton_{}".format(camId)).setChecked(True)
+                self.checkBox_camera_wall.setChecked(False)
+                self.toggle_camera_wall()
+            return True
+        return super().eventFilter(obj, event)
+
     def get_tableWidget_cameras_data(self, item):
         """
         this method reads the config tab camera table data
@@ -293,6 +450,14 @@ class MainWindow(QtWidgets.QMainWindow):
                     if getattr(self, "{}".format(t[0])) is None:
                         setattr(self, t[0], ImageZMQCamera(name=cam_name,
                             source=str(t[4]), flip=t[2]))
+                elif t[3] == "ReplayCamera":
+                    if getattr(self, "{}".format(t[0])) is None:
+                        setattr(self, t[0], ReplayCamera(name=cam_name,
+                            source=str(t[4]), flip=t[2]))
+                elif t[3] == "HubCamera":
+                    if getattr(self, "{}".format(t[0])) is None:
+                        setattr(self, t[0], HubCamera(name=cam_name,
+                            source=str(t[4]), flip=t[2]))
 
                 # initialize the camera
                 getattr(self, t[0]).initialize()
@@ -306,36 +471,25 @@ class MainWindow(QtWidgets.QMainWindow):
         :return:
         """
         cam = self.get_camera_source()[0]
-        frame = cam.get_frame()
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        height, width, channel = frame.shape
-        bytesPerLine = 3 * width
-        qImg = QImage(frame.data, width, height, bytesPerLine, QImage.Format_RGB888)
-        self.label_camera.setPixmap(QPixmap(qImg))
-        self.label_camera.repaint()
+        cam.get_frame()
+        frame = cam.last_frame
+        self.display_image = show_frame(self.label_camera, frame)
         return frame
 
     def update_movie(self):
         """
-        grabs frames from a camera and displays it continuously
+        points the render thread at the selected camera source and blinks the
+        recording indicator; the frames themselves arrive via display_frame()
         :return:
         """
-        # grab the last frame from the selected camera source
-        frame = self.get_camera_source()[0].last_frame
-
-        # annotate the frame
-        frame = self.annotation_pipeline(frame)
-
-        # swap color channels for Qt GUI default
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # render the camera wall or the selected camera source
+        if self.camera_wall is not None:
+            self.render_thread.camera = self.camera_wall
+        else:
+            self.render_thread.camera = self.get_camera_source()[0]
 
-        # paint the label_camera frame area
-        height, width, channel = frame.shape
-        bytesPerLine = 3 * width
-        qImg = QImage(frame.data, width, height,
-            bytesPerLine, QImage.Format_RGB888)
-        self.label_camera.setPixmap(QPixmap(qImg))
-        self.label_camera.repaint()
+        # hand the render thread a snapshot of what to draw
+        self.annotationsChanged.emit(self.annotation_layers())
 
         # blink the recording indicator
         if self.recording:
@@ -349,6 +503,19 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             self.label_rec_indicator.hide()
 
+    def display_frame(self, displayImage):
+        """
+        paints a frame rendered by the render thread (runs on the GUI thread)
+        :param displayImage:
+        :return:
+        """
+        self.display_image = displayImage
+        self.label_camera.setPixmap(displayImage.pixmap())
+        self.label_camera.update()
+
+        # let the scheduler know the GUI kept up so it can adapt the rate
+        self.render_thread.scheduler.displayed()
+
     def start_movie(self):
         """
         starts movie threads for each active camera and sets the camera source to record
@@ -368,6 +535,15 @@ class MainWindow(QtWidgets.QMainWindow):
                     getattr(self, "{}".format(t[0])).set_teams(self.teamHome_name, self.teamAway_name)
                     getattr(self, "{}".format(t[0])).start_recording()
 
+        # start rendering frames for the GUI
+        if self.render_thread is None:
+            self.render_thread = RenderThread(self.compositor)
+            self.render_thread.frameReady.connect(self.display_frame)
+            self.annotationsChanged.connect(self.render_thread.set_layers)
+            self.annotationsChanged.emit(self.annotation_layers())
+            self.render_thread.camera = self.get_camera_source()[0]
+            self.render_thread.start()
+
         self.movie_thread_timer.start(30)
         self.recording = True
         self.pushButton_record.setEnabled(False)
@@ -492,12 +668,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
 
-        frame = cv2.cvtColor(frame_annotated, cv2.COLOR_BGR2RGB)
-        height, width, channel = frame.shape
-        bytesPerLine = 3 * width
-        qImg = QImage(frame.data, width, height, bytesPerLine, QImage.Format_RGB888)
-        self.label_camera.setPixmap(QPixmap(qImg))
-        self.label_camera.repaint()
+        self.display_image = show_frame(self.label_camera, frame_annotated)
 
     def save_config(self):
         self.teamHome_name = self.textEdit_teamHome.toPlainText()
@@ -616,6 +787,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.g.set_cam(oddSideCam, evenSideCam)
         self.g.play_next_frame()
 
+        # forget detections from the previous frame
+        self.detector.cancel()
+        self.pending_throws = []
+
     def end_frame(self):
         self.g.end_frame_and_set_score()
         self.g.print_score()
@@ -644,27 +819,115 @@ class MainWindow(QtWidgets.QMainWindow):
             self.pushButton_end_frame.setEnabled(False)
 
     def throw(self):
-        self.g.currentFrame.handle_throw()
+        frame = self.g.currentFrame
+        cam = frame.cam
+
+        # throws which don't need computer vision are handled right away,
+        # unless an earlier throw is still waiting on its detection
+        (latest, sequence) = (None, None) if cam is None else cam.latest
+        if (not self.pending_throws and not frame.needs_detection()) \
+            or latest is None:
+            frame.handle_throw()
+            self.update_throw_status()
+            return
+
+        # snapshot the court after this throw; throws are scored one at a
+        # time since each one changes the ball counts the next is
+        # detected with
+        self.pending_throws.append((latest.copy(), sequence))
+        if len(self.pending_throws) == 1:
+            self.detect_next_throw()
+
+    def detect_next_throw(self):
+        frame = self.g.currentFrame
+        while self.pending_throws:
+            # an earlier throw may have ended the need for detection
+            if not frame.awaitingDetection and not frame.needs_detection():
+                self.pending_throws.pop(0)
+                frame.handle_throw()
+                continue
+
+            # detect the balls in the oldest snapshot with the current
+            # counts; a throw which is awaiting its score is detected again
+            # with the counts after it
+            (snapshot, frameSequence) = self.pending_throws[0]
+            try:
+                future = self.detector.submit(snapshot,
+                    frame.numThrowsTeamHome, frame.numThrowsTeamAway,
+                    camName=frame.cam.name, calibrator=frame.calibrator,
+                    frameSequence=frameSequence, detector=frame.detector,
+                    refiner=frame.refiner)
+            except Exception as e:
+                # i.e. the worker process died and broke the pool, so score
+                # the throw here rather than losing it
+                print("[ERROR] couldn't start ball detection: {}".format(e))
+                self.pending_throws.pop(0)
+                self.finish_throw(frame)
+                continue
+
+            # the callback runs in the executor's thread, so hand the result
+            # to the GUI thread with a signal
+            future.add_done_callback(self.detectionReady.emit)
+            return
+
+        self.update_throw_status()
+
+    def detection_ready(self, future):
+        # ignore detections which a new frame made stale
+        if self.detector.is_stale(future) or not self.pending_throws:
+            return
+
+        frame = self.g.currentFrame
+        try:
+            detection = future.result()
+        except Exception as e:
+            # score the throw here rather than losing it
+            print("[ERROR] ball detection failed: {}".format(e))
+            self.pending_throws.pop(0)
+            self.finish_throw(frame)
+        else:
+            # keep the worker's court calibration so it isn't redone
+            if detection.calibration is not None \
+                and frame.calibrator is not None \
+                and not frame.calibrator.is_calibrated(detection.camName):
+                frame.calibrator.set_calibration(detection.camName,
+                    detection.calibration)
+
+            # the first detection is of the court before the throw is
+            # counted; the throw is scored once the balls are detected again
+            # with the counts after it
+            if frame.awaitingDetection:
+                self.pending_throws.pop(0)
+                frame.score_throw(detection=detection)
+            else:
+                frame.handle_throw(detection=detection, deferScoring=True)
+                if not frame.awaitingDetection:
+                    self.pending_throws.pop(0)
 
+        # move on to the next detection
+        self.detect_next_throw()
+
+    def finish_throw(self, frame):
+        # score a throw here (synchronously), whether or not it was made yet
+        if frame.awaitingDetection:
+            frame.score_throw()
+        else:
+            frame.handle_throw()
+
+    def update_throw_status(self):
         # todo update balls on court
         self.lcdNumber_home_ballsoncourt.display(str(self.g.currentFrame.numThrowsTeamHome))
         self.lcdNumber_away_ballsoncourt.display(str(self.g.currentFrame.numThrowsTeamAway))
 
         # set closest to pallino check
-        check = cv2.imread('views/ui/check_gray.png', cv2.IMREAD_UNCHANGED)
-        check = cv2.resize(check, (25, 25))
-        height, width, channel = check.shape
-        bytesPerLine = 4 * width
-        qImg = QImage(check.data, width, height, bytesPerLine, QImage.Format_RGBA8888)
+        check = self.assets.get_pixmap(CHECK_GRAY, size=(25, 25))
 
         if self.g.currentFrame.whoseIn == self.g.teamHome:
-            self.label_home_closesttopallino_check.setPixmap(QPixmap(qImg))
-            self.label_home_closesttopallino_check.repaint()
+            self.label_home_closesttopallino_check.setPixmap(check)
             self.label_away_closesttopallino_check.clear()
 
         elif self.g.currentFrame.whoseIn == self.g.teamAway:
-            self.label_away_closesttopallino_check.setPixmap(QPixmap(qImg))
-            self.label_away_closesttopallino_check.repaint()
+            self.label_away_closesttopallino_check.setPixmap(check)
             self.label_home_closesttopallino_check.clear()
 
 
@@ -710,35 +973,23 @@ class MainWindow(QtWidgets.QMainWindow):
         self.lcdNumber_game_score_teamAway.display(str(self.g.teamAwayScore))
 
     def set_frame_winner_check(self, frameWinnerTeam):
-        check = cv2.imread('views/ui/check_gray.png', cv2.IMREAD_UNCHANGED)
-        check = cv2.resize(check, (50, 50))
-        height, width, channel = check.shape
-        bytesPerLine = 4 * width
-        qImg = QImage(check.data, width, height, bytesPerLine, QImage.Format_RGBA8888)
+        check = self.assets.get_pixmap(CHECK_GRAY, size=(50, 50))
 
         if frameWinnerTeam == self.g.teamHome:
-            self.label_frame_check_home.setPixmap(QPixmap(qImg))
-            self.label_frame_check_home.repaint()
+            self.label_frame_check_home.setPixmap(check)
             self.label_frame_check_away.clear()
         elif frameWinnerTeam == self.g.teamAway:
-            self.label_frame_check_away.setPixmap(QPixmap(qImg))
-            self.label_frame_check_away.repaint()
+            self.label_frame_check_away.setPixmap(check)
             self.label_frame_check_home.clear()
 
     def set_game_winner_check(self, gameWinnerTeam):
-        check = cv2.imread('views/ui/obie.png', cv2.IMREAD_UNCHANGED)
-        check = cv2.resize(check, (50, 50))
-        height, width, channel = check.shape
-        bytesPerLine = 4 * width
-        qImg = QImage(check.data, width, height, bytesPerLine, QImage.Format_RGBA8888)
+        check = self.assets.get_pixmap(OBIE, size=(50, 50))
 
         if gameWinnerTeam == self.g.teamHome:
-            self.label_game_check_home.setPixmap(QPixmap(qImg))
-            self.label_game_check_home.repaint()
+            self.label_game_check_home.setPixmap(check)
             self.label_game_check_away.clear()
         elif gameWinnerTeam == self.g.teamAway:
-            self.label_game_check_away.setPixmap(QPixmap(qImg))
-            self.label_game_check_away.repaint()
+            self.label_game_check_away.setPixmap(check)
             self.label_game_check_home.clear()
 
     def time_tick(self):
@@ -785,29 +1036,35 @@ class MainWindow(QtWidgets.QMainWindow):
         self.annotation_balltrails = ABallTrails()
         self.annotation_venue = AVenue()
         self.annotation_vectors = AVectors()
+        self.compositor = Compositor()
 
-    def annotation_pipeline(self, frame):
+    def annotation_layers(self):
+        # collect the annotation layers (and their inputs) in drawing order;
+        # this runs on the GUI thread and copies the game state it needs,
+        # so the render thread never reads it while a throw updates it
+        layers = []
         if self.g is None:
             score = None
         else:
             score = (self.g.teamHomeScore, self.g.teamAwayScore)
-            frame = self.annotation_score.annotate(frame, score=score)
+            layers.append((self.annotation_score, {"score": score}))
 
             if self.g.currentFrame is None:
                 pass
             else:
-                frame = self.annotation_vectors.annotate(frame,
-                                                         pallino=self.g.currentFrame.pallino,
-                                                         homeBalls=self.g.teamHome.balls,
-                                                         awayBalls=self.g.teamAway.balls)
-                frame = self.annotation_time.annotate(frame)
-                frame = self.annotation_balltrails.annotate(frame)
-
-        frame = self.annotation_team.annotate(frame)
-        frame = self.annotation_player.annotate(frame)
-        frame = self.annotation_venue.annotate(frame)
-
-        return frame
+                # the balls are found in the (rectified) court image, so
+                # draw them where they are in the camera frame
+                layers.append((self.annotation_vectors, {
+                    "pallino": in_frame(self.g.currentFrame.pallino),
+                    "homeBalls": [in_frame(b) for b in self.g.teamHome.balls],
+                    "awayBalls": [in_frame(b) for b in self.g.teamAway.balls]}))
+                layers.append((self.annotation_time, {}))
+                layers.append((self.annotation_balltrails, {}))
+
+        layers.append((self.annotation_team, {}))
+        layers.append((self.annotation_player, {}))
+        layers.append((self.annotation_venue, {}))
+        return layers
 
     def annotation_change(self, annotation, annotation_checkbox):
         if annotation_checkbox.isChecked():
@@ -0,0 +1,92 @@
+# imports
+import time
+import math
+import cv2
+import numpy as np
+
+
+class CameraWall():
+    """
+    Tiles the thumbnails of several cameras into one image. It looks like a
+    camera to the render thread (frameSequence and last_frame), so it can be
+    displayed in place of a single camera. A tile is only redrawn when its
+    camera has a new frame and the tile's refresh interval has passed; a new
+    frame that isn't due yet leaves the tile dirty until it is.
+    """
+    def __init__(self, cameras, tileSize=(200, 150), columns=3,
+        refreshInterval=100):
+        # cameras is a list of (label, camera)
+        self.cameras = cameras
+        self.tileSize = tileSize
+        self.columns = columns
+
+        # per tile refresh intervals in milliseconds
+        self.refreshIntervals = [refreshInterval] * len(cameras)
+        self.lastSequences = [None] * len(cameras)
+        self.lastUpdates = [0] * len(cameras)
+
+        # incremented whenever a tile is redrawn
+        self.sequence = 0
+
+        # preallocate the wall
+        (tW, tH) = tileSize
+        rows = max(int(math.ceil(len(cameras) / float(columns))), 1)
+        self.canvas = np.zeros((rows * tH, columns * tW, 3), dtype="uint8")
+
+    @property
+    def frameSequence(self):
+        # draw the tiles which are due; this only changes when one was
+        self.compose()
+        return self.sequence
+
+    @property
+    def last_frame(self):
+        return self.canvas
+
+    def set_refresh_interval(self, index, interval):
+        self.refreshIntervals[index] = interval
+
+    def compose(self):
+        now = time.time()
+        (tW, tH) = self.tileSize
+        for (i, (label, camera)) in enumerate(self.cameras):
+            # skip tiles without a new frame, and leave the ones which aren't
+            # due yet dirty (their sequence isn't recorded)
+            sequence = camera.frameSequence
+            if sequence == self.lastSequences[i]:
+                continue
+            if (now - self.lastUpdates[i]) * 1000 < self.refreshIntervals[i]:
+                continue
+
+            # the thumbnail is only made now, i.e. while the wall is shown
+            thumbnail = getattr(camera, "last_thumbnail", None)
+            if thumbnail is None:
+                continue
+
+            # the thumbnail width matches the tile, so this resize only
+            # happens if the aspect ratio doesn't
+            if thumbnail.shape[:2] != (tH, tW):
+                thumbnail = cv2.resize(thumbnail, (tW, tH),
+                    interpolation=cv2.INTER_AREA)
+
+            # draw the tile and its label
+            (x, y) = ((i % self.columns) * tW, (i // self.columns) * tH)
+            tile = self.canvas[y:y + tH, x:x + tW]
+            tile[...] = thumbnail
+            cv2.putText(tile, label, (5, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                (255, 255, 255), 1)
+
+            self.lastSequences[i] = sequence
+            self.lastUpdates[i] = now
+            self.sequence += 1
+
+        return self.canvas
+
+    def tile_at(self, x, y):
+        # return the index of the tile at (x, y) on the wall (if any)
+        (tW, tH) = self.tileSize
+        (col, row) = (int(x // tW), int(y // tH))
+        if col < 0 or col >= self.columns or row < 0:
+            return None
+        index = row * self.columns + col
+        return index if index < len(self.cameras) else None